@@ -0,0 +1,301 @@
+import io
+import os
+import re
+import sys
+import glob
+import contextlib
+from atomic_file import locked, atomic_open, locked_append
+
+# Example of how to run file
+# python3 atcf_archive.py -archive /data/atcf -pack /data/flat      (pack the A/B-decks of a directory)
+# python3 atcf_archive.py -archive /data/atcf -list [-season WP2024]
+# python3 atcf_archive.py -archive /data/atcf -cat AWP052024.jma
+# python3 atcf_archive.py -archive /data/atcf -export /data/flat [-season WP2024]
+# python3 atcf_archive.py -archive /data/atcf -compact [-season WP2024]
+# Packed season archives of the per-storm output files.
+# Every decoder writes one file per storm and source (A<atcfid>.jma, .nffn,
+# .dems, .DAT, <atcfid>_message.sql ...), so a season is thousands of small
+# files. With ATCF_ARCHIVE set to a directory, each of those files becomes
+# a stream of one archive per basin and season, <basin><year>.pak, named by
+# the file name it would have had. An archive is a run of chunks, each a
+# "@<op> <stream> <length>" header line and the data: op W holds the whole
+# stream, op A data appended to it. Appends and rewrites add a chunk at the
+# end, under the archive lock. A sidecar <basin><year>.pak.idx lists the
+# chunks so a stream is read with a seek per chunk; it is rebuilt from the
+# chunk headers when it is older than the archive. compact drops the
+# chunks a later rewrite replaced, and export writes the streams back out
+# as the per-file layout.
+# Example of how to use
+#   archive = archive_for('AWP052024.jma')   # None when ATCF_ARCHIVE is not set
+#   archive.append('AWP052024.jma', ''.join(lines))
+#   text = archive.read('AWP052024.jma')
+
+# Constants
+ARCHIVE_ENV = 'ATCF_ARCHIVE'  # Directory of the season archives, unset for one file per storm and source
+ARCHIVE_SUFFIX = '.pak'
+ARCHIVE_INDEX_SUFFIX = '.idx'
+WHOLE = 'W'  # Chunk holding the whole stream
+APPEND = 'A'  # Chunk appended to the stream
+STORM_PATTERN = re.compile(r'([A-Z]{2})(\d{2})(\d{4})')  # ATCF ID in a file name, e.g. WP052024
+DECK_PATTERN = re.compile(r'[AB][A-Z]{2}\d{6}\.[A-Za-z]+')  # A/B-deck file name, e.g. AWP052024.dat, not its sidecars
+
+
+def stream_name(path):
+    """Stream of a per-storm output file, its file name"""
+    return os.path.basename(path)
+
+
+def season_of(path):
+    """Season archive name, <basin><year>, of a per-storm file name, None for a file of no storm"""
+    match = STORM_PATTERN.search(stream_name(path))
+    return f"{match.group(1)}{match.group(3)}" if match else None
+
+
+def archive_for(path, directory=None):
+    """SeasonArchive that holds path when the archive backend is on, else None"""
+    directory = directory or os.environ.get(ARCHIVE_ENV)
+    season = season_of(path)
+    if not directory or season is None:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    return SeasonArchive(os.path.join(directory, season + ARCHIVE_SUFFIX))
+
+
+@contextlib.contextmanager
+def output_open(path):
+    """File to write the whole of path to, the stream of its season archive when the archive backend is on"""
+    archive = archive_for(path)
+    if archive is None:
+        with atomic_open(path) as f:
+            yield f
+        return
+    buffer = io.StringIO()
+    yield buffer
+    archive.write(stream_name(path), buffer.getvalue())
+
+
+class SeasonArchive:
+    """Streams of the per-storm files of one basin and season, packed in one appendable file"""
+    def __init__(self, path):
+        self.path = path
+        self.idxfile = path + ARCHIVE_INDEX_SUFFIX
+        self.chunks = []  # (op, stream, data offset, length) in file order
+        self.idxsize = 0  # Bytes of the sidecar the chunk list was read from
+        self.load()
+
+    def is_stale(self):
+        """True when the sidecar is missing or older than the archive"""
+        if not os.path.exists(self.path):
+            return False
+        return not os.path.exists(self.idxfile) or os.path.getmtime(self.path) > os.path.getmtime(self.idxfile)
+
+    def load(self, lock=True):
+        """Read the chunk list from the sidecar, rebuilding it first when it is out of date.
+
+        lock=False when the caller already holds the lock of the archive.
+        """
+        if self.is_stale():
+            # Under the archive lock, so no chunk is half written while the headers are walked
+            with locked(self.path, shared=True) if lock else contextlib.nullcontext():
+                # A writer between its chunk and its sidecar line looks the same until it is done
+                if self.is_stale():
+                    self.rebuild()
+                    return
+        self.chunks = []
+        self.idxsize = 0
+        if os.path.exists(self.idxfile):
+            with open(self.idxfile, 'rb') as f:
+                for line in f:
+                    self.idxsize += len(line)
+                    parts = line.decode('utf-8', 'replace').split()
+                    if len(parts) == 4:
+                        self.chunks.append((parts[0], parts[1], int(parts[2]), int(parts[3])))
+
+    def rebuild(self):
+        """Walk the chunk headers of the archive and rewrite the sidecar"""
+        self.chunks = []
+        with open(self.path, 'rb') as f:
+            end = f.seek(0, 2)
+            pos = f.seek(0)
+            while pos < end:
+                header = f.readline().decode('utf-8', 'replace').split()
+                offset = f.tell()
+                if len(header) != 3 or not header[0].startswith('@'):
+                    print(f"*Caution* bad chunk header at byte {pos} of {self.path}, ignoring the rest")
+                    break
+                length = int(header[2])
+                if offset + length > end:
+                    print(f"*Caution* {self.path} ends inside a chunk of {header[1]}")
+                    break
+                self.chunks.append((header[0][1:], header[1], offset, length))
+                pos = f.seek(offset + length)
+        text = ''.join(f"{op} {stream} {offset} {length}\n" for op, stream, offset, length in self.chunks)
+        with atomic_open(self.idxfile) as f:
+            f.write(text)
+        self.idxsize = len(text.encode('utf-8'))
+        print(f"Rebuilt archive index {self.idxfile}: {len(self.chunks)} chunks")
+
+    def add_chunk(self, op, stream, data, lock=True):
+        """Add a chunk at the end of the archive and to the sidecar; lock=False when the caller holds the lock"""
+        data = data.encode('utf-8')
+        with locked(self.path) if lock else contextlib.nullcontext():
+            # Pick up the chunks other writers added since this archive was loaded
+            if self.is_stale() or os.path.exists(self.idxfile) and os.path.getsize(self.idxfile) != self.idxsize:
+                self.load(lock=False)
+            with open(self.path, 'ab') as f:
+                f.write(f"@{op} {stream} {len(data)}\n".encode('utf-8'))
+                offset = f.tell()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            entry = f"{op} {stream} {offset} {len(data)}\n"
+            with locked_append(self.idxfile) as f:
+                f.write(entry)
+            self.idxsize += len(entry.encode('utf-8'))
+            self.chunks.append((op, stream, offset, len(data)))
+
+    def append(self, stream, text, lock=True):
+        """Append text to a stream"""
+        self.add_chunk(APPEND, stream, text, lock)
+
+    def write(self, stream, text, lock=True):
+        """Replace the whole of a stream with text"""
+        self.add_chunk(WHOLE, stream, text, lock)
+
+    def stream_chunks(self, stream):
+        """Chunks making up the current contents of a stream, from its last whole chunk on"""
+        chunks = [chunk for chunk in self.chunks if chunk[1] == stream]
+        whole = [i for i, chunk in enumerate(chunks) if chunk[0] == WHOLE]
+        return chunks[whole[-1]:] if whole else chunks
+
+    def read_chunks(self, chunks):
+        if not chunks:
+            return ''
+        data = []
+        with open(self.path, 'rb') as f:
+            for _, _, offset, length in chunks:
+                f.seek(offset)
+                data.append(f.read(length))
+        return b''.join(data).decode('utf-8', 'replace')
+
+    def read(self, stream):
+        """Contents of a stream, '' when the archive does not have it"""
+        return self.read_chunks(self.stream_chunks(stream))
+
+    def tail(self, stream):
+        """Text of the last non-empty chunk of a stream, '' when it has none"""
+        for chunk in reversed(self.stream_chunks(stream)):
+            if chunk[3]:
+                return self.read_chunks([chunk])
+        return ''
+
+    def streams(self):
+        """Names of the streams in the archive, sorted"""
+        return sorted(set(stream for _, stream, _, _ in self.chunks))
+
+    def __contains__(self, stream):
+        return any(chunk[1] == stream for chunk in self.chunks)
+
+    def compact(self):
+        """Rewrite the archive with one whole chunk per stream, dropping replaced chunks"""
+        with locked(self.path):
+            self.load(lock=False)
+            streams = [(stream, self.read(stream).encode('utf-8')) for stream in self.streams()]
+            with atomic_open(self.path, 'wb', lock=False) as f:
+                for stream, data in streams:
+                    f.write(f"@{WHOLE} {stream} {len(data)}\n".encode('utf-8'))
+                    f.write(data)
+            before = len(self.chunks)
+            self.rebuild()
+        print(f"Compacted {self.path}: {before} chunks to {len(self.chunks)}")
+
+    def export(self, directory, streams=None):
+        """Write streams, or every stream, out as files of the per-file layout in directory"""
+        for stream in streams or self.streams():
+            with atomic_open(os.path.join(directory, stream)) as f:
+                f.write(self.read(stream))
+        print(f"Exported {len(streams or self.streams())} streams of {self.path} to {directory}")
+
+
+def season_archives(directory, season=None):
+    """SeasonArchives in directory, or the one of season"""
+    pattern = (season or '*') + ARCHIVE_SUFFIX
+    return [SeasonArchive(path) for path in sorted(glob.glob(os.path.join(directory, pattern)))]
+
+
+def pack_files(directory, paths):
+    """Write the A/B-decks of paths into the archives in directory, each as the whole of its stream"""
+    packed = 0
+    for path in paths:
+        # The .idx and .dtg sidecars of a deck are not streams
+        if not DECK_PATTERN.fullmatch(stream_name(path)):
+            continue
+        archive = archive_for(path, directory)
+        if archive is None:
+            continue
+        with open(path, 'r') as f:
+            archive.write(stream_name(path), f.read())
+        packed += 1
+    print(f"Packed {packed} files into {directory}")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python atcf_archive.py -archive <dir> [-pack <dir>] [-list] [-cat <stream>] "
+              "[-export <dir>] [-compact] [-season <basin><year>]")
+        return
+
+    # Parse command line arguments
+    directory = os.environ.get(ARCHIVE_ENV, '')
+    pack = ''
+    export = ''
+    cat = ''
+    season = None
+    listing = False
+    compact = False
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "-archive":
+            i += 1
+            directory = sys.argv[i]
+        elif sys.argv[i] == "-pack":
+            i += 1
+            pack = sys.argv[i]
+        elif sys.argv[i] == "-export":
+            i += 1
+            export = sys.argv[i]
+        elif sys.argv[i] == "-cat":
+            i += 1
+            cat = sys.argv[i]
+        elif sys.argv[i] == "-season":
+            i += 1
+            season = sys.argv[i]
+        elif sys.argv[i] == "-list":
+            listing = True
+        elif sys.argv[i] == "-compact":
+            compact = True
+        i += 1
+
+    if not directory:
+        print("*Error* no archive directory given")
+        return
+    if pack:
+        pack_files(directory, sorted(glob.glob(os.path.join(pack, '*'))))
+    if cat:
+        archive = archive_for(cat, directory)
+        if archive is None or cat not in archive:
+            print(f"*Error* {cat} is not in the archives of {directory}")
+            return
+        sys.stdout.write(archive.read(cat))
+    for archive in season_archives(directory, season):
+        if listing:
+            for stream in archive.streams():
+                print(f"{os.path.basename(archive.path)} {stream}")
+        if compact:
+            archive.compact()
+        if export:
+            archive.export(export)
+
+if __name__ == "__main__":
+    main()
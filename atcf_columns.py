@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import numpy as np
+from atcf_record import TRACK_DTYPE
+from atcf_reader import read_atcf_records
+from atcf_time import dtg_to_hours, hours_to_dtgs
+from atomic_file import locked, atomic_open
+
+# Example of how to run file
+# python3 atcf_columns.py -columns /data/columns -add AWP052024.dat AWP062024.dat   (load A-decks)
+# python3 atcf_columns.py -columns /data/columns -list
+# python3 atcf_columns.py -columns /data/columns -season WP2024 [-tech ECM] [-vmax 64]
+# Binary columnar store of the decoded track points of a season.
+# With ATCF_COLUMNS set to a directory, write_forecast (and dc_ecwmf for its
+# deterministic and ensemble runs) also appends every forecast it writes
+# to <dir>/<basin><year>/, one row per track point:
+#   record, dtg (hours since the atcf_time epoch), cynum, technum, tau, lat,
+#   lon, vmax, mslp, mrd, radii (rows, 3, 4), and the dictionary codes of
+#   basin, tech, stormname and ty.
+# Each column is a .npy file that np.load(..., mmap_mode='r') maps without
+# reading, so a scan of a season is a vector filter over the columns. The
+# manifest.json holds the row and record counts and the dictionaries, and is
+# written last: a reader uses the first manifest rows of each column, so an
+# append that did not finish is never seen, and the next append writes
+# over it. The .npy headers are a fixed HEADER_SIZE bytes, so an append
+# only rewrites the shape in place. keys.npy has one row per record, its
+# (dtg, basin, cynum, technum, tech): a forecast already in the store is
+# skipped, so a rerun of a decoder or of -add adds nothing. Decoders that
+# write only text lines (dc_jmv, dc_abom, dc_abombest) are loaded from their
+# A-decks with -add.
+# Example of how to use
+#   season = SeasonColumns('/data/columns/WP2024')
+#   cols = season.columns()
+#   strong = (cols['vmax'] >= 64) & (cols['tech'] == season.code('tech', 'ECM'))
+#   print(season.decode('stormname', cols['stormname'][strong]), cols['lat'][strong])
+
+# Constants
+COLUMNS_ENV = 'ATCF_COLUMNS'  # Directory of the season column stores, unset for none
+MANIFEST = 'manifest.json'
+KEYS = 'keys'  # Record level column of the forecast keys, one int64 per KEY_COLUMNS
+KEY_COLUMNS = ('dtg', 'basin', 'cynum', 'technum', 'tech')
+HEADER_SIZE = 128  # Bytes of every .npy header, room for the shape to grow
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+DICTIONARY_COLUMNS = ('basin', 'tech', 'stormname', 'ty')
+COLUMNS = {
+    'record': (np.int64, ()),
+    'dtg': (np.int64, ()),
+    'basin': (np.int16, ()),
+    'cynum': (np.int16, ()),
+    'technum': (np.int16, ()),
+    'tech': (np.int32, ()),
+    'stormname': (np.int32, ()),
+    'tau': (np.int32, ()),
+    'lat': (np.float64, ()),
+    'lon': (np.float64, ()),
+    'vmax': (np.float64, ()),
+    'mslp': (np.float64, ()),
+    'mrd': (np.float64, ()),
+    'ty': (np.int16, ()),
+    'radii': (np.int16, TRACK_DTYPE['radii'].shape),
+}
+
+
+def npy_header(dtype, shape):
+    """Version 1.0 .npy header of HEADER_SIZE bytes"""
+    header = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False,
+                   'shape': tuple(shape)})
+    header = header.ljust(HEADER_SIZE - len(NPY_MAGIC) - 3) + '\n'
+    return NPY_MAGIC + len(header).to_bytes(2, 'little') + header.encode('latin-1')
+
+
+def season_name(fcst):
+    """Store of a forecast, <basin><year> of its DTG"""
+    return f"{fcst.basin.strip()}{str(fcst.DTG).strip()[:4]}"
+
+
+class SeasonColumns:
+    """Track points of one basin and season as memory-mapped .npy columns"""
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_file = os.path.join(directory, MANIFEST)
+        self.load()
+
+    def load(self):
+        """Read the row count and dictionaries of the manifest"""
+        self.rows = 0
+        self.records = 0
+        self.dictionaries = {name: [] for name in DICTIONARY_COLUMNS}
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file, 'r') as f:
+                manifest = json.load(f)
+            self.rows = manifest['rows']
+            self.records = manifest['records']
+            self.dictionaries.update(manifest['dictionaries'])
+        self.lookup = {name: {value: i for i, value in enumerate(values)} for name, values in self.dictionaries.items()}
+
+    def column_file(self, name):
+        return os.path.join(self.directory, name + '.npy')
+
+    def code(self, column, value):
+        """Dictionary code of a value, -1 when the store has none"""
+        return self.lookup[column].get(value, -1)
+
+    def encode(self, column, values):
+        """Dictionary codes of values, adding the new ones to the dictionary"""
+        lookup = self.lookup[column]
+        for value in dict.fromkeys(values):
+            if value not in lookup:
+                lookup[value] = len(self.dictionaries[column])
+                self.dictionaries[column].append(value)
+        return np.array([lookup[value] for value in values], dtype=COLUMNS[column][0])
+
+    def decode(self, column, codes):
+        """Values of dictionary codes"""
+        return np.asarray(self.dictionaries[column] or [''], dtype=object)[np.asarray(codes)]
+
+    def record_keys(self):
+        """Keys of the manifest records, memory-mapped, rebuilt from the row columns for a store without them"""
+        if not self.records:
+            return np.zeros((0, len(KEY_COLUMNS)), dtype=np.int64)
+        if self.has_keys():
+            return np.load(self.column_file(KEYS), mmap_mode='r')[:self.records]
+        record = self.column('record')
+        first = np.flatnonzero(np.r_[True, record[1:] != record[:-1]])
+        return np.column_stack([self.column(name)[first].astype(np.int64) for name in KEY_COLUMNS])
+
+    def has_keys(self):
+        """True when keys.npy holds the keys of every manifest record"""
+        return os.path.exists(self.column_file(KEYS)) and \
+            len(np.load(self.column_file(KEYS), mmap_mode='r')) >= self.records
+
+    def forecast_keys(self, fcsts):
+        """Keys of forecast records, adding their basins and techs to the dictionaries"""
+        return np.column_stack([[dtg_to_hours(str(fcst.DTG).strip()) for fcst in fcsts],
+                                self.encode('basin', [fcst.basin.strip() for fcst in fcsts]),
+                                [int(fcst.cyNum) for fcst in fcsts],
+                                [int(fcst.technum or 0) for fcst in fcsts],
+                                self.encode('tech', [fcst.tech.strip() for fcst in fcsts])]).astype(np.int64)
+
+    def append(self, fcsts):
+        """Append the track points of forecast records not already in the store, returning the rows added"""
+        fcsts = [fcst for fcst in fcsts if len(fcst.track)]
+        if not fcsts:
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        with locked(self.manifest_file):
+            self.load()  # Rows and codes another writer added
+            # Skip the forecasts the store has, and the repeats of the batch
+            stored = self.record_keys()
+            seen = set(map(tuple, stored.tolist()))
+            keys = self.forecast_keys(fcsts)
+            new = []
+            for i, key in enumerate(map(tuple, keys.tolist())):
+                if key not in seen:
+                    seen.add(key)
+                    new.append(i)
+            if not new:
+                return 0
+            fcsts = [fcsts[i] for i in new]
+            keys = keys[new]
+            data = np.concatenate([fcst.track.data for fcst in fcsts])
+            counts = [len(fcst.track) for fcst in fcsts]
+            owner = np.repeat(np.arange(len(fcsts)), counts)
+            columns = {name: keys[owner, i] for i, name in enumerate(KEY_COLUMNS)}
+            columns.update({
+                'record': self.records + owner,
+                'stormname': self.encode('stormname', [fcst.stormname.strip() for fcst in fcsts])[owner],
+                'ty': self.encode('ty', [ty.strip() for ty in data['ty'].tolist()]),
+            })
+            for name in ('tau', 'lat', 'lon', 'vmax', 'mslp', 'mrd', 'radii'):
+                columns[name] = data[name]
+            if not self.has_keys():
+                # A store from before the keys column: write the keys of its records first
+                self.append_column(KEYS, stored, np.int64, (len(KEY_COLUMNS),), 0, self.records)
+            self.append_column(KEYS, keys, np.int64, (len(KEY_COLUMNS),), self.records, self.records + len(fcsts))
+            rows = self.rows + len(data)
+            for name, (dtype, shape) in COLUMNS.items():
+                self.append_column(name, columns[name], dtype, shape, self.rows, rows)
+            self.records += len(fcsts)
+            self.rows = rows
+            manifest = {'rows': self.rows, 'records': self.records, 'dictionaries': self.dictionaries,
+                        'columns': {name: [np.dtype(dtype).str, list(shape)] for name, (dtype, shape) in COLUMNS.items()}}
+            with atomic_open(self.manifest_file, lock=False) as f:
+                json.dump(manifest, f)
+        return len(data)
+
+    def append_column(self, name, values, dtype, shape, start, rows):
+        """Write values after the first start rows of a column, then set its shape to rows"""
+        path = self.column_file(name)
+        itemsize = np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64))
+        values = np.ascontiguousarray(values, dtype=dtype)
+        with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+            # The header never claims more rows than the file holds, so a mapped read always fits
+            f.write(npy_header(dtype, (start,) + shape))
+            f.truncate(HEADER_SIZE + start * itemsize)
+            f.seek(0, 2)
+            f.write(values.tobytes())
+            f.flush()
+            f.seek(0)
+            f.write(npy_header(dtype, (rows,) + shape))
+
+    def column(self, name):
+        """Column of the manifest rows, memory-mapped"""
+        dtype, shape = COLUMNS[name]
+        if not self.rows:
+            return np.zeros((0,) + shape, dtype=dtype)
+        return np.load(self.column_file(name), mmap_mode='r')[:self.rows]
+
+    def columns(self, names=None):
+        """Dictionary of memory-mapped columns, every column unless names"""
+        return {name: self.column(name) for name in names or COLUMNS}
+
+    def __len__(self):
+        return self.rows
+
+
+def season_columns(directory):
+    """SeasonColumns under directory, sorted by season"""
+    if not os.path.isdir(directory):
+        return []
+    return [SeasonColumns(os.path.join(directory, name)) for name in sorted(os.listdir(directory))
+            if os.path.exists(os.path.join(directory, name, MANIFEST))]
+
+
+def append_forecasts(fcsts, directory=None):
+    """Append forecast records to their season stores when ATCF_COLUMNS is set, returning the rows added"""
+    directory = directory or os.environ.get(COLUMNS_ENV)
+    if not directory:
+        return 0
+    seasons = {}
+    for fcst in fcsts:
+        seasons.setdefault(season_name(fcst), []).append(fcst)
+    added = 0
+    for season, records in seasons.items():
+        try:
+            added += SeasonColumns(os.path.join(directory, season)).append(records)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"*Caution* could not add {len(records)} forecasts to the {season} columns: {e}")
+    return added
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python atcf_columns.py -columns <dir> [-add <A-deck> ...] [-list] "
+              "[-season <basin><year> [-tech <tech>] [-vmax <kt>]]")
+        return
+
+    # Parse command line arguments
+    directory = os.environ.get(COLUMNS_ENV, '')
+    adecks = []
+    season = None
+    tech = None
+    vmax = None
+    listing = False
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "-columns":
+            i += 1
+            directory = sys.argv[i]
+        elif sys.argv[i] == "-add":
+            while i + 1 < len(sys.argv) and not sys.argv[i + 1].startswith('-'):
+                i += 1
+                adecks.append(sys.argv[i])
+        elif sys.argv[i] == "-season":
+            i += 1
+            season = sys.argv[i]
+        elif sys.argv[i] == "-tech":
+            i += 1
+            tech = sys.argv[i]
+        elif sys.argv[i] == "-vmax":
+            i += 1
+            vmax = float(sys.argv[i])
+        elif sys.argv[i] == "-list":
+            listing = True
+        i += 1
+
+    if not directory:
+        print("*Error* no column store directory given")
+        return
+    for atfile in adecks:
+        if not os.path.exists(atfile):
+            print(f"*Error* {atfile} does not exist!")
+            continue
+        print(f"Added {append_forecasts(list(read_atcf_records(atfile)), directory)} track points of {atfile}")
+    if listing:
+        for store in season_columns(directory):
+            print(f"{os.path.basename(store.directory)} {store.records} forecasts {store.rows} track points")
+    if season:
+        store = SeasonColumns(os.path.join(directory, season))
+        cols = store.columns()
+        keep = np.ones(len(store), dtype=bool)
+        if tech:
+            keep &= cols['tech'] == store.code('tech', tech)
+        if vmax is not None:
+            keep &= cols['vmax'] >= vmax
+        rows = np.flatnonzero(keep)
+        dtgs = hours_to_dtgs(cols['dtg'][rows])
+        techs = store.decode('tech', cols['tech'][rows])
+        names = store.decode('stormname', cols['stormname'][rows])
+        for j, row in enumerate(rows.tolist()):
+            print(f"{dtgs[j]} {techs[j]:>4s} {cols['tau'][row]:3d} {cols['lat'][row]:6.1f} {cols['lon'][row]:6.1f} "
+                  f"{cols['vmax'][row]:4.0f} {cols['mslp'][row]:5.0f} {names[j]}")
+        print(f"{len(rows)} of {len(store)} track points")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import os
+import sys
+import time
+import queue
+import threading
+from multiprocessing.connection import Listener, Client
+from atcf_writer import update_adeck, forecast_lines
+from atcf_index import ForecastIndex
+from atcf_columns import append_forecasts
+from atcf_ndjson import emit_forecasts, program_name, claim_stdout
+
+# Example of how to run file
+# python3 atcf_coordinator.py -socket /tmp/atcf_writer.sock [-window 2.0]
+# export ATCF_COORDINATOR=/tmp/atcf_writer.sock   (decoders then send it their forecasts)
+# python3 atcf_coordinator.py -socket /tmp/atcf_writer.sock -stop
+# Single writer of every A-deck. Decoders hand it their forecasts instead of
+# writing them, and everything that arrives for a storm within the window is
+# written to its A-deck in one update, so a burst of bulletins for one storm
+# costs one write (or one merge-rewrite) rather than one per bulletin.
+# The forecasts a batch writes, and only those, then go to the column store
+# and the NDJSON sink, so neither gets a forecast the A-deck already had.
+# A decoder's send is acknowledged once the forecast is in the inbox, not
+# when it is written.
+# Within one program the coordinator can also be fed by a multiprocessing queue:
+#   inbox = multiprocessing.Queue()
+#   writer = multiprocessing.Process(target=run_coordinator, args=(inbox, 2.0))
+#   writer.start()
+#   inbox.put((atfile, fcst.tech, fcst.DTG, forecast_lines(fcst), fcst, 'dc_nffn'))
+#   inbox.put(None)
+#   writer.join()
+
+# Constants
+COORDINATOR_ENV = 'ATCF_COORDINATOR'  # Socket of the running coordinator
+DEFAULT_WINDOW = 2.0  # Seconds a storm's forecasts are held before they are written
+AUTHKEY = b'atcf-writer'
+
+
+class PendingStorm:
+    """Forecasts of one A-deck waiting for the end of its window"""
+    def __init__(self):
+        self.first = time.monotonic()
+        self.forecasts = {}  # (tech, DTG) -> (A-deck lines, ForecastRecord or None, source)
+
+
+class WriterCoordinator:
+    """Batches the forecasts arriving in its inbox per A-deck and writes each batch once"""
+    def __init__(self, inbox=None, window=DEFAULT_WINDOW):
+        self.inbox = inbox if inbox is not None else queue.Queue()
+        self.window = window
+        self.pending = {}
+        self.received = 0
+        self.writes = 0
+
+    def add(self, atfile, tech, dtg, lines, fcst=None, source=None):
+        """Hold a forecast for its A-deck, a resent forecast replaces the earlier copy"""
+        storm = self.pending.setdefault(atfile, PendingStorm())
+        storm.forecasts[(tech, dtg)] = (lines, fcst, source)
+        self.received += 1
+
+    def flush(self, atfile):
+        """Write the held forecasts of one A-deck that it does not already have, in one update, then to the sinks"""
+        storm = self.pending.pop(atfile)
+        index = ForecastIndex(atfile)
+        keys = [key for key in storm.forecasts if not index.contains(*key)]
+        lines = [line for key in keys for line in storm.forecasts[key][0]]
+        if lines:
+            update_adeck(atfile, lines)
+            self.writes += 1
+            for tech, dtg in keys:
+                index.add(tech, dtg)
+            written = [storm.forecasts[key] for key in keys if storm.forecasts[key][1] is not None]
+            append_forecasts([fcst for _, fcst, _ in written])
+            for source in dict.fromkeys(source for _, _, source in written):
+                emit_forecasts([fcst for _, fcst, name in written if name == source], source)
+        print(f"Wrote {len(keys)} of {len(storm.forecasts)} forecasts to {atfile}")
+
+    def flush_due(self, force=False):
+        """Write every A-deck whose window has closed, or all of them when force"""
+        now = time.monotonic()
+        for atfile in [atfile for atfile, storm in self.pending.items()
+                       if force or now - storm.first >= self.window]:
+            self.flush(atfile)
+
+    def next_timeout(self):
+        """Seconds until the first window closes, None with nothing held"""
+        if not self.pending:
+            return None
+        first = min(storm.first for storm in self.pending.values())
+        return max(0.0, first + self.window - time.monotonic())
+
+    def run(self):
+        """Take forecasts from the inbox until a None arrives, then write what is still held"""
+        while True:
+            try:
+                message = self.inbox.get(timeout=self.next_timeout())
+            except queue.Empty:
+                self.flush_due()
+                continue
+            if message is None:
+                break
+            self.add(*message)
+            self.flush_due()
+        self.flush_due(force=True)
+        print(f"Writer coordinator: {self.received} forecasts received, {self.writes} A-deck writes")
+
+    def serve(self, address):
+        """Accept forecasts from decoders on a local socket until one sends stop"""
+        if os.path.exists(address):
+            os.remove(address)  # Left over from a coordinator that did not shut down
+        listener = Listener(address, authkey=AUTHKEY)
+        threading.Thread(target=self.accept_loop, args=(listener,), daemon=True).start()
+        print(f"Writer coordinator on {address}, window {self.window} s")
+        try:
+            self.run()
+        finally:
+            listener.close()
+
+    def accept_loop(self, listener):
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.receive, args=(conn,), daemon=True).start()
+
+    def receive(self, conn):
+        """Move the messages of one decoder connection to the inbox, acknowledging each"""
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                self.inbox.put(None if message == 'stop' else message)
+                conn.send('ok')
+
+
+def run_coordinator(inbox, window=DEFAULT_WINDOW):
+    """Process target running a coordinator fed by a multiprocessing queue"""
+    WriterCoordinator(inbox, window).run()
+
+
+def send_messages(address, messages):
+    """Send messages to the coordinator at address, waiting for each to be put in its inbox (not written)"""
+    with Client(address, authkey=AUTHKEY) as conn:
+        for message in messages:
+            conn.send(message)
+            conn.recv()
+
+
+def write_forecast(atfile, fcst, index=None):
+    """Hand a forecast to the writer coordinator when one is running, else add it to the A-deck directly.
+
+    Returns 'queued', or the update_adeck path when written here. 'queued' only means the
+    coordinator has the forecast; it writes it, and sends it to the column store and NDJSON
+    sink, when the window of the storm closes, and drops it if the A-deck already has it.
+    """
+    lines = forecast_lines(fcst)
+    address = os.environ.get(COORDINATOR_ENV)
+    if address:
+        try:
+            send_messages(address, [(os.path.abspath(atfile), fcst.tech, fcst.DTG, lines, fcst, program_name())])
+            print(f"Sent {fcst.tech} {fcst.DTG} for {atfile} to the writer coordinator")
+            return 'queued'
+        except (OSError, EOFError) as e:
+            print(f"*Caution* writer coordinator {address} unavailable ({e}), writing {atfile} directly")
+    path = update_adeck(atfile, lines)
+    if index is not None:
+        index.add(fcst.tech, fcst.DTG)
+    append_forecasts([fcst])
+    emit_forecasts([fcst])
+    return path
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python atcf_coordinator.py -socket <path> [-window <seconds>] [-stop]")
+        return
+
+    # Parse command line arguments
+    address = os.environ.get(COORDINATOR_ENV, '')
+    window = DEFAULT_WINDOW
+    stop = False
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "-socket":
+            i += 1
+            address = sys.argv[i]
+        elif sys.argv[i] == "-window":
+            i += 1
+            window = float(sys.argv[i])
+        elif sys.argv[i] == "-stop":
+            stop = True
+        i += 1
+
+    if not address:
+        print("*Error* no socket given")
+        return
+    if stop:
+        send_messages(address, ['stop'])
+        print(f"Stopped the writer coordinator on {address}")
+        return
+    claim_stdout()
+    WriterCoordinator(window=window).serve(address)
+
+if __name__ == "__main__":
+    main()
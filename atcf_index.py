@@ -0,0 +1,130 @@
+import os
+from atcf_reader import read_atcf_lines
+from atomic_file import atomic_open, append_stamped, file_stamp, sidecar_stamp, stamp_line
+from atcf_archive import WHOLE, archive_for, stream_name
+
+# Sidecar index of the forecasts already in an A-deck.
+# Each A-deck A<atcfid>.<ext> has a small text file A<atcfid>.<ext>.idx next
+# to it, one "TECH YYYYMMDDHH" key per line after the stamp (size and
+# mtime_ns) of the A-deck it was made from, so a decoder can check whether
+# its forecast is already in the A-deck with a set lookup instead of loading
+# and scanning the A-deck. The index is appended to whenever a forecast is
+# written, and its stamp set to the A-deck's. It is rebuilt from the A-deck
+# when it is missing or the A-deck's stamp differs, as when something that
+# does not update the index wrote it. An
+# A-deck kept in a season archive has its sidecar <stream>.idx in the
+# archive directory, headed by an "@ <first> <end>" line: the archive
+# offsets of the first chunk of the stream and the end of the last one the
+# keys were collected from. Only the chunks appended past <end> are read to
+# bring it up to date, and the whole stream only once it was rewritten or
+# the archive compacted, which moves its first chunk.
+# Example of how to use
+#   index = ForecastIndex('AWP052024.dat')
+#   if index.contains('RJTD', '2024091012'):
+#       print("Forecast already in ATCF file")
+#   ...write the A-deck...
+#   index.add('RJTD', '2024091012')
+
+# Constants
+INDEX_SUFFIX = '.idx'
+
+
+def forecast_key(tech, dtg):
+    """Index key of a forecast, the tech and its DTG to the hour"""
+    return f"{tech.strip()} {str(dtg).strip()[:10]}"
+
+
+def collect_keys(lines):
+    """Keys of the forecasts in the tech and DTG columns of A-deck lines"""
+    keys = set()
+    for line in lines:
+        fields = line.split(',', 5)
+        if len(fields) > 5:
+            keys.add(forecast_key(fields[4], fields[2]))
+    return keys
+
+
+class ForecastIndex:
+    """Set of the (tech, DTG hour) forecasts in one A-deck, kept in a sidecar file"""
+    def __init__(self, atfile):
+        self.atfile = atfile
+        self.idxfile = atfile + INDEX_SUFFIX
+        self.keys = set()
+        self.archive = archive_for(atfile)
+        if self.archive is not None:
+            self.idxfile = os.path.join(os.path.dirname(self.archive.path), stream_name(atfile) + INDEX_SUFFIX)
+        self.load()
+
+    def is_stale(self):
+        """True when the sidecar is missing or was not made from the A-deck as it is now"""
+        return sidecar_stamp(self.idxfile) != file_stamp(self.atfile)
+
+    def load(self):
+        """Read the sidecar, rebuilding it first when it is out of date"""
+        if self.archive is not None:
+            self.load_archived()
+            return
+        if self.is_stale():
+            self.rebuild()
+            return
+        with open(self.idxfile, 'r') as f:
+            f.readline()  # Stamp
+            self.keys = set(line.strip() for line in f if line.strip())
+
+    def load_archived(self):
+        """Read the sidecar of an archived A-deck, collecting the keys of the chunks added since it was written"""
+        chunks = self.archive.stream_chunks(stream_name(self.atfile))
+        first = chunks[0][2] if chunks else 0
+        end = chunks[-1][2] + chunks[-1][3] if chunks else 0
+        covered = None
+        self.keys = set()
+        if os.path.exists(self.idxfile):
+            with open(self.idxfile, 'r') as f:
+                header = f.readline().split()
+                if len(header) == 3 and header[0] == '@' and int(header[1]) == first and int(header[2]) <= end:
+                    covered = int(header[2])
+                    self.keys = set(line.strip() for line in f if line.strip())
+        if covered == end:
+            return
+        if covered is None:
+            new = chunks
+        else:
+            new = [chunk for chunk in chunks if chunk[2] >= covered]
+            if any(chunk[0] == WHOLE for chunk in new):
+                new = chunks
+                self.keys = set()
+        self.keys |= collect_keys(self.archive.read_chunks(new).splitlines())
+        if covered is None:
+            print(f"Rebuilt forecast index {self.idxfile}: {len(self.keys)} forecasts")
+        with atomic_open(self.idxfile) as f:
+            f.write(f"@ {first} {end}\n" + ''.join(f"{key}\n" for key in sorted(self.keys)))
+
+    def rebuild(self):
+        """Collect the keys from the tech and DTG columns of the A-deck and rewrite the sidecar"""
+        self.keys = set()
+        stamp = file_stamp(self.atfile)  # Before the scan, so a write during it leaves the index stale
+        if os.path.exists(self.atfile):
+            self.keys = collect_keys(read_atcf_lines(self.atfile))
+            print(f"Rebuilt forecast index {self.idxfile}: {len(self.keys)} forecasts")
+        with atomic_open(self.idxfile) as f:
+            f.write(stamp_line(stamp) + ''.join(f"{key}\n" for key in sorted(self.keys)))
+
+    def contains(self, tech, dtg):
+        """True when the A-deck already has the forecast of tech at dtg"""
+        return forecast_key(tech, dtg) in self.keys
+
+    def add(self, tech, dtg):
+        """Record a forecast just written to the A-deck"""
+        key = forecast_key(tech, dtg)
+        if self.archive is not None:
+            self.keys.add(key)  # The sidecar picks it up from the new chunk on its next load
+        else:
+            # Stamped with the A-deck just written, so the write does not mark the sidecar stale
+            append_stamped(self.idxfile, '' if key in self.keys else f"{key}\n", file_stamp(self.atfile))
+            self.keys.add(key)
+
+    def __contains__(self, key):
+        return forecast_key(*key) in self.keys
+
+    def __len__(self):
+        return len(self.keys)
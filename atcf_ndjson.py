@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import atexit
+import numpy as np
+from atcf_record import MISSING, RADII_WINDS
+from atomic_file import locked
+
+# Newline-delimited JSON sink of the decoded forecasts.
+# With ATCF_NDJSON set, every decoder also writes each forecast it decodes
+# as one JSON object per line, built from the same ForecastRecords the
+# A-deck lines are rendered from, so a message bus consumer can stream-parse
+# the output without reading the A-decks:
+#   {"source": "dc_nffn", "atcfid": "WP052024", "basin": "WP", "cynum": 5,
+#    "dtg": "2024091012", "technum": 1, "tech": "NFFN", "stormname": "...",
+#    "track": [{"tau": 0, "lat": 15.2, "lon": 130.4, "vmax": 65, "mslp": 975,
+#               "mrd": null, "ty": "TY", "radii": {"34": [100, 90, 80, 100]}}]}
+# Latitudes are north positive and longitudes east positive, values the
+# source did not give are null and radii only list thresholds that have any.
+# ATCF_NDJSON=- writes to stdout: the decoders call claim_stdout() at the
+# start of main, which then sends their messages to stderr, so stdout
+# carries nothing but records. Any other value is a file,
+# appended to under its lock by every decoder and rotated to .1, .2 ... when
+# it would grow past ATCF_NDJSON_MAX_BYTES. Records are buffered and written
+# FLUSH_RECORDS at a time, and whatever is left when the decoder exits.
+# Example of how to use
+#   export ATCF_NDJSON=/data/bus/forecasts.ndjson
+#   emit_forecasts([fcst])                                   (write_forecast already does this)
+#   emit_forecasts(records, source='dc_abom', atcfid=bomid)  (extra keys go into every record)
+
+# Constants
+NDJSON_ENV = 'ATCF_NDJSON'  # '-' for stdout, a file name, unset for no sink
+MAX_BYTES_ENV = 'ATCF_NDJSON_MAX_BYTES'
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # Size a sink file is rotated at
+BACKUPS = 5  # Rotated files kept, forecasts.ndjson.1 the newest
+FLUSH_RECORDS = 100  # Records held before they are written
+STDOUT = '-'
+
+
+def program_name():
+    """Decoder writing the records, the script name without .py"""
+    return os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+
+
+def json_values(values):
+    """Column values as a list with MISSING (-999) and placeholders as None"""
+    values = np.asarray(values, dtype=float)
+    missing = (values == MISSING) | (np.abs(values) >= 1e99)
+    return [None if gone else value for gone, value in zip(missing.tolist(), values.tolist())]
+
+
+def record_json(fcst, source=None, **extra):
+    """JSON object of a forecast record, its track as a list of points"""
+    data = fcst.track.data
+    dtg = str(fcst.DTG).strip()
+    basin = fcst.basin.strip()
+    record = {'source': source or program_name(),
+              'atcfid': f"{basin}{int(fcst.cyNum):02d}{dtg[:4]}" if basin and len(dtg) >= 4 else None,
+              'basin': basin, 'cynum': int(fcst.cyNum), 'dtg': dtg, 'technum': int(fcst.technum or 0),
+              'tech': fcst.tech.strip(), 'stormname': str(fcst.stormname).strip()}
+    record.update(extra)
+    tau = data['tau'].tolist()
+    columns = {name: json_values(data[name]) for name in ('lat', 'lon', 'vmax', 'mslp', 'mrd')}
+    ty = [value.strip() or None for value in data['ty'].tolist()]
+    radii = data['radii'].tolist()
+    has = data['radii'].any(axis=2).tolist()
+    record['track'] = [
+        dict(tau=tau[i], **{name: values[i] for name, values in columns.items()}, ty=ty[i],
+             radii={wind: radii[i][j] for j, wind in enumerate(RADII_WINDS) if has[i][j]})
+        for i in range(len(tau))]
+    return record
+
+
+class NdjsonSink:
+    """Buffered writer of JSON records, one per line, to a stream or a rotating file"""
+    def __init__(self, target, max_bytes=DEFAULT_MAX_BYTES, backups=BACKUPS, flush_records=FLUSH_RECORDS):
+        self.target = target  # File name, or an open stream
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_records = flush_records
+        self.buffer = []
+        self.written = 0
+
+    def write(self, record):
+        self.buffer.append(json.dumps(record, separators=(',', ':')) + '\n')
+        if len(self.buffer) >= self.flush_records:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records"""
+        if not self.buffer:
+            return
+        text = ''.join(self.buffer)
+        if isinstance(self.target, str):
+            with locked(self.target):
+                if os.path.exists(self.target) and \
+                        os.path.getsize(self.target) + len(text.encode('utf-8')) > self.max_bytes:
+                    self.rotate()
+                with open(self.target, 'a') as f:
+                    f.write(text)
+        else:
+            self.target.write(text)
+            self.target.flush()
+        self.written += len(self.buffer)
+        self.buffer = []
+
+    def rotate(self):
+        """Move the file to .1, shifting older ones up and dropping the oldest; the caller holds the lock"""
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.target}.{n}"):
+                os.replace(f"{self.target}.{n}", f"{self.target}.{n + 1}")
+        if self.backups > 0:
+            os.replace(self.target, f"{self.target}.1")
+        else:
+            os.remove(self.target)
+
+    def close(self):
+        try:
+            self.flush()
+        except (OSError, ValueError) as e:
+            print(f"*Caution* {len(self.buffer)} NDJSON records not written: {e}", file=sys.stderr)
+
+
+sink = None
+records_out = None  # The stdout claim_stdout kept for the records
+
+
+def claim_stdout():
+    """Keep stdout for the records when ATCF_NDJSON=-, making sys.stdout stderr.
+
+    A decoder calls this at the start of main, before it prints anything.
+    """
+    global records_out
+    if os.environ.get(NDJSON_ENV) == STDOUT and records_out is None:
+        records_out = sys.stdout
+        sys.stdout = sys.stderr
+
+
+def get_sink():
+    """The sink of ATCF_NDJSON, made on first use, None when it is not set"""
+    global sink
+    target = os.environ.get(NDJSON_ENV)
+    if not target:
+        return None
+    if sink is None:
+        if target == STDOUT:
+            target = records_out or sys.stdout
+        sink = NdjsonSink(target, max_bytes=int(os.environ.get(MAX_BYTES_ENV, DEFAULT_MAX_BYTES)))
+        atexit.register(sink.close)
+    return sink
+
+
+def emit_forecasts(fcsts, source=None, **extra):
+    """Write forecast records to the NDJSON sink when ATCF_NDJSON is set, returning how many"""
+    out = get_sink()
+    if out is None:
+        return 0
+    count = 0
+    for fcst in fcsts:
+        out.write(record_json(fcst, source, **extra))
+        count += 1
+    return count
@@ -0,0 +1,196 @@
+import io
+import os
+import sys
+from atcf_reader import read_atcf_lines, read_atcf_records, ANY_TECH, ATCF_BASINS
+from atcf_archive import archive_for, stream_name
+from atomic_file import atomic_open, append_stamped, file_stamp, sidecar_stamp, stamp_line
+
+# Example of how to run file
+# python3 atcf_offsets.py -in AWP052024.dat -cycles 4 [-tech RJTD]
+# python3 atcf_offsets.py -in AWP052024.dat -since 2024091000
+# DTG offset index of an A-deck, for reading only its last cycles.
+# Each A-deck A<atcfid>.<ext> can have a small text file A<atcfid>.<ext>.dtg
+# next to it, one "YYYYMMDDHH offset" line for each run of lines of one DTG,
+# giving the byte offset of its first line, after the stamp (size and
+# mtime_ns) of the A-deck it was made from. A reader after the last N cycles,
+# or everything since a DTG, seeks straight to that offset and reads only
+# the end of the file. The index is optional: it is made the first time a
+# reader asks for it, update_adeck adds the DTGs it appends to an index that
+# is current, and it is rebuilt whenever the A-deck's stamp differs.
+# An A-deck kept in a season archive has no sidecar: its stream is read
+# through the archive and the offsets, in characters of the stream, are
+# found as it is scanned, so update_archived_adeck has none to keep.
+# Example of how to use
+#   for fcst in read_recent_records('AWP052024.dat', cycles=4, tech_filter='RJTD'):
+#       print(fcst.DTG, fcst.track.vmax)
+
+# Constants
+OFFSET_SUFFIX = '.dtg'
+
+
+def line_dtg(line):
+    """DTG column of a raw A-deck line (bytes), None for a line without one"""
+    fields = line.split(b',', 3)
+    return fields[2].strip().decode('ascii', 'replace') if len(fields) > 3 else None
+
+
+def offsets_current(atfile):
+    """True when the A-deck has an offset index made from it as it is now, by its size and mtime_ns"""
+    return os.path.exists(atfile) and sidecar_stamp(atfile + OFFSET_SUFFIX) == file_stamp(atfile)
+
+
+def append_offsets(atfile, start, lines, previous=None):
+    """Add to the offset index the DTGs of lines just appended at byte start, previous being the DTG before them"""
+    entries = []
+    offset = start
+    for line in lines:
+        data = line.encode('ascii', 'replace')
+        dtg = line_dtg(data)
+        if dtg is not None and dtg != previous:
+            entries.append(f"{dtg} {offset}\n")
+            previous = dtg
+        offset += len(data)
+    append_stamped(atfile + OFFSET_SUFFIX, ''.join(entries), file_stamp(atfile))
+
+
+class OffsetIndex:
+    """Offset of the first line of each run of one DTG in an A-deck, kept in a sidecar file unless archived"""
+    def __init__(self, atfile):
+        self.atfile = atfile
+        self.offfile = atfile + OFFSET_SUFFIX
+        self.archive = archive_for(atfile)
+        self.entries = []  # (DTG, offset) in file order
+        self.load()
+
+    def load(self):
+        """Read the sidecar, rebuilding it first when it is missing or out of date"""
+        if self.archive is not None:
+            self.load_archived()
+            return
+        if not offsets_current(self.atfile):
+            self.rebuild()
+            return
+        with open(self.offfile, 'r') as f:
+            f.readline()  # Stamp
+            self.entries = [(dtg, int(offset)) for dtg, offset in (line.split() for line in f if line.strip())]
+
+    def load_archived(self):
+        """Scan the stream of an archived A-deck for the character offsets where its DTG changes"""
+        self.entries = []
+        offset = 0
+        previous = None
+        for line in io.StringIO(self.archive.read(stream_name(self.atfile))):
+            dtg = line_dtg(line.encode('ascii', 'replace'))
+            if dtg is not None and dtg != previous:
+                self.entries.append((dtg, offset))
+                previous = dtg
+            offset += len(line)
+
+    def rebuild(self):
+        """Scan the A-deck for the offsets where its DTG changes and rewrite the sidecar"""
+        self.entries = []
+        if not os.path.exists(self.atfile):
+            return
+        offset = 0
+        previous = None
+        stamp = file_stamp(self.atfile)  # Before the scan, so a write during it leaves the index stale
+        with open(self.atfile, 'rb') as f:
+            for line in f:
+                dtg = line_dtg(line)
+                if dtg is not None and dtg != previous:
+                    self.entries.append((dtg, offset))
+                    previous = dtg
+                offset += len(line)
+        with atomic_open(self.offfile) as f:
+            f.write(stamp_line(stamp) + ''.join(f"{dtg} {offset}\n" for dtg, offset in self.entries))
+        print(f"Rebuilt DTG offset index {self.offfile}: {len(self.entries)} DTGs")
+
+    def dtgs(self):
+        """DTGs of the A-deck, sorted"""
+        return sorted(set(dtg for dtg, _ in self.entries))
+
+    def offset_since(self, dtg):
+        """Offset from which every line of DTG dtg or later lies, None when there is none"""
+        # A file out of DTG order has several runs of a DTG, the first qualifying run wins
+        return min((offset for entry, offset in self.entries if entry >= dtg), default=None)
+
+    def first_dtg(self, cycles=None, since=None):
+        """Earliest DTG of the last cycles DTGs, or since, None with neither or no such DTG"""
+        if cycles is not None:
+            dtgs = self.dtgs()
+            return dtgs[-min(cycles, len(dtgs))] if dtgs and cycles > 0 else None
+        return since
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def recent_start(atfile, cycles=None, since=None):
+    """Earliest DTG wanted and the offset to read from, the offset None when there is nothing to read"""
+    index = OffsetIndex(atfile)
+    dtg = index.first_dtg(cycles, since)
+    if dtg is None:
+        return None, (None if cycles is not None else 0)
+    return dtg, index.offset_since(dtg)
+
+
+def read_recent_lines(atfile, cycles=None, since=None, tech_filter=ANY_TECH, basins=ATCF_BASINS):
+    """Yield the raw lines of the last cycles DTGs of an A-deck, or of DTG since and later"""
+    dtg, offset = recent_start(atfile, cycles, since)
+    if offset is None:
+        return
+    for line in read_atcf_lines(atfile, tech_filter, basins, offset):
+        # Earlier DTGs past the offset only turn up in a file out of DTG order
+        if dtg is None or line.split(',', 3)[2].strip() >= dtg:
+            yield line
+
+
+def read_recent_records(atfile, cycles=None, since=None, tech_filter=ANY_TECH, basins=ATCF_BASINS):
+    """Yield the ForecastRecords of the last cycles DTGs of an A-deck, or of DTG since and later"""
+    dtg, offset = recent_start(atfile, cycles, since)
+    if offset is None:
+        return
+    for fcst in read_atcf_records(atfile, tech_filter, basins, offset):
+        if dtg is None or fcst.DTG >= dtg:
+            yield fcst
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python atcf_offsets.py -in <A-deck> [-cycles <n>] [-since <YYYYMMDDHH>] [-tech <tech>]")
+        return
+
+    # Parse command line arguments
+    atfile = ''
+    cycles = None
+    since = None
+    tech = ANY_TECH
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "-in":
+            i += 1
+            atfile = sys.argv[i]
+        elif sys.argv[i] == "-cycles":
+            i += 1
+            cycles = int(sys.argv[i])
+        elif sys.argv[i] == "-since":
+            i += 1
+            since = sys.argv[i]
+        elif sys.argv[i] == "-tech":
+            i += 1
+            tech = sys.argv[i]
+        i += 1
+
+    archive = archive_for(atfile)
+    if archive is None and not os.path.exists(atfile):
+        print(f"*Error* {atfile} does not exist!")
+        return
+    if archive is not None and stream_name(atfile) not in archive:
+        print(f"*Error* {atfile} is not in {archive.path}!")
+        return
+    for line in read_recent_lines(atfile, cycles, since, tech):
+        sys.stdout.write(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import io
+import os
+import sys
+import glob
+import json
+import difflib
+import contextlib
+import hashlib
+import numpy as np
+from atomic_file import locked, atomic_open, locked_append
+from atcf_archive import ARCHIVE_ENV, archive_for, season_archives, stream_name
+
+# Example of how to run file
+# python3 atcf_publish.py -dir /data/atcf -state /data/publish -out delta.ndjson   (sending side)
+# python3 atcf_publish.py -apply delta.ndjson -dir /mirror/atcf                    (receiving side)
+# python3 atcf_publish.py -dir /data/atcf -state /data/publish -out - | ssh mirror python3 atcf_publish.py -apply - -dir /mirror/atcf
+# Delta publication of the A-decks.
+# Rather than copying every A<atcfid> file after each update, publish
+# writes one NDJSON record for each A-deck that changed since the last
+# publish, holding only the lines added or changed. The state directory
+# keeps a high-water mark per A-deck (size, mtime, line count and digest of
+# what was published) and the 8 byte digest of each published line, so:
+#   op "append": the A-deck only grew, the record has the new lines and the
+#                size the receiver's copy must have before they are added;
+#   op "patch":  the A-deck was rewritten (a merge of out of order lines),
+#                the record has the line ranges of the old copy to replace;
+#   op "whole":  the first publish of an A-deck, all of its lines.
+# Every record carries the digest of the copy it applies to ("base") and of
+# the result ("digest"), and apply refuses a record whose base does not
+# match, so a mirror is never silently corrupted. Lines are carried as
+# latin-1 text, which maps every byte, so the copies match byte for byte.
+# An -out file is appended to, so a publish the mirror has not applied yet
+# is never lost to the next one. Apply skips the records of an A-deck up to
+# the last one whose result is already its copy, so the whole file can be
+# applied again after each publish; remove it once the mirror is current.
+# With ATCF_ARCHIVE set the A-decks are read from the streams of the season
+# archives.
+# Example of how to use
+#   with locked(os.path.join('/data/publish', STATE_FILE)):
+#       records, state = publish_directory('/data/atcf', '/data/publish')
+#       write_records(records, 'delta.ndjson')
+#       state.save()
+#   apply_records(read_records('delta.ndjson'), '/mirror/atcf')
+
+# Constants
+STATE_FILE = 'publish.state'
+LINES_SUFFIX = '.lines'
+ADECK_PATTERN = 'A[A-Z][A-Z][0-9][0-9][0-9][0-9][0-9][0-9].*'
+ENCODING = 'latin-1'
+WHOLE = 'whole'
+APPEND = 'append'
+PATCH = 'patch'
+
+
+def content_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def line_digests(lines):
+    """8 byte digest of each line, as an array of uint64"""
+    return np.array([int.from_bytes(hashlib.blake2b(line, digest_size=8).digest(), 'little') for line in lines],
+                    dtype=np.uint64)
+
+
+def split_lines(data):
+    """Lines of bytes, each keeping its newline"""
+    return io.BytesIO(data).readlines()
+
+
+def adeck_names(directory):
+    """A-decks of a directory, or of the season archives when the archive backend is on, sorted"""
+    if os.environ.get(ARCHIVE_ENV):
+        return sorted(set(stream for archive in season_archives(os.environ[ARCHIVE_ENV])
+                          for stream in archive.streams() if stream.count('.') == 1))
+    # Sidecars (.idx, .dtg) and temp files have more than one dot
+    return sorted(os.path.basename(path) for path in glob.glob(os.path.join(directory, ADECK_PATTERN))
+                  if os.path.basename(path).count('.') == 1)
+
+
+def read_source(directory, name):
+    """Bytes of an A-deck and its (size, mtime) stamp, mtime None for an archived stream"""
+    path = os.path.join(directory, name)
+    archive = archive_for(path)
+    if archive is not None:
+        data = archive.read(stream_name(path)).encode('utf-8')
+        return data, None
+    with locked(path, shared=True):
+        with open(path, 'rb') as f:
+            data = f.read()
+        return data, os.stat(path).st_mtime_ns
+
+
+class PublishState:
+    """High-water marks of the published A-decks: name -> (size, mtime, lines, digest)"""
+    def __init__(self, statedir):
+        self.statedir = statedir
+        self.statefile = os.path.join(statedir, STATE_FILE)
+        self.marks = {}
+        self.pending = {}  # name -> (line digests, True when only the new lines, first line), written by save
+        if os.path.exists(self.statefile):
+            with open(self.statefile, 'r') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 5:
+                        mtime = None if parts[2] == '-' else int(parts[2])
+                        self.marks[parts[0]] = (int(parts[1]), mtime, int(parts[3]), parts[4])
+
+    def lines_file(self, name):
+        return os.path.join(self.statedir, name + LINES_SUFFIX)
+
+    def line_digests(self, name):
+        """Digests of the published lines of an A-deck"""
+        count = self.marks[name][2]
+        if not os.path.exists(self.lines_file(name)):
+            return np.zeros(0, dtype=np.uint64)
+        # Digests past the count belong to a publish that did not finish
+        return np.fromfile(self.lines_file(name), dtype=np.uint64, count=count)
+
+    def update(self, name, size, mtime, digests, digest, appended=False):
+        """Record a publish, digests being only those of the new lines when appended"""
+        count = self.marks[name][2] + len(digests) if appended else len(digests)
+        self.pending[name] = (digests, appended, count - len(digests))
+        self.marks[name] = (size, mtime, count, digest)
+
+    def save(self):
+        """Write the line digests of this publish, then the high-water marks; the caller holds the state lock"""
+        for name, (digests, appended, start) in self.pending.items():
+            if appended:
+                with open(self.lines_file(name), 'r+b') as f:
+                    f.seek(start * 8)
+                    f.write(digests.tobytes())
+                    f.truncate()
+            else:
+                with atomic_open(self.lines_file(name), 'wb') as f:
+                    f.write(digests.tobytes())
+        self.pending = {}
+        with atomic_open(self.statefile, lock=False) as f:
+            for name, (size, mtime, count, digest) in sorted(self.marks.items()):
+                f.write(f"{name} {size} {'-' if mtime is None else mtime} {count} {digest}\n")
+
+
+def text_of(lines):
+    return [line.decode(ENCODING) for line in lines]
+
+
+def publish_file(state, directory, name):
+    """Delta record of one A-deck since its last publish, None when it has not changed"""
+    data, mtime = read_source(directory, name)
+    mark = state.marks.get(name)
+    if mark is not None and mtime is not None and mark[:2] == (len(data), mtime):
+        return None
+    digest = content_digest(data)
+    if mark is None:
+        lines = split_lines(data)
+        state.update(name, len(data), mtime, line_digests(lines), digest)
+        return {'file': name, 'op': WHOLE, 'base': None, 'digest': digest, 'lines': text_of(lines)}
+
+    size, _, _, base = mark
+    if digest == base:
+        state.marks[name] = (size, mtime) + mark[2:]  # Touched, not changed
+        return None
+    # Appended to: the published bytes are still its start and ended on a whole line
+    if len(data) > size and (size == 0 or data[size - 1:size] == b'\n') and content_digest(data[:size]) == base:
+        lines = split_lines(data[size:])
+        state.update(name, len(data), mtime, line_digests(lines), digest, appended=True)
+        return {'file': name, 'op': APPEND, 'base': base, 'digest': digest, 'offset': size, 'lines': text_of(lines)}
+
+    # Rewritten: diff the line digests against those published, sending only the replaced ranges
+    lines = split_lines(data)
+    old = state.line_digests(name).tolist()
+    new = line_digests(lines)
+    matcher = difflib.SequenceMatcher(None, old, new.tolist(), autojunk=False)
+    edits = [[i1, i2, text_of(lines[j1:j2])] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+    state.update(name, len(data), mtime, new, digest)
+    return {'file': name, 'op': PATCH, 'base': base, 'digest': digest, 'edits': edits}
+
+
+def publish_directory(directory, statedir, names=None):
+    """Delta records of every A-deck of directory changed since the last publish, the state left unsaved"""
+    state = PublishState(statedir)
+    records = []
+    for name in names or adeck_names(directory):
+        record = publish_file(state, directory, name)
+        if record is not None:
+            records.append(record)
+    return records, state
+
+
+def apply_record(record, directory):
+    """Apply one delta record to the copy of its A-deck in directory, False when the copy does not match"""
+    path = os.path.join(directory, record['file'])
+    with locked(path):
+        data = b''
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+        if record['op'] != WHOLE and content_digest(data) != record['base']:
+            print(f"*Error* {path} is not the copy the {record['op']} was made from, resync it")
+            return False
+        if record['op'] == APPEND:
+            if len(data) != record['offset']:
+                print(f"*Error* {path} has {len(data)} bytes, the append starts at {record['offset']}")
+                return False
+            with open(path, 'ab') as f:
+                f.write(''.join(record['lines']).encode(ENCODING))
+            return True
+        if record['op'] == PATCH:
+            lines = split_lines(data)
+            # Back to front, so the ranges of the earlier edits still hold
+            for i1, i2, new in reversed(record['edits']):
+                lines[i1:i2] = [line.encode(ENCODING) for line in new]
+            data = b''.join(lines)
+        else:
+            data = ''.join(record['lines']).encode(ENCODING)
+        if content_digest(data) != record['digest']:
+            print(f"*Error* {path} does not match the publisher after the {record['op']}, resync it")
+            return False
+        with atomic_open(path, 'wb', lock=False) as f:
+            f.write(data)
+    return True
+
+
+def copy_digest(path):
+    """Digest of the copy of an A-deck, None when there is none"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return content_digest(f.read())
+
+
+def unapplied(records, directory):
+    """Records the copies in directory do not have yet: those after the last record of each A-deck giving its copy"""
+    current = {name: copy_digest(os.path.join(directory, name)) for name in set(r['file'] for r in records)}
+    last = {record['file']: i for i, record in enumerate(records) if record['digest'] == current[record['file']]}
+    return [record for i, record in enumerate(records) if i > last.get(record['file'], -1)]
+
+
+def apply_records(records, directory):
+    """Apply the delta records not applied yet in order, returning how many applied"""
+    os.makedirs(directory, exist_ok=True)
+    todo = unapplied(records, directory)
+    applied = sum(apply_record(record, directory) for record in todo)
+    print(f"Applied {applied} of {len(todo)} delta records to {directory}, "
+          f"{len(records) - len(todo)} were applied before")
+    return applied
+
+
+def write_records(records, out):
+    """Write delta records as NDJSON to out, a file name (appended to) or an open stream"""
+    text = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+    if not isinstance(out, str):
+        out.write(text)
+        out.flush()
+    else:
+        # Appended, so the records of a publish the mirror has not applied yet are kept
+        with locked_append(out) as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_records(source):
+    """Delta records of an NDJSON file, or of stdin for '-'"""
+    if source == '-':
+        return [json.loads(line) for line in sys.stdin if line.strip()]
+    with locked(source, shared=True):  # Not half way through a publish
+        with open(source, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python atcf_publish.py -dir <A-deck dir> -state <dir> -out <file|->\n"
+              "       python atcf_publish.py -apply <file|-> -dir <mirror dir>")
+        return
+
+    # Parse command line arguments
+    directory = ''
+    statedir = ''
+    out = '-'
+    source = ''
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "-dir":
+            i += 1
+            directory = sys.argv[i]
+        elif sys.argv[i] == "-state":
+            i += 1
+            statedir = sys.argv[i]
+        elif sys.argv[i] == "-out":
+            i += 1
+            out = sys.argv[i]
+        elif sys.argv[i] == "-apply":
+            i += 1
+            source = sys.argv[i]
+        i += 1
+
+    if not directory:
+        print("*Error* no A-deck directory given")
+        return
+    if source:
+        apply_records(read_records(source), directory)
+        return
+    if not statedir:
+        print("*Error* no state directory given")
+        return
+    os.makedirs(statedir, exist_ok=True)
+    stdout = sys.stdout
+    # Messages go to stderr when stdout carries the records
+    with contextlib.redirect_stdout(sys.stderr) if out == '-' else contextlib.nullcontext():
+        # One publisher at a time, and the state is only saved once the records are out
+        with locked(os.path.join(statedir, STATE_FILE)):
+            records, state = publish_directory(directory, statedir)
+            write_records(records, stdout if out == '-' else out)
+            state.save()
+        lines = sum(len(r.get('lines', ())) + sum(len(e[2]) for e in r.get('edits', ())) for r in records)
+        print(f"Published {len(records)} changed A-decks, {lines} lines")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import io
+from atcf_record import ForecastRecord, TrackArray, RADII_WINDS, MISSING
+from atcf_time import dtg_to_hours
+from atcf_archive import archive_for, stream_name
+
+# Streaming reader of ATCF A-deck files.
+# The basin and tech columns are checked on the raw line before it is split
+# and parsed, so pulling one agency's records out of a season A-deck skips
+# the float parsing and record building for the lines of every other tech.
+# Records are yielded one forecast at a time as the file is read. With the
+# archive backend on, the A-deck is read from the stream of its season archive.
+# Example of how to use
+#   for fcst in read_atcf_records('AWP052024.dat', 'RJTD'):
+#       print(fcst.DTG, fcst.track.tau, fcst.track.vmax)
+
+# Constants
+ANY_TECH = 'ANY '  # Tech filter that passes every tech
+ATCF_BASINS = ('AL', 'EP', 'CP', 'WP', 'IO', 'SH')
+
+
+def tech_code(tech_filter):
+    """Tech to match from a tech filter, None when the filter passes every tech"""
+    tech = (tech_filter or '').strip()
+    return None if tech in ('', ANY_TECH.strip()) else tech
+
+
+def line_matches(line, tech=None, basins=ATCF_BASINS):
+    """True when the basin and tech columns of a raw A-deck line match, without parsing the rest"""
+    if not line.startswith(basins):
+        return False
+    if tech is None:
+        return True
+    # A plain substring test turns away most lines of other techs before any split
+    if tech not in line:
+        return False
+    fields = line.split(',', 5)
+    return len(fields) > 5 and fields[4].strip() == tech
+
+
+def parse_latlon(text):
+    """Latitude or longitude from an A-deck column such as 152N or 1234W (tenths of a degree)"""
+    text = text.strip()
+    if len(text) < 2:
+        return -999.0
+    hemi = text[-1]
+    value = float(text[:-1]) if '.' in text else int(text[:-1]) / 10.0
+    return -value if hemi in 'SW' else value
+
+
+def parse_int(text, default=MISSING):
+    """Integer column, default when it is blank"""
+    text = text.strip()
+    return int(text) if text else default
+
+
+def open_adeck(atfile):
+    """A-deck opened to read, the stream of its season archive when the archive backend is on"""
+    archive = archive_for(atfile)
+    if archive is None:
+        return open(atfile, 'r')
+    return io.StringIO(archive.read(stream_name(atfile)))
+
+
+def read_atcf_lines(atfile, tech_filter=ANY_TECH, basins=ATCF_BASINS, offset=0):
+    """Yield the raw lines of an A-deck whose basin and tech pass the filters, from offset on.
+
+    offset is in bytes of a file, in characters of an archived stream.
+    """
+    tech = tech_code(tech_filter)
+    with open_adeck(atfile) as f:
+        if offset:
+            f.seek(offset)
+        for line in f:
+            if line_matches(line, tech, basins):
+                yield line
+
+
+def build_track(points):
+    """TrackArray of the {tau: [lat, lon, vmax, mslp, mrd, ty, radii]} points of one record, in tau order"""
+    taus = sorted(points)
+    rows = [points[tau] for tau in taus]
+    return TrackArray.from_columns(tau=taus, lat=[row[0] for row in rows], lon=[row[1] for row in rows],
+                                   vmax=[row[2] for row in rows], mslp=[row[3] for row in rows],
+                                   mrd=[row[4] for row in rows], ty=[row[5] for row in rows],
+                                   radii=[row[6] for row in rows])
+
+
+def read_atcf_records(atfile, tech_filter=ANY_TECH, basins=ATCF_BASINS, offset=0):
+    """Yield a ForecastRecord for each run of A-deck lines with the same storm, DTG, technum and tech.
+
+    The 34, 50 and 64 kt lines of a tau fill one track point, and jdnow is set to the DTG
+    hours. offset, a line start from the DTG offset index, skips the earlier part of the file.
+    """
+    fcst = None
+    key = None
+    points = {}
+    for line in read_atcf_lines(atfile, tech_filter, basins, offset):
+        parts = line.split(',')
+        if len(parts) < 8:
+            continue
+        try:
+            line_key = (parts[0].strip(), int(parts[1]), parts[2].strip(), parse_int(parts[3], 0), parts[4].strip())
+            tau = int(parts[5])
+            lat = parse_latlon(parts[6])
+            lon = parse_latlon(parts[7])
+        except ValueError:
+            continue
+
+        if line_key != key:
+            if fcst is not None:
+                fcst.track = build_track(points)
+                yield fcst
+            key = line_key
+            points = {}
+            basin, cyNum, DTG, technum, tech = line_key
+            fcst = ForecastRecord(basin=basin, cyNum=cyNum, DTG=DTG, technum=technum, tech=tech,
+                                  stormname=parts[27].strip() if len(parts) > 27 else '')
+            try:
+                fcst.jdnow = dtg_to_hours(DTG)
+            except KeyError:
+                print(f"*Caution* bad DTG {DTG} in {atfile}")
+
+        point = points.get(tau)
+        if point is None:
+            point = points[tau] = [lat, lon, MISSING, MISSING, MISSING, '  ', [[0] * 4 for _ in RADII_WINDS]]
+        try:
+            if len(parts) > 8 and parts[8].strip():
+                point[2] = int(parts[8])
+            if len(parts) > 9 and parts[9].strip():
+                point[3] = int(parts[9])
+            if len(parts) > 19 and parts[19].strip():
+                point[4] = int(parts[19])
+            if len(parts) > 10 and parts[10].strip():
+                point[5] = parts[10].strip()
+            if len(parts) > 16 and parts[11].strip() in RADII_WINDS:
+                point[6][RADII_WINDS.index(parts[11].strip())] = [parse_int(r, 0) for r in parts[13:17]]
+        except ValueError:
+            print(f"*Caution* bad A-deck line in {atfile}: {line.rstrip()}")
+    if fcst is not None:
+        fcst.track = build_track(points)
+        yield fcst
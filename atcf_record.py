@@ -0,0 +1,238 @@
+import sys
+import numpy as np
+
+# Track point and forecast records shared by the decoders.
+# Both classes use __slots__ so a season of forecasts in memory carries no
+# per-instance __dict__, and basin and tech codes are interned so every
+# record shares one copy. A forecast track is a TrackArray, a NumPy structured
+# array that only holds the points the forecast has and gives whole columns
+# (every lat, every vmax) without walking the points one by one.
+# Example of how to use
+#   fcst = ForecastRecord(basin='WP', cyNum=5, DTG='2024091012', technum=1, tech='RJTD')
+#   fcst.track.append(TrackPoint(tau=0, lat=15.2, lon=130.4, vmax=65, mslp=975))
+#   strong = fcst.track[fcst.track.vmax >= 64]
+
+# Constants
+MISSING = -999
+RADII_WINDS = ('34', '50', '64')  # Wind radii thresholds in knots
+RADII_QUADRANTS = ('NE', 'SE', 'SW', 'NW')
+TRACK_DTYPE = np.dtype([('tau', np.int32), ('lat', np.float64), ('lon', np.float64), ('vmax', np.float64),
+                        ('mslp', np.float64), ('mrd', np.float64), ('ty', 'U2'),
+                        ('radii', np.int16, (len(RADII_WINDS), len(RADII_QUADRANTS)))])
+TRACK_FIELDS = TRACK_DTYPE.names
+
+
+def intern_code(code):
+    """Intern a short repeated code such as a basin or tech"""
+    return sys.intern(code) if type(code) is str else code
+
+
+class TrackPoint:
+    """One forecast position, MISSING marks values the source did not give"""
+    __slots__ = ('tau', 'lat', 'lon', 'vmax', 'mslp', 'mrd', 'ty', 'radii')
+
+    def __init__(self, tau=0, lat=-999.0, lon=-999.0, vmax=MISSING, mslp=MISSING, mrd=MISSING, ty='  ',
+                 radii=None):
+        self.tau = tau
+        self.lat = lat
+        self.lon = lon
+        self.vmax = vmax
+        self.mslp = mslp
+        self.mrd = mrd
+        self.ty = ty
+        self.radii = radii
+
+    def __repr__(self):
+        return (f"TrackPoint(tau={self.tau}, lat={self.lat}, lon={self.lon}, vmax={self.vmax}, "
+                f"mslp={self.mslp}, mrd={self.mrd})")
+
+
+def radii_array(radii):
+    """Wind radii as a (threshold, quadrant) array, from nested {'34': {'NE': ...}} dicts or a sequence"""
+    if radii is None:
+        return 0
+    if isinstance(radii, dict):
+        return [[radii.get(wind, {}).get(quadrant, 0) for quadrant in RADII_QUADRANTS] for wind in RADII_WINDS]
+    return radii
+
+
+class TrackRow:
+    """Attribute view of one point of a TrackArray, assignments write through to the array"""
+    __slots__ = ('_track', '_index')
+
+    def __init__(self, track, index):
+        self._track = track
+        self._index = index
+
+    def radii_dict(self):
+        """Wind radii as nested {'34': {'NE': ...}} dicts"""
+        radii = self._track._data['radii'][self._index]
+        return {wind: {quadrant: int(radii[i, j]) for j, quadrant in enumerate(RADII_QUADRANTS)}
+                for i, wind in enumerate(RADII_WINDS)}
+
+    def __repr__(self):
+        return (f"TrackRow(tau={self.tau}, lat={self.lat}, lon={self.lon}, vmax={self.vmax}, "
+                f"mslp={self.mslp}, mrd={self.mrd})")
+
+
+def row_field(name):
+    """Property reading and writing one field of the row in the underlying array"""
+    def get(self):
+        value = self._track._data[name][self._index]
+        return value if name == 'radii' else value.item()
+
+    def set(self, value):
+        self._track._data[name][self._index] = radii_array(value) if name == 'radii' else value
+    return property(get, set)
+
+
+for _name in TRACK_FIELDS:
+    setattr(TrackRow, _name, row_field(_name))
+
+
+class TrackArray:
+    """Growable track of points in tau order of arrival, stored as a TRACK_DTYPE structured array.
+
+    track[j] is a TrackRow view, track['lat'] or track.lat a column view and
+    track[mask] a new TrackArray holding the selected points.
+    """
+    __slots__ = ('_data', '_size')
+
+    def __init__(self, points=(), capacity=8):
+        self._data = np.zeros(max(capacity, 1), dtype=TRACK_DTYPE)
+        self._size = 0
+        for point in points:
+            self.append(point)
+
+    @classmethod
+    def from_array(cls, data):
+        track = cls(capacity=len(data))
+        track._data[:len(data)] = data
+        track._size = len(data)
+        return track
+
+    @classmethod
+    def from_columns(cls, **columns):
+        """Track built in one step from equal length column arrays, missing columns stay blank"""
+        size = len(next(iter(columns.values()))) if columns else 0
+        track = cls(capacity=size)
+        track._data[:size] = track.blank_row()
+        for name, values in columns.items():
+            track._data[name][:size] = values
+        track._size = size
+        return track
+
+    def _grow(self, size):
+        if size > len(self._data):
+            data = np.zeros(max(size, 2 * len(self._data)), dtype=TRACK_DTYPE)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+
+    def blank_row(self):
+        """A row with every value missing"""
+        return (0, -999.0, -999.0, MISSING, MISSING, MISSING, '  ', 0)
+
+    def append(self, point=None, **fields):
+        """Add a point, given as a TrackPoint-like object or as keyword fields, and return its row"""
+        self._grow(self._size + 1)
+        n = self._size
+        if point is not None:
+            self._data[n] = (point.tau, point.lat, point.lon, point.vmax, point.mslp, point.mrd, point.ty,
+                             radii_array(point.radii))
+        else:
+            self._data[n] = self.blank_row()
+            for name, value in fields.items():
+                self._data[name][n] = radii_array(value) if name == 'radii' else value
+        self._size = n + 1
+        return TrackRow(self, n)
+
+    def insert(self, index, **fields):
+        """Insert a point before index and return its row"""
+        self._grow(self._size + 1)
+        self._data[index + 1:self._size + 1] = self._data[index:self._size]
+        self._data[index] = self.blank_row()
+        for name, value in fields.items():
+            self._data[name][index] = radii_array(value) if name == 'radii' else value
+        self._size += 1
+        return TrackRow(self, index)
+
+    def at_tau(self, tau):
+        """Row of the point at tau, inserting a blank one in tau order when there is none"""
+        taus = self._data['tau'][:self._size]
+        match = np.flatnonzero(taus == tau)
+        if match.size:
+            return TrackRow(self, int(match[0]))
+        later = np.flatnonzero(taus > tau)
+        return self.insert(int(later[0]) if later.size else self._size, tau=tau)
+
+    @property
+    def data(self):
+        """Structured array view of the points"""
+        return self._data[:self._size]
+
+    def column(self, name):
+        """View of one field for every point, writes go to the track"""
+        return self._data[name][:self._size]
+
+    def filter(self, mask):
+        """New track holding the points where mask is true"""
+        return TrackArray.from_array(self.data[mask])
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for n in range(self._size):
+            yield TrackRow(self, n)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.column(key)
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += self._size
+            if not 0 <= key < self._size:
+                raise IndexError('track index out of range')
+            return TrackRow(self, int(key))
+        return TrackArray.from_array(self.data[key])
+
+    def __repr__(self):
+        return f"TrackArray({self._size} points)"
+
+
+for _name in TRACK_FIELDS:
+    setattr(TrackArray, _name, property(lambda self, name=_name: self.column(name)))
+
+
+class ForecastRecord:
+    """One forecast (or CARQ) record of a storm, track is a TrackArray of only the points it has"""
+    __slots__ = ('_basin', 'cyNum', 'DTG', 'jdnow', 'technum', '_tech', 'stormname', 'track')
+
+    def __init__(self, basin='', cyNum=0, DTG='', jdnow=0, technum=0, tech='', stormname='', track=None):
+        self.basin = basin
+        self.cyNum = cyNum
+        self.DTG = DTG
+        self.jdnow = jdnow  # DTG as hours since the atcf_time epoch
+        self.technum = technum
+        self.tech = tech
+        self.stormname = stormname
+        self.track = track if isinstance(track, TrackArray) else TrackArray(track or ())
+
+    @property
+    def basin(self):
+        return self._basin
+
+    @basin.setter
+    def basin(self, value):
+        self._basin = intern_code(value)
+
+    @property
+    def tech(self):
+        return self._tech
+
+    @tech.setter
+    def tech(self, value):
+        self._tech = intern_code(value)
+
+    def __repr__(self):
+        return f"ForecastRecord({self.basin}{self.cyNum}, {self.DTG}, {self.tech}, {len(self.track)} points)"
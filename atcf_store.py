@@ -0,0 +1,112 @@
+import os
+import bisect
+import numpy as np
+
+# In-memory store of the forecast and CARQ records of each storm.
+# Records are kept in (DTG, technum, tech) order as they are added, by
+# bisect insertion on a parallel list of keys, and each track in tau order,
+# so adding a record costs a search and an insert instead of a sort of the
+# whole storm, and a writer can stream a storm's records out as they are.
+# Example of how to use
+#   store = StormStore()
+#   store.add('WP052024', fcst, replace=True)
+#   for fcst in store.query('WP052024', '2024091000', '2024091118', tech='RJTD'):
+#       print(fcst.DTG, fcst.tech)
+#   text = render_forecasts(store.forecasts('WP052024'))
+
+# Constants
+FCST = 'fcst'
+CARQ = 'carq'
+
+
+def record_key(record):
+    """Order of a record within its storm: DTG, technum, tech"""
+    return (str(record.DTG).strip(), int(record.technum or 0), record.tech.strip())
+
+
+def storm_id(atfile):
+    """ATCF ID of an A-deck from its file name, A<atcfid>.<ext>"""
+    return os.path.splitext(os.path.basename(atfile))[0][1:]
+
+
+class StormRecords:
+    """Records of one kind for one storm, with their keys in a parallel sorted list"""
+    __slots__ = ('keys', 'records')
+
+    def __init__(self):
+        self.keys = []
+        self.records = []
+
+
+class StormStore:
+    """Forecast and CARQ records keyed by ATCF ID, each storm kept in (DTG, technum, tech, tau) order"""
+    def __init__(self):
+        self.storms = {}  # (atcfid, kind) -> StormRecords
+
+    def add(self, atcfid, record, kind=FCST, replace=False):
+        """Insert a record in order and return its position.
+
+        With replace a record with the same DTG, technum and tech takes the place of the one held,
+        otherwise it goes after it.
+        """
+        track = record.track
+        if len(track) > 1 and np.any(np.diff(track.tau) < 0):
+            record.track = track[np.argsort(track.tau, kind='stable')]
+        storm = self.storms.setdefault((atcfid, kind), StormRecords())
+        key = record_key(record)
+        i = bisect.bisect_left(storm.keys, key)
+        if replace and i < len(storm.keys) and storm.keys[i] == key:
+            storm.records[i] = record
+            return i
+        i = bisect.bisect_right(storm.keys, key, i)
+        storm.keys.insert(i, key)
+        storm.records.insert(i, record)
+        return i
+
+    def add_carq(self, atcfid, record, replace=False):
+        return self.add(atcfid, record, CARQ, replace)
+
+    def records(self, atcfid, kind=FCST):
+        """Records of a storm in order"""
+        storm = self.storms.get((atcfid, kind))
+        return list(storm.records) if storm else []
+
+    def forecasts(self, atcfid):
+        return self.records(atcfid, FCST)
+
+    def carqs(self, atcfid):
+        return self.records(atcfid, CARQ)
+
+    def query(self, atcfid, start=None, end=None, tech=None, kind=FCST):
+        """Yield in order the records of a storm with start <= DTG <= end, of tech when given"""
+        storm = self.storms.get((atcfid, kind))
+        if storm is None:
+            return
+        lo = bisect.bisect_left(storm.keys, (start,)) if start else 0
+        hi = bisect.bisect_right(storm.keys, (end, float('inf'))) if end else len(storm.keys)
+        tech = tech.strip() if tech else None
+        for i in range(lo, hi):
+            if tech is None or storm.keys[i][2] == tech:
+                yield storm.records[i]
+
+    def count(self, atcfid, kind=FCST):
+        storm = self.storms.get((atcfid, kind))
+        return len(storm.keys) if storm else 0
+
+    def atcfids(self):
+        """ATCF IDs holding records, sorted"""
+        return sorted(set(atcfid for atcfid, _ in self.storms))
+
+    def remove(self, atcfid):
+        """Drop every record of a storm"""
+        for kind in (FCST, CARQ):
+            self.storms.pop((atcfid, kind), None)
+
+    def clear(self):
+        self.storms = {}
+
+    def __contains__(self, atcfid):
+        return (atcfid, FCST) in self.storms or (atcfid, CARQ) in self.storms
+
+    def __len__(self):
+        return sum(len(storm.keys) for storm in self.storms.values())
@@ -0,0 +1,109 @@
+import bisect
+import numpy as np
+
+# DTG timeline shared by the decoders.
+# A time is an integer count of hours since 1900010100, so two DTGs are the
+# same forecast time exactly when their hours are equal and a track's valid
+# times are its DTG hours plus its taus. Conversions go through a table of
+# the hour each month of EPOCH_YEAR..LAST_YEAR starts at, without building
+# datetime objects, and have NumPy forms that convert whole arrays at once.
+# Example of how to use
+#   now = dtg_hours(2024, 9, 10, 12)
+#   yy, mm = previous_month(2025, 1)   # A bulletin day after today is last month's, here 2024 12
+#   if now == dtg_to_hours(fcst.DTG):
+#       print("Same forecast time")
+#   valid = track_hours(fcst.jdnow, fcst.track.tau)
+#   print(hours_to_dtgs(valid))
+
+# Constants
+EPOCH_YEAR = 1900
+LAST_YEAR = 2199
+MONTH_DAYS = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def month_start_table():
+    """Hour each month of EPOCH_YEAR..LAST_YEAR starts at, shape (years, 12)"""
+    years = np.arange(EPOCH_YEAR, LAST_YEAR + 1)
+    leap = (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+    days = np.tile(MONTH_DAYS, (len(years), 1))
+    days[leap, 1] = 29
+    starts = np.concatenate([[0], np.cumsum(days.ravel())[:-1]]) * 24
+    return starts.reshape(len(years), 12)
+
+
+MONTH_START = month_start_table()
+MONTH_START_LIST = MONTH_START.tolist()  # Plain lists index faster than the array for single values
+MONTH_START_FLAT = MONTH_START.ravel()
+MONTH_START_FLAT_LIST = MONTH_START_FLAT.tolist()
+MONTH_TEXT = [f"{EPOCH_YEAR + month // 12:04d}{month % 12 + 1:02d}" for month in range(len(MONTH_START_FLAT_LIST))]
+MONTH_HOURS = dict(zip(MONTH_TEXT, MONTH_START_FLAT_LIST))  # 'YYYYMM' -> hour the month starts at
+DAY_HOUR_TEXT = [f"{day + 1:02d}{hour:02d}" for day in range(31) for hour in range(24)]
+DAY_HOURS = {text: i for i, text in enumerate(DAY_HOUR_TEXT)}  # 'DDHH' -> hours into the month
+
+
+def month_days(yy, mm):
+    """Days in month mm of year yy"""
+    if mm == 12:
+        return 31
+    starts = MONTH_START_LIST[yy - EPOCH_YEAR]
+    return (starts[mm] - starts[mm - 1]) // 24
+
+
+def previous_month(yy, mm):
+    """Year and month before month mm of year yy, December of the year before for January"""
+    return (yy - 1, 12) if mm == 1 else (yy, mm - 1)
+
+
+def dtg_hours(yy, mm, dd, hh):
+    """Hours since the epoch of a year, month, day and hour, ValueError for a date that does not exist"""
+    if not EPOCH_YEAR <= yy <= LAST_YEAR:
+        raise ValueError(f"year {yy} is not in {EPOCH_YEAR} to {LAST_YEAR}")
+    if not 1 <= mm <= 12:
+        raise ValueError(f"month {mm} of {yy} is not 1 to 12")
+    if not 1 <= dd <= month_days(yy, mm):
+        raise ValueError(f"{yy}-{mm:02d} has no day {dd}")
+    return MONTH_START_LIST[yy - EPOCH_YEAR][mm - 1] + dd * 24 - 24 + int(hh)
+
+
+def dtg_to_hours(dtg):
+    """Hours since the epoch of a YYYYMMDDHH DTG"""
+    return MONTH_HOURS[dtg[:6]] + DAY_HOURS[dtg[6:10]]
+
+
+def hours_to_parts(hours):
+    """Year, month, day and hour of hours since the epoch"""
+    month = bisect.bisect_right(MONTH_START_FLAT_LIST, hours) - 1
+    rest = int(hours) - MONTH_START_FLAT_LIST[month]
+    return EPOCH_YEAR + month // 12, month % 12 + 1, rest // 24 + 1, rest % 24
+
+
+def hours_to_dtg(hours):
+    """YYYYMMDDHH DTG of hours since the epoch"""
+    month = bisect.bisect_right(MONTH_START_FLAT_LIST, hours) - 1
+    return MONTH_TEXT[month] + DAY_HOUR_TEXT[int(hours) - MONTH_START_FLAT_LIST[month]]
+
+
+def dtg_hours_array(yy, mm, dd, hh):
+    """dtg_hours of arrays of years, months, days and hours"""
+    yy, mm, dd, hh = (np.asarray(part, dtype=np.int64) for part in (yy, mm, dd, hh))
+    return MONTH_START[yy - EPOCH_YEAR, mm - 1] + (dd - 1) * 24 + hh
+
+
+def dtgs_to_hours(dtgs):
+    """dtg_to_hours of an array of DTG strings"""
+    n = np.char.strip(np.asarray(dtgs, dtype='U10')).astype(np.int64)
+    return dtg_hours_array(n // 1000000, n // 10000 % 100, n // 100 % 100, n % 100)
+
+
+def hours_to_dtgs(hours):
+    """hours_to_dtg of an array of hours, as an array of DTG strings"""
+    hours = np.asarray(hours, dtype=np.int64)
+    month = np.searchsorted(MONTH_START_FLAT, hours, side='right') - 1
+    rest = hours - MONTH_START_FLAT[month]
+    n = (EPOCH_YEAR + month // 12) * 1000000 + (month % 12 + 1) * 10000 + (rest // 24 + 1) * 100 + rest % 24
+    return n.astype('U10')
+
+
+def track_hours(hours, taus):
+    """Valid times of a track, in hours since the epoch, from its DTG hours and taus"""
+    return np.asarray(taus, dtype=np.int64) + int(hours)
@@ -0,0 +1,247 @@
+import os
+import heapq
+import itertools
+import numpy as np
+from atcf_record import TRACK_DTYPE, RADII_WINDS, MISSING
+from atomic_file import locked, atomic_open
+from atcf_offsets import OFFSET_SUFFIX, OffsetIndex, offsets_current, append_offsets
+from atcf_archive import archive_for, stream_name
+
+# Incremental A-deck writer.
+# A-decks are kept sorted by DTG, as the StormStore orders them, and a
+# new forecast is nearly always later than everything already in the file,
+# so its lines are appended without touching the rest of the file. Only a
+# forecast that arrives out of order makes the file be read and rewritten,
+# merged in DTG order. update_adeck returns, and prints, which it did.
+# Example of how to use
+#   path = update_adeck('AWP052024.dat', forecast_lines(fcst))
+#   if path == MERGE:
+#       print("Late forecast merged into the A-deck")
+# Lines are rendered a batch of forecasts at a time: the tracks are joined
+# into columns, the missing and placeholder values are masked out of whole
+# columns, and every line of the batch is filled from one format string in
+# a single pass, giving one string for one write().
+#   with atomic_open(atfile) as f:
+#       f.write(render_forecasts(fcsts))
+
+# Constants
+APPEND = 'append'
+MERGE = 'merge'
+TAIL_BLOCK = 4096  # Bytes read at a time from the end of the file to find its last line
+PLACEHOLDER = 1e100  # Value some BUFR sources give for a missing position
+STANDARD_HEAD = "{}, {:02d}, {}, {:02d}, {:>4s}, "  # basin, cy, DTG, technum, tech
+STANDARD_LINE = ("{}{:3d}, {:3d}{}, {:4d}{}, {:3d}, {:4d}, {:>2s}, {:>3s}, NEQ, "
+                 "{:4d}, {:4d}, {:4d}, {:4d},     ,     , {:3d}{}\n")
+
+
+def format_lat(lat):
+    return f"{int(round(abs(lat) * 10)):d}{'N' if lat >= 0 else 'S'}"
+
+
+def format_lon(lon):
+    return f"{int(round(abs(lon) * 10)):d}{'E' if lon >= 0 else 'W'}"
+
+
+def missing_zero(value):
+    """ATCF integer column, 0 when the value is missing"""
+    return 0 if value == MISSING else int(value)
+
+
+def valid_rows(*columns):
+    """Mask of the rows where none of the columns is missing (-999) or a placeholder (+-1e100)"""
+    keep = np.ones(np.shape(columns[0]), dtype=bool)
+    for column in columns:
+        column = np.asarray(column)
+        keep &= (column != MISSING) & (np.abs(column) != PLACEHOLDER)
+    return keep
+
+
+def tenths(values, rounded=False):
+    """Whole tenths of degrees of a lat or lon column, truncated unless rounded"""
+    values = np.abs(np.asarray(values, dtype=float)) * 10
+    return (np.rint(values) if rounded else values).astype(np.int64)
+
+
+def hemisphere(values, positive, negative):
+    """Hemisphere letter column of a lat or lon column"""
+    return np.where(np.asarray(values) >= 0, positive, negative)
+
+
+def zero_missing(values):
+    """Integer column with the missing values as 0"""
+    values = np.asarray(values)
+    return np.where(values == MISSING, 0, values).astype(np.int64)
+
+
+def format_column(column_format, values, blank=None):
+    """Column of values each formatted with column_format, blank where the value is missing"""
+    return [blank if blank is not None and value == MISSING else column_format.format(value)
+            for value in np.asarray(values).tolist()]
+
+
+def render_lines(line_format, columns):
+    """Lines of line_format filled in row by row from columns, in one pass.
+
+    A column is an array or list with a value per row, or a single value used on every row.
+    """
+    values = [itertools.repeat(column) if np.ndim(column) == 0 else
+              (column.tolist() if isinstance(column, np.ndarray) else column)
+              for column in columns]
+    return list(map(line_format.format, *values))
+
+
+def track_columns(fcsts):
+    """Track rows of a batch of forecasts as one TRACK_DTYPE array, and the forecast each row belongs to"""
+    tracks = [fcst.track.data for fcst in fcsts]
+    data = np.concatenate(tracks) if tracks else np.zeros(0, dtype=TRACK_DTYPE)
+    owner = np.repeat(np.arange(len(tracks)), [len(track) for track in tracks])
+    return data, owner
+
+
+def record_column(fcsts, owner, value):
+    """Column of value(fcst) for each track row, from the forecast owning the row"""
+    return np.array([value(fcst) for fcst in fcsts] or [''], dtype=object)[owner]
+
+
+def radii_rows(radii, keep):
+    """Row and wind threshold of each line of the kept points: one per threshold with radii, at least the 34 kt one"""
+    has = radii.any(axis=2)
+    has[:, 0] |= ~has.any(axis=1)
+    has &= keep[:, None]
+    return np.nonzero(has)
+
+
+def render_forecasts(fcsts):
+    """Standard A-deck lines of a batch of ForecastRecords as one string, one line per tau and further radii threshold"""
+    data, owner = track_columns(fcsts)
+    rows, winds = radii_rows(data['radii'], data['lat'] != MISSING)
+    data, owner = data[rows], owner[rows]
+    radii = data['radii'][np.arange(len(rows)), winds]
+    lat, lon = data['lat'], data['lon']
+    return ''.join(render_lines(STANDARD_LINE, [
+        record_column(fcsts, owner, lambda f: STANDARD_HEAD.format(f.basin, int(f.cyNum), f.DTG, int(f.technum), f.tech)),
+        data['tau'], tenths(lat, True), hemisphere(lat, 'N', 'S'), tenths(lon, True), hemisphere(lon, 'E', 'W'),
+        zero_missing(data['vmax']), zero_missing(data['mslp']), data['ty'], np.array(RADII_WINDS)[winds],
+        radii[:, 0], radii[:, 1], radii[:, 2], radii[:, 3], zero_missing(data['mrd']),
+        record_column(fcsts, owner, lambda f: f", , , , , , , {f.stormname}" if f.stormname else "")]))
+
+
+def forecast_lines(fcst):
+    """Standard A-deck lines of a ForecastRecord, one per tau plus one per further wind radii threshold"""
+    return render_forecasts([fcst]).splitlines(keepends=True)
+
+
+def line_key(line):
+    """Sort key of an A-deck line, its DTG, lines of one DTG keep the order they were written in"""
+    fields = line.split(',', 3)
+    return fields[2].strip() if len(fields) > 3 else ''
+
+
+def line_forecast(line):
+    """(DTG, tech) of an A-deck line, the forecast it belongs to"""
+    fields = line.split(',', 5)
+    return (fields[2].strip(), fields[4].strip()) if len(fields) > 5 else ('', '')
+
+
+def read_tail_line(atfile):
+    """Last non-blank line of a file, None when the file is missing or empty"""
+    try:
+        f = open(atfile, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        end = f.seek(0, 2)
+        pos = end
+        block = b''
+        while pos > 0:
+            size = min(TAIL_BLOCK, pos)
+            pos -= size
+            f.seek(pos)
+            block = f.read(size) + block
+            lines = block.rstrip().split(b'\n')
+            if len(lines) > 1 or pos == 0:
+                last = lines[-1].decode('ascii', 'replace')
+                return last if last.strip() else None
+    return None
+
+
+def merge_lines(existing, lines, replace=False):
+    """Lines of an A-deck with the sorted new lines merged in, in DTG order.
+
+    replace=True drops the existing lines of the forecasts (DTG and tech) that lines has.
+    """
+    existing = [line if line.endswith('\n') else line + '\n' for line in existing if line.strip()]
+    if replace:
+        forecasts = set(map(line_forecast, lines))
+        existing = [line for line in existing if line_forecast(line) not in forecasts]
+    if any(line_key(a) > line_key(b) for a, b in zip(existing, existing[1:])):
+        existing.sort(key=line_key)
+    return list(heapq.merge(existing, lines, key=line_key))
+
+
+def appends_after(last, lines, replace=False):
+    """True when sorted lines can go after last, the last line of an A-deck; with replace they must sort after it"""
+    if last is None:
+        return True
+    return line_key(last) < line_key(lines[0]) if replace else line_key(last) <= line_key(lines[0])
+
+
+def update_adeck(atfile, lines, replace=False):
+    """Add lines to an A-deck, appending when they sort at or after its last line and merge-rewriting otherwise.
+
+    replace=True first drops the lines the A-deck has of the same forecasts (DTG and tech), so a
+    decoder run again over its input rewrites its forecasts instead of adding them twice.
+    The A-deck is a stream of its season archive when the archive backend is on.
+    Returns APPEND or MERGE, or None when there was nothing to write.
+    """
+    if not lines:
+        return None
+    lines = sorted(lines, key=line_key)
+    archive = archive_for(atfile)
+    if archive is not None:
+        return update_archived_adeck(archive, stream_name(atfile), lines, replace)
+    # The storm lock is held from reading the tail to the write, so no other decoder can slip lines in between
+    with locked(atfile):
+        last = read_tail_line(atfile)
+        if appends_after(last, lines, replace):
+            # Checked before the write, which would make any index look out of date
+            offsets = offsets_current(atfile)
+            with open(atfile, 'ab+') as f:
+                # Keep the new lines off an unterminated last line
+                if f.seek(0, 2) > 0:
+                    f.seek(-1, 2)
+                    if f.read(1) != b'\n':
+                        f.write(b'\n')
+                start = f.tell()
+                f.write(''.join(lines).encode('ascii', 'replace'))
+            if offsets:
+                append_offsets(atfile, start, lines, line_key(last) if last else None)
+            print(f"Appended {len(lines)} lines to {atfile}")
+            return APPEND
+
+        with open(atfile, 'r') as f:
+            merged = merge_lines(f, lines, replace)
+        with atomic_open(atfile, lock=False) as f:
+            f.write(''.join(merged))
+        if os.path.exists(atfile + OFFSET_SUFFIX):
+            OffsetIndex(atfile)  # Older than the rewritten A-deck, so it is rebuilt on load
+    print(f"Merged {len(lines)} out of order lines into {atfile}, rewrote {len(merged)} lines")
+    return MERGE
+
+
+def update_archived_adeck(archive, stream, lines, replace=False):
+    """update_adeck of an A-deck kept as a stream of a SeasonArchive, an append or a rewrite being a new chunk"""
+    with locked(archive.path):
+        archive.load(lock=False)  # Chunks other writers added since archive_for loaded it
+        tail = archive.tail(stream)
+        last = tail.rstrip().split('\n')[-1] if tail.strip() else None
+        if appends_after(last, lines, replace):
+            text = ''.join(lines)
+            archive.append(stream, text if not tail or tail.endswith('\n') else '\n' + text, lock=False)
+            print(f"Appended {len(lines)} lines to {stream} in {archive.path}")
+            return APPEND
+
+        merged = merge_lines(archive.read(stream).splitlines(True), lines, replace)
+        archive.write(stream, ''.join(merged), lock=False)
+    print(f"Merged {len(lines)} out of order lines into {stream} in {archive.path}, rewrote {len(merged)} lines")
+    return MERGE
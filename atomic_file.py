@@ -0,0 +1,123 @@
+import os
+import contextlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # No advisory locks off POSIX, writes are still atomic
+
+# Atomic, locked writes of the A-decks, xref files and update lists, so
+# several decoders can update the same storm at once.
+# Every file has an advisory lock on .locks/<file>.lock, in one hidden lock
+# directory beside it rather than a lock file per output (the file itself
+# is replaced on each rewrite, so it cannot carry the lock). A rewrite goes to
+# a temp file in the same directory that is renamed over the file, so a
+# reader sees the old or the new file and never a partial one. Appends are
+# made under the lock, so lines from two writers never interleave.
+# A sidecar index starts with the stamp, size and mtime in nanoseconds, of
+# the file it was made from. It is out of date when the file's stamp
+# differs, which a coarse mtime alone can miss. The stamp is fixed width,
+# so an append to the sidecar rewrites it in place.
+# Example of how to use
+#   with atomic_open('AWP052024.dat') as f:
+#       f.write(''.join(lines))
+#   with locked_append('jma_updated.dat') as f:
+#       f.write('WP052024\n')
+
+# Constants
+LOCK_DIR = '.locks'
+LOCK_SUFFIX = '.lock'
+STAMP_FORMAT = "@ {:020d} {:020d}\n"  # Size and mtime_ns of the file a sidecar was made from
+
+
+def lock_file(path):
+    """Lock file of path, in the lock directory of its directory"""
+    lockdir = os.path.join(os.path.dirname(path), LOCK_DIR)
+    os.makedirs(lockdir, exist_ok=True)
+    return os.path.join(lockdir, os.path.basename(path) + LOCK_SUFFIX)
+
+
+@contextlib.contextmanager
+def locked(path, shared=False):
+    """Hold the advisory lock of path for the block, exclusive unless shared.
+
+    Locks are per open file, so a process must not take the lock of a path it already holds.
+    """
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(lock_file(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def atomic_open(path, mode='w', lock=True):
+    """File to write the new contents of path to, renamed over path when the block ends without error.
+
+    lock=False when the caller already holds the lock of path.
+    """
+    tmpfile = f"{path}.{os.getpid()}.tmp"
+    with locked(path) if lock else contextlib.nullcontext():
+        try:
+            with open(tmpfile, mode) as f:
+                yield f
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmpfile, path)
+        finally:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+
+
+@contextlib.contextmanager
+def locked_append(path):
+    """File opened to append to path, under its lock"""
+    with locked(path):
+        with open(path, 'a') as f:
+            yield f
+
+
+def file_stamp(path):
+    """(size, mtime_ns) of a file, (0, 0) when it does not exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return (0, 0)
+    return (st.st_size, st.st_mtime_ns)
+
+
+def stamp_line(stamp):
+    """First line of a sidecar made from a file of stamp"""
+    return STAMP_FORMAT.format(*stamp)
+
+
+def read_stamp(line):
+    """Stamp of the first line of a sidecar, None when it has none"""
+    parts = line.split()
+    if len(parts) != 3 or parts[0] != '@' or not (parts[1].isdigit() and parts[2].isdigit()):
+        return None
+    return (int(parts[1]), int(parts[2]))
+
+
+def sidecar_stamp(path):
+    """Stamp of the file a sidecar was made from, None when the sidecar is missing or has none"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', errors='replace') as f:
+        return read_stamp(f.readline())
+
+
+def append_stamped(path, text, stamp):
+    """Append text to a sidecar that has a stamp, under its lock, and set the stamp"""
+    with locked(path):
+        with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+            if f.seek(0, 2) == 0:
+                f.write(stamp_line(stamp).encode('ascii'))
+            f.write(text.encode('ascii', 'replace'))
+            f.seek(0)
+            f.write(stamp_line(stamp).encode('ascii'))
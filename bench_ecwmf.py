@@ -0,0 +1,173 @@
+import sys
+import os
+import io
+import time
+import shutil
+import fnmatch
+import tempfile
+import resource
+import contextlib
+import dc_ecwmf
+
+# Example of how to run file
+# python3 make_tc_bufr.py -out cycle.bufr -storms 50 -members 52 -cycles 50
+# python3 bench_ecwmf.py -in cycle.bufr [-ensemble] [-numpy] [-repeat 3]
+# Times dc_ecwmf.ATCFDecoder.decode_ecmf_bufr, writing the A-decks to a scratch directory
+
+# Stages timed inside decode_ecmf_bufr, with the methods that make them up
+STAGES = (('unpack', ('unpack_raw_message',)),
+          ('extract', ('build_track_arrays',)),
+          ('match', ('match_atcf_id',)),
+          ('write', ('write_storm_records', 'write_ensemble_records')))
+
+
+class DecodeProfile:
+    """Call counts and inclusive times of the decoder methods and the ecCodes functions it uses"""
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.codes_calls = 0
+        self.saved = []
+
+    def wrap_method(self, decoder, name):
+        method = getattr(decoder, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+                self.calls[name] = self.calls.get(name, 0) + 1
+        setattr(decoder, name, timed)
+
+    def install(self, decoder):
+        """Wrap the stage methods of one decoder and every codes_* function dc_ecwmf calls"""
+        for _, names in STAGES:
+            for name in names:
+                self.wrap_method(decoder, name)
+        for name in dir(dc_ecwmf):
+            func = getattr(dc_ecwmf, name)
+            if name.startswith('codes_') and callable(func):
+                self.saved.append((name, func))
+                setattr(dc_ecwmf, name, self.counted(func))
+
+    def counted(self, func):
+        def counting(*args, **kwargs):
+            self.codes_calls += 1
+            return func(*args, **kwargs)
+        return counting
+
+    def uninstall(self):
+        for name, func in self.saved:
+            setattr(dc_ecwmf, name, func)
+        self.saved = []
+
+    def stage_seconds(self):
+        """Exclusive time per stage, unpack excludes the extraction it calls"""
+        seconds = {stage: sum(self.seconds.get(name, 0.0) for name in names) for stage, names in STAGES}
+        seconds['unpack'] = max(0.0, seconds['unpack'] - seconds['extract'])
+        return seconds
+
+
+def count_messages(infile):
+    with dc_ecwmf.BufrIndex(infile) as index:
+        return len(index)
+
+
+def bench_decode(infile, ensemble=False, numpy_decode=False, jobs=1, cachedir=None, workdir=None):
+    """Run decode_ecmf_bufr once with its output silenced, returning the elapsed time and the profile"""
+    decoder = dc_ecwmf.ATCFDecoder()
+    profile = DecodeProfile()
+    profile.install(decoder)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            decoder.decode_ecmf_bufr(infile, ensemble=ensemble, jobs=jobs, cachedir=cachedir,
+                                     numpy_decode=numpy_decode)
+            elapsed = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        profile.uninstall()
+    return elapsed, profile
+
+
+def report(nmsg, elapsed, profile, jobs=1):
+    """Print messages per second, ecCodes calls per message and the time per stage"""
+    print(f"  {nmsg} messages in {elapsed:.3f} s, {nmsg / elapsed if elapsed > 0 else 0.0:.1f} msgs/sec")
+    print(f"  ecCodes calls per message: {profile.codes_calls / max(nmsg, 1):.1f}")
+    seconds = profile.stage_seconds()
+    for stage, _ in STAGES:
+        share = 100.0 * seconds[stage] / elapsed if elapsed > 0 else 0.0
+        print(f"  {stage:8s} {seconds[stage]:8.3f} s {1000.0 * seconds[stage] / max(nmsg, 1):8.3f} ms/msg {share:5.1f}%")
+    other = max(0.0, elapsed - sum(seconds.values()))
+    print(f"  {'other':8s} {other:8.3f} s")
+    if jobs > 1:
+        print("  *Caution* unpack and extract run in the worker processes and are not counted with -jobs")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python bench_ecwmf.py -in <input_file> [-ensemble] [-numpy] [-jobs <n>] [-cache <dir>] [-repeat <n>]")
+        return
+
+    # Parse command line arguments
+    infile = ''
+    ensemble = False
+    numpy_decode = False
+    jobs = 1
+    cachedir = None
+    repeat = 1
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "-in":
+            i += 1
+            infile = sys.argv[i]
+        elif sys.argv[i] == "-ensemble":
+            ensemble = True
+        elif sys.argv[i] == "-numpy":
+            numpy_decode = True
+        elif sys.argv[i] == "-jobs":
+            i += 1
+            jobs = int(sys.argv[i])
+        elif sys.argv[i] == "-cache":
+            i += 1
+            cachedir = os.path.abspath(sys.argv[i])
+        elif sys.argv[i] == "-repeat":
+            i += 1
+            repeat = int(sys.argv[i])
+        i += 1
+
+    if not os.path.exists(infile):
+        print(f"*Error* {infile} does not exist!")
+        return
+    infile = os.path.abspath(infile)
+    nmsg = count_messages(infile)
+    workdir = tempfile.mkdtemp(prefix='bench_ecwmf_')
+    print(f"Benchmarking {infile}: {nmsg} messages, ensemble={ensemble}, numpy={numpy_decode}, jobs={jobs}")
+    try:
+        best = None
+        for run in range(repeat):
+            elapsed, profile = bench_decode(infile, ensemble, numpy_decode, jobs, cachedir, workdir)
+            print(f"Run {run + 1}")
+            report(nmsg, elapsed, profile, jobs)
+            if best is None or elapsed < best:
+                best = elapsed
+        # Only the A-decks, not the .idx/.dtg sidecars or the lock directory
+        outputs = sorted(name for name in os.listdir(workdir) if fnmatch.fnmatch(name.lower(), 'a*.dat'))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss //= 1024
+    print(f"Best of {repeat}: {best:.3f} s, {nmsg / best if best > 0 else 0.0:.1f} msgs/sec")
+    print(f"Peak RSS: {maxrss / 1024:.1f} MB")
+    print(f"A-decks written: {len(outputs)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+import hashlib
+import numpy as np
+
+# On-disk cache of decoded BUFR messages, one .npz file per message keyed by
+# a digest of the raw message bytes, so a rerun over the same cycle files
+# does not have to unpack anything with ecCodes. The digest also covers
+# CACHE_VERSION, so a change to the decoders never serves results decoded
+# by the old code. A message the decoder skips (not a track message, or no
+# forecast periods) is stored as a small marker file, so a warm run skips
+# it without ecCodes too, while a decode that failed is not stored and is
+# tried again on the next run.
+
+# Constants
+CACHE_SUFFIX = '.npz'
+DEFAULT_CACHE_MB = 512
+CACHE_VERSION = 2  # Bump whenever the decoders or the layout of a decoded message change
+SKIPPED = '_skipped'  # Only array of the marker of a skipped message
+
+
+class BufrCache:
+    """Decoded message arrays stored as <digest>.npz with least recently used eviction"""
+    def __init__(self, cachedir, max_mb=DEFAULT_CACHE_MB, version=CACHE_VERSION):
+        self.cachedir = cachedir
+        self.version = version
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cachedir, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in self.entries())
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """All cache files in the cache directory"""
+        with os.scandir(self.cachedir) as it:
+            return [entry for entry in it if entry.name.endswith(CACHE_SUFFIX)]
+
+    def key(self, message):
+        """Digest of the decoder version and the raw message bytes"""
+        digest = hashlib.blake2b(f"v{self.version}:".encode('ascii'), digest_size=20)
+        digest.update(message)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cachedir, key + CACHE_SUFFIX)
+
+    def get(self, key):
+        """Return (found, decoded message), the message None when it is one the decoder skips"""
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                msg = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            self.misses += 1
+            return False, None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        self.hits += 1
+        if SKIPPED in msg:
+            return True, None
+
+        for name, value in msg.items():
+            if value.ndim == 0:
+                # Scalars such as year and stormIdentifier are stored as 0-d arrays
+                msg[name] = value.item()
+        return True, msg
+
+    def put(self, key, msg):
+        """Store a decoded message, a skip marker for None, and nothing for a failed decode (False)"""
+        if msg is False:
+            return
+        arrays = {SKIPPED: np.asarray(True)} if msg is None else {name: np.asarray(value) for name, value in msg.items()}
+        path = self.path(key)
+        tmpfile = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmpfile, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmpfile, path)
+            self.size += os.path.getsize(path)
+        except OSError as e:
+            print(f"*Caution* could not write cache file {path}: {e}")
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            return
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used files until the cache is below 90% of its cap"""
+        entries = []
+        for entry in self.entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # Evicted by another process
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        self.size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
@@ -0,0 +1,237 @@
+import mmap
+
+# Index of the BUFR messages in a file, built from the section 0 length fields,
+# and framing of BUFR messages arriving on a stream
+# Example of how to use
+#   with BufrIndex('ECMWF_message.bufr') as index:
+#       for n in index.select(centre=98, storm='05W'):
+#           ibufr = index.new_handle(n)
+
+# Constants
+BUFR_START = b'BUFR'
+BUFR_END = b'7777'
+TC_TRACK_SEQUENCE = (3, 16, 82)  # ECMWF tropical cyclone track template 3 16 082
+
+
+class BufrMessage:
+    """Location and header keys of one BUFR message"""
+    def __init__(self, offset, length, edition):
+        self.offset = offset
+        self.length = length
+        self.edition = edition
+        self.centre = -1
+        self.subCentre = -1
+        self.dataCategory = -1
+        self.typicalDate = 0  # YYYYMMDD
+        self.typicalTime = 0  # HHMMSS
+        self.numberOfSubsets = 0
+        self.observedData = 0
+        self.compressedData = 0
+        self.unexpandedDescriptors = []
+        self.dataOffset = 0  # Absolute offset of section 4
+        self.stormIdentifier = None
+
+
+def read_uint(buf, pos, size):
+    """Read a big-endian unsigned integer of size octets"""
+    return int.from_bytes(buf[pos:pos + size], 'big')
+
+
+def read_bits(buf, bitpos, width):
+    """Read an unsigned integer width bits long starting at bit offset bitpos"""
+    first = bitpos // 8
+    last = (bitpos + width + 7) // 8
+    value = int.from_bytes(buf[first:last], 'big')
+    return (value >> (last * 8 - bitpos - width)) & ((1 << width) - 1)
+
+
+def read_header(buf, message):
+    """Read the section 1 and section 3 keys of a message in buf without decoding its data"""
+    sec1 = message.offset + 8 if message.edition >= 2 else message.offset + 4
+    sec1len = read_uint(buf, sec1, 3)
+    if message.edition >= 4:
+        message.centre = read_uint(buf, sec1 + 4, 2)
+        message.subCentre = read_uint(buf, sec1 + 6, 2)
+        hasSection2 = buf[sec1 + 9] & 0x80
+        message.dataCategory = buf[sec1 + 10]
+        year = read_uint(buf, sec1 + 15, 2)
+        month, day, hour, minute, second = buf[sec1 + 17:sec1 + 22]
+    else:
+        message.subCentre = buf[sec1 + 4]
+        message.centre = buf[sec1 + 5]
+        hasSection2 = buf[sec1 + 7] & 0x80
+        message.dataCategory = buf[sec1 + 8]
+        year = buf[sec1 + 12]
+        year += 2000 if year <= 50 else 1900
+        month, day, hour, minute = buf[sec1 + 13:sec1 + 17]
+        second = 0
+    message.typicalDate = year * 10000 + month * 100 + day
+    message.typicalTime = hour * 10000 + minute * 100 + second
+
+    sec3 = sec1 + sec1len
+    if hasSection2:
+        sec3 += read_uint(buf, sec3, 3)
+    sec3len = read_uint(buf, sec3, 3)
+    message.numberOfSubsets = read_uint(buf, sec3 + 4, 2)
+    flags = buf[sec3 + 6]
+    message.observedData = 1 if flags & 0x80 else 0
+    message.compressedData = 1 if flags & 0x40 else 0
+    descriptors = []
+    for pos in range(sec3 + 7, sec3 + sec3len - 1, 2):
+        fx, y = buf[pos], buf[pos + 1]
+        descriptors.append((fx >> 6, fx & 0x3F, y))
+    message.unexpandedDescriptors = descriptors
+    message.dataOffset = sec3 + sec3len
+    message.stormIdentifier = read_storm_identifier(buf, message)
+
+
+def read_storm_identifier(buf, message):
+    """Read the storm identifier (0 01 025) that leads the ECMWF tropical cyclone template.
+
+    The template starts with centre, sub-centre and generating application
+    (8 bits each) followed by the 3 character storm identifier, so it can be
+    picked out of section 4 without expanding the rest of the data.
+    Returns None for any other template.
+    """
+    if message.unexpandedDescriptors != [TC_TRACK_SEQUENCE]:
+        return None
+    bitpos = (message.dataOffset + 4) * 8
+    if not message.compressedData:
+        bitpos += 3 * 8
+        ident = bytes(read_bits(buf, bitpos + 8 * i, 8) for i in range(3))
+        return ident.decode('ascii', 'replace').strip()
+
+    # Compressed: each element is a reference value, a 6 bit increment width and the increments
+    for _ in range(3):
+        bitpos += 8
+        nbinc = read_bits(buf, bitpos, 6)
+        bitpos += 6 + nbinc * message.numberOfSubsets
+    ident = bytes(read_bits(buf, bitpos + 8 * i, 8) for i in range(3))
+    nbinc = read_bits(buf, bitpos + 24, 6)
+    if nbinc != 0:
+        # Identifiers differ between subsets, report the first one
+        bitpos += 30
+        ident = bytes(read_bits(buf, bitpos + 8 * i, 8) for i in range(min(nbinc, 3)))
+    return ident.decode('ascii', 'replace').strip()
+
+
+def message_matches(message, centre=None, date=None, storm=None):
+    """True when the message header passes the filters, date as YYYYMMDD or YYYYMMDDHH"""
+    if centre is not None and message.centre != centre:
+        return False
+    if date is not None:
+        if date > 99999999:
+            if message.typicalDate * 100 + message.typicalTime // 10000 != date:
+                return False
+        elif message.typicalDate != date:
+            return False
+    if storm is not None and message.stormIdentifier is not None and message.stormIdentifier != storm:
+        return False
+    return True
+
+
+def read_stream(stream, chunk_size=65536):
+    """Yield the bytes of each BUFR message in a binary stream as soon as it is complete"""
+    # read1 returns whatever is available, so a pipe is not held up waiting for a full chunk
+    read = getattr(stream, 'read1', stream.read)
+    buf = bytearray()
+    eof = False
+    while True:
+        pos = buf.find(BUFR_START)
+        if pos < 0:
+            del buf[:max(0, len(buf) - 3)]  # Keep a partial 'BUFR' that may straddle reads
+        elif len(buf) >= pos + 8:
+            length = read_uint(buf, pos + 4, 3)
+            end = pos + length
+            if length < 8:
+                del buf[:pos + 1]
+                continue
+            if len(buf) >= end:
+                if buf[end - 4:end] == BUFR_END:
+                    message = bytes(buf[pos:end])
+                    del buf[:end]
+                    yield message
+                else:
+                    print("*Caution* corrupt BUFR message in stream")
+                    del buf[:pos + 1]
+                continue
+            if eof:
+                print("*Caution* incomplete BUFR message at end of stream")
+                del buf[:pos + 1]
+                continue
+        if eof:
+            return
+        chunk = read(chunk_size)
+        if not chunk:
+            eof = True
+        buf += chunk
+
+
+class BufrIndex:
+    """Memory mapped offset table of every BUFR...7777 message in a file"""
+    def __init__(self, infile):
+        self.infile = infile
+        self.file = open(infile, 'rb')
+        try:
+            self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self.buf = b''
+        self.messages = []
+        self.scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __getitem__(self, n):
+        return self.messages[n]
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def close(self):
+        """Release the memory map and the file"""
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self.file.close()
+
+    def scan(self):
+        """Build the offset table, skipping bulletin headers and corrupt messages"""
+        buf = self.buf
+        size = len(buf)
+        pos = buf.find(BUFR_START)
+        while pos >= 0 and pos + 8 <= size:
+            length = read_uint(buf, pos + 4, 3)
+            edition = buf[pos + 7]
+            end = pos + length
+            if length >= 8 and end <= size and buf[end - 4:end] == BUFR_END:
+                message = BufrMessage(pos, length, edition)
+                try:
+                    read_header(buf, message)
+                except IndexError:
+                    print(f"*Caution* bad BUFR header at offset {pos}")
+                self.messages.append(message)
+                pos = buf.find(BUFR_START, end)
+            else:
+                print(f"*Caution* incomplete BUFR message at offset {pos}")
+                pos = buf.find(BUFR_START, pos + 1)
+
+    def select(self, centre=None, date=None, storm=None):
+        """Message numbers matching the header filters, date as YYYYMMDD or YYYYMMDDHH"""
+        return [n for n, message in enumerate(self.messages) if message_matches(message, centre, date, storm)]
+
+    def message_view(self, n):
+        """Zero-copy view of the raw bytes of message n"""
+        message = self.messages[n]
+        return memoryview(self.buf)[message.offset:message.offset + message.length]
+
+    def new_handle(self, n):
+        """ecCodes handle for message n, the caller releases it"""
+        from eccodes import codes_new_from_message
+        return codes_new_from_message(self.message_view(n))
@@ -0,0 +1,240 @@
+import numpy as np
+from bufr_index import BufrMessage, TC_TRACK_SEQUENCE, read_header, read_uint, read_bits
+
+# Built-in decoder for the ECMWF tropical cyclone track template 3 16 082.
+# The template expands to a fixed descriptor sequence, so section 4 can be
+# unpacked with NumPy bit operations straight into the rank arrays that the
+# ecCodes path reads with codes_get_array. Anything that does not match the
+# template exactly decodes to None and is left to ecCodes.
+# Example of how to use
+#   ranks = decode_tc_message(data)
+#   if ranks is None:
+#       ibufr = codes_new_from_message(data)
+
+# Constants
+CODES_MISSING_DOUBLE = 1.0e100
+CODES_MISSING_LONG = 2147483647
+MAX_INCREMENT_WIDTH = 32  # Widest value read_bits_array can extract
+
+# Table B entries (key, width, scale, reference) in template order
+CENTRE = ('centre', 8, 0, 0)
+SUB_CENTRE = ('subCentre', 8, 0, 0)
+GENERATING_APPLICATION = ('generatingApplication', 8, 0, 0)
+STORM_IDENTIFIER = ('stormIdentifier', 24, 0, 0)
+LONG_STORM_NAME = ('longStormName', 80, 0, 0)
+TECHNIQUE = ('techniqueForMakingUpInitialPerturbations', 8, 0, 0)
+MEMBER = ('ensembleMemberNumber', 10, 0, 0)
+FORECAST_TYPE = ('ensembleForecastType', 8, 0, 0)
+YEAR = ('year', 12, 0, 0)
+MONTH = ('month', 4, 0, 0)
+DAY = ('day', 6, 0, 0)
+HOUR = ('hour', 5, 0, 0)
+MINUTE = ('minute', 6, 0, 0)
+SIGNIFICANCE = ('meteorologicalAttributeSignificance', 4, 0, 0)
+LATITUDE = ('latitude', 15, 2, -9000)
+LONGITUDE = ('longitude', 16, 2, -18000)
+PRESSURE = ('pressureReducedToMeanSeaLevel', 14, -1, 0)
+WIND = ('windSpeedAt10M', 12, 1, 0)
+WIND_THRESHOLD = ('windSpeedThreshold', 8, 0, 0)
+BEARING = ('bearingOrAzimuth', 16, 2, 0)
+RADIUS = ('effectiveRadiusWithRespectToWindSpeedsAboveThreshold', 15, -2, 0)
+REPLICATION = ('delayedDescriptorReplicationFactor', 8, 0, 0)
+TIME_SIGNIFICANCE = ('timeSignificance', 5, 0, 0)
+TIME_PERIOD = ('timePeriod', 12, 0, -2048)
+
+# Three wind speed thresholds, each with four quadrant radii
+WIND_RADII = ((WIND_THRESHOLD,) + (BEARING, BEARING, RADIUS) * 4) * 3
+CENTRE_PRESSURE = (SIGNIFICANCE, LATITUDE, LONGITUDE, PRESSURE)
+MAX_WIND = (SIGNIFICANCE, LATITUDE, LONGITUDE, WIND) + WIND_RADII
+HEADER = (CENTRE, SUB_CENTRE, GENERATING_APPLICATION, STORM_IDENTIFIER, LONG_STORM_NAME, TECHNIQUE,
+          MEMBER, FORECAST_TYPE, YEAR, MONTH, DAY, HOUR, MINUTE)
+ANALYSIS = (SIGNIFICANCE, LATITUDE, LONGITUDE) + CENTRE_PRESSURE + MAX_WIND
+FORECAST_PERIOD = (TIME_SIGNIFICANCE, TIME_PERIOD) + CENTRE_PRESSURE + MAX_WIND
+LEADING = HEADER + ANALYSIS + (REPLICATION,)
+
+STRING_KEYS = ('stormIdentifier', 'longStormName')
+INTEGER_KEYS = ('ensembleMemberNumber', 'ensembleForecastType', 'year', 'month', 'day', 'hour', 'minute',
+                'meteorologicalAttributeSignificance', 'timePeriod')
+FLOAT_KEYS = ('latitude', 'longitude', 'pressureReducedToMeanSeaLevel', 'windSpeedAt10M')
+RANK_KEYS = INTEGER_KEYS + FLOAT_KEYS
+
+
+def element_factor(scale):
+    """10**-scale built up the way ecCodes does, so decoded values match it bit for bit"""
+    factor = 1.0
+    for _ in range(scale):
+        factor /= 10
+    for _ in range(-scale):
+        factor *= 10
+    return factor
+
+
+def read_bits_array(data, bitpos, width):
+    """Vector form of read_bits for widths up to 32 bits, data padded with 5 zero octets"""
+    first = (bitpos >> 3).astype(np.intp)
+    word = np.zeros(first.shape, dtype=np.uint64)
+    for i in range(5):
+        word = (word << np.uint64(8)) | data[first + i]
+    width = np.asarray(width, dtype=np.uint64)
+    shift = np.uint64(40) - (bitpos & 7).astype(np.uint64) - width
+    return (word >> shift) & ((np.uint64(1) << width) - np.uint64(1))
+
+
+def decode_string(raw):
+    """CCITT IA5 characters up to the first null, an all ones field is missing"""
+    if raw and all(c == 0xFF for c in raw):
+        return ''
+    return raw.split(b'\0', 1)[0].decode('ascii', 'replace')
+
+
+def scale_values(key, raw, missing, scale, reference):
+    """Apply the reference and scale of an element, marking missing values as ecCodes does"""
+    if key in INTEGER_KEYS:
+        values = raw.astype(np.int64) + reference
+        return np.where(missing, CODES_MISSING_LONG, values)
+    values = (raw.astype(np.float64) + reference) * element_factor(scale)
+    return np.where(missing, CODES_MISSING_DOUBLE, values)
+
+
+def collect_ranks(elements, raw, missing, nsub):
+    """Group the decoded elements into (nsub, nranks) arrays per key, in template order"""
+    ranks = {}
+    for key in RANK_KEYS:
+        columns = [i for i, element in enumerate(elements) if element[0] == key]
+        if not columns:
+            ranks[key] = np.empty((nsub, 0), dtype=np.int64 if key in INTEGER_KEYS else np.float64)
+            continue
+        _, width, scale, reference = elements[columns[0]]
+        ranks[key] = scale_values(key, raw[:, columns], missing[:, columns], scale, reference)
+    return ranks
+
+
+def decode_uncompressed(buf, data, start, end, nsub):
+    """Subsets follow one another with the same layout, so every value sits at a computable bit offset"""
+    leading_bits = sum(element[1] for element in LEADING)
+    factor = read_bits(buf, start + leading_bits - REPLICATION[1], REPLICATION[1])
+    elements = LEADING + FORECAST_PERIOD * factor
+    widths = np.array([element[1] for element in elements], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(widths)[:-1]))
+    subset_bits = int(widths.sum())
+    if start + nsub * subset_bits > end:
+        return None
+    for k in range(1, nsub):
+        # Each subset carries its own replication factor, the layout only holds when they agree
+        if read_bits(buf, start + k * subset_bits + leading_bits - REPLICATION[1], REPLICATION[1]) != factor:
+            return None
+
+    wanted = [i for i, element in enumerate(elements) if element[0] in RANK_KEYS]
+    bitpos = start + np.arange(nsub)[:, np.newaxis] * subset_bits + offsets[wanted][np.newaxis, :]
+    raw = read_bits_array(data, bitpos, widths[wanted][np.newaxis, :])
+    missing = raw == (np.uint64(1) << widths[wanted].astype(np.uint64)) - np.uint64(1)
+    ranks = collect_ranks([elements[i] for i in wanted], raw, missing, nsub)
+
+    for element in (STORM_IDENTIFIER, LONG_STORM_NAME):
+        # ecCodes reports the last subset for a key that repeats in every subset
+        key, width = element[0], element[1]
+        pos = start + (nsub - 1) * subset_bits + int(offsets[elements.index(element)])
+        ranks[key] = decode_string(bytes(read_bits(buf, pos + 8 * i, 8) for i in range(width // 8)))
+    ranks['numberOfPeriods'] = factor + 1
+    return ranks, start + nsub * subset_bits
+
+
+def walk_compressed(buf, elements, bitpos, nsub, found):
+    """Step over compressed elements, noting where the wanted values and strings sit"""
+    for element in elements:
+        key, width = element[0], element[1]
+        r0pos = bitpos
+        nbinc = read_bits(buf, bitpos + width, 6)
+        bitpos += width + 6
+        if key in STRING_KEYS:
+            # Increments of character data are whole strings of nbinc octets
+            found.append((element, r0pos, 0, bitpos))
+            bitpos += nbinc * 8 * nsub
+            continue
+        if nbinc > MAX_INCREMENT_WIDTH:
+            return None
+        if key in RANK_KEYS or key == REPLICATION[0]:
+            found.append((element, r0pos, nbinc, bitpos))
+        bitpos += nbinc * nsub
+    return bitpos
+
+
+def decode_compressed(buf, data, start, end, nsub):
+    """Each element holds a reference value, a 6 bit increment width and one increment per subset"""
+    found = []
+    bitpos = walk_compressed(buf, LEADING, start, nsub, found)
+    if bitpos is None or bitpos > end:
+        return None
+    element, r0pos, nbinc, _ = found.pop()
+    factor = read_bits(buf, r0pos, REPLICATION[1])
+    if nbinc != 0:
+        # Replication factors must be the same in every subset
+        return None
+    bitpos = walk_compressed(buf, FORECAST_PERIOD * factor, bitpos, nsub, found)
+    if bitpos is None or bitpos > end:
+        return None
+
+    numeric = [item for item in found if item[0][0] not in STRING_KEYS]
+    widths = np.array([item[0][1] for item in numeric], dtype=np.uint64)
+    r0 = read_bits_array(data, np.array([item[1] for item in numeric], dtype=np.int64), widths)
+    nbinc = np.array([item[2] for item in numeric], dtype=np.int64)
+    incpos = (np.array([item[3] for item in numeric], dtype=np.int64)[:, np.newaxis] +
+              np.arange(nsub)[np.newaxis, :] * nbinc[:, np.newaxis])
+    inc = read_bits_array(data, incpos, nbinc[:, np.newaxis])
+    allOnes = (np.uint64(1) << nbinc.astype(np.uint64)) - np.uint64(1)
+    missing = np.where(nbinc[:, np.newaxis] == 0,
+                       (r0 == (np.uint64(1) << widths) - np.uint64(1))[:, np.newaxis],
+                       inc == allOnes[:, np.newaxis])
+    raw = r0[:, np.newaxis] + inc
+    ranks = collect_ranks([item[0] for item in numeric], raw.T, missing.T, nsub)
+
+    for (key, width, _, _), r0pos, _, incpos in (item for item in found if item[0][0] in STRING_KEYS):
+        nchars = read_bits(buf, r0pos + width, 6)
+        if nchars == 0:
+            value = bytes(read_bits(buf, r0pos + 8 * i, 8) for i in range(width // 8))
+        else:
+            # Strings differ between subsets, report the first one
+            value = bytes(read_bits(buf, incpos + 8 * i, 8) for i in range(nchars))
+        ranks[key] = decode_string(value)
+    ranks['numberOfPeriods'] = factor + 1
+    return ranks, bitpos
+
+
+def decode_tc_message(data):
+    """Rank arrays of an ECMWF tropical cyclone message, (nsub, nranks) per key, or None if not recognised.
+
+    Integer keys use CODES_MISSING_LONG and the others CODES_MISSING_DOUBLE
+    for missing values, matching what codes_get_array returns. The storm
+    identifier and name are strings from the subset codes_get would report.
+    """
+    try:
+        message = BufrMessage(0, len(data), data[7])
+        read_header(data, message)
+    except IndexError:
+        return None
+    if message.unexpandedDescriptors != [TC_TRACK_SEQUENCE] or message.numberOfSubsets < 1:
+        return None
+
+    buf = bytes(data)
+    seclen = read_uint(buf, message.dataOffset, 3)
+    start = (message.dataOffset + 4) * 8
+    end = (message.dataOffset + seclen) * 8
+    if message.dataOffset + seclen > len(buf):
+        return None
+    padded = np.frombuffer(buf + bytes(5), dtype=np.uint8)
+    try:
+        if message.compressedData:
+            decoded = decode_compressed(buf, padded, start, end, message.numberOfSubsets)
+        else:
+            decoded = decode_uncompressed(buf, padded, start, end, message.numberOfSubsets)
+    except IndexError:
+        return None
+    if decoded is None:
+        return None
+    ranks, bitpos = decoded
+    if end - bitpos >= 16:
+        # Section 4 is only ever padded to an even octet, more left over means the tables differ
+        return None
+    ranks['numberOfSubsets'] = message.numberOfSubsets
+    ranks['compressedData'] = message.compressedData
+    return ranks
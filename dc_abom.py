@@ -21,6 +21,9 @@ import sys
 import os
 import re
 from datetime import datetime
+from atcf_archive import output_open
+from atcf_record import ForecastRecord
+from atcf_ndjson import emit_forecasts, claim_stdout
 
 
 positions = []
@@ -54,7 +57,16 @@ def format_atcf_record(yy, mm, dd, hh, lat, ns, lon, ew, vmax, atcfid):
     return f"{atcfid}, {dtg}, 0, {lat_str}, {lon_str}, {vmax:03d}, , , , , , , , , , , ,"
 
 
+def position_record(pos):
+    """ForecastRecord of one position fix, with the DTG of its ATCF record, for the NDJSON sink"""
+    record = ForecastRecord(DTG=f"{pos['yy']:04d}{pos['mm']:02d}{pos['dd']:02d}{pos['hh']:02d}")
+    record.track.append(tau=0, lat=(-pos['lat'] if pos['ns'] == 'S' else pos['lat']) / 10.0,
+                        lon=(-pos['lon'] if pos['ew'] == 'W' else pos['lon']) / 10.0, vmax=pos['vmax'])
+    return record
+
+
 def main():
+    claim_stdout()
     print("\nABOM Technical Message to ATCF Track File Version 1.1")
     print("(BuildData placeholder)")
     print("(CopyrightData placeholder)")
@@ -142,11 +154,12 @@ def main():
     output_filename = f"{atcfid}.dat"
 
     try:
-        with open(output_filename, "w") as outf:
+        with output_open(output_filename) as outf:
             for pos in positions:
                 rec = format_atcf_record(pos['yy'], pos['mm'], pos['dd'], pos['hh'], pos['lat'], pos['ns'], pos['lon'], pos['ew'], pos['vmax'], atcfid)
                 print(rec)
                 outf.write(rec + "\n")
+        emit_forecasts([position_record(pos) for pos in positions], atcfid=atcfid)
         print(f"\nOutput written to '{output_filename}'")
     except Exception as out_err:
         print(f"Error writing to file '{output_filename}': {out_err}")
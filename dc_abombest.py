@@ -1,6 +1,9 @@
 import os
 import math
 import csv
+from atomic_file import atomic_open
+from atcf_record import ForecastRecord, RADII_WINDS
+from atcf_ndjson import emit_forecasts, claim_stdout
 
 # Constants
 UCSV = 201
@@ -34,10 +37,24 @@ def get_dbl_var(data, key):
         return 0.0
 
 def write_carq_record(carq):
-    """Write the carq record (mock function for demonstration)."""
+    """Write the carq record (mock function for demonstration), and to the NDJSON sink."""
     print('Writing CARQ Record:', carq)
+    emit_forecasts([carq_record(carq)])
+
+def carq_record(carq):
+    """ForecastRecord of a carq dictionary, one tau 0 point"""
+    record = ForecastRecord(basin=carq['basin'], cyNum=carq['cynum'], DTG=carq['dtg'], tech=carq['tech'],
+                            stormname=carq['stormname'])
+    radii = [[0] * 4 for _ in range(3)]
+    for windrad in carq['windrad']:
+        if str(windrad['value']) in RADII_WINDS:
+            radii[RADII_WINDS.index(str(windrad['value']))] = windrad['radii']
+    record.track.append(tau=0, lat=carq['lat'], lon=carq['lon'], vmax=carq['vmax'], mslp=carq['mslp'],
+                        mrd=carq['mrd'], radii=radii)
+    return record
 
 def main():
+    claim_stdout()
     print("\nABOM Best Track database to ATCF B Deck\n")
     print("Build Data: <Insert Build Data Here>")
     print("Copyright Data: <Insert Copyright Data Here>\n")
@@ -62,7 +79,7 @@ def main():
         lastbomid = 'none'
         irec = 1
 
-        with open('bom_ids.csv', 'w') as uxrf:
+        with atomic_open('bom_ids.csv') as uxrf:
             for row in csv_reader:
                 bomid = row.get('DISTURBANCE_ID', '').strip()
                 if not bomid:
@@ -2,27 +2,12 @@ import sys
 import os
 from datetime import datetime
 from typing import List, Dict, Tuple, Optional
-
-class TrackPoint:
-    def __init__(self):
-        self.tau = 0
-        self.lat = -999.0
-        self.lon = -999.0
-        self.vmax = 0
-        self.mslp = 0
-        self.mrd = 0
-        self.ty = '  '
-
-class Forecast:
-    def __init__(self):
-        self.basin = ''
-        self.cyNum = 0
-        self.DTG = ''
-        self.jdnow = 0.0
-        self.technum = 0
-        self.tech = ''
-        self.stormname = ''
-        self.track = [TrackPoint() for _ in range(36)]  # Initialize 36 track points
+from atcf_record import TrackPoint, ForecastRecord
+from atcf_time import dtg_hours, previous_month
+from atcf_index import ForecastIndex
+from atcf_coordinator import write_forecast
+from atcf_ndjson import claim_stdout
+from atomic_file import locked_append
 
 class ATCFProcessor:
     def __init__(self):
@@ -37,39 +22,14 @@ class ATCFProcessor:
         self.num_carq = 0
         self.carq = []
 
-    def djuliana(self, mm: int, dd: int, yy: int, hh: float) -> float:
-        """Convert date to Julian day (simplified version)"""
-        # Note: This is a simplified version. For precise calculations, use a proper Julian date function
-        return float(datetime(yy, mm, dd).toordinal()) + hh / 24.0
-
     def match_atcf_id(self, fix_lat: float, fix_lon: float, yy: int, mm: int, dd: int, hh: int, atcfid: str, found: bool):
         """Match ATCF ID (simplified version)"""
         # In the original Fortran, this would match against existing ATCF records
         # Here we just pass through the atcfid
         pass
 
-    def get_atcf_records(self, atfile: str, tech: str):
-        """Load ATCF records from file (simplified version)"""
-        # In a full implementation, this would parse the ATCF file
-        pass
-
-    def sort_carq_records(self):
-        """Sort CARQ records (placeholder)"""
-        pass
-
-    def write_carq_record(self, index: int):
-        """Write CARQ record (placeholder)"""
-        pass
-
-    def sort_fcst_records(self):
-        """Sort forecast records (placeholder)"""
-        pass
-
-    def write_fcst_record(self, index: int):
-        """Write forecast record (placeholder)"""
-        pass
-
 def main():
+    claim_stdout()
     processor = ATCFProcessor()
     
     print("\nChina Met Agency/Guangzhou Bulletin to ATCF Track File Version 1.0")
@@ -155,60 +115,42 @@ def main():
                             vmax = int(buffy[10:].split()[0])
                     break
 
+            yy, mm = current_time.year, current_time.month
             if dd > current_time.day:
-                mm -= 1
+                yy, mm = previous_month(yy, mm)
 
             print(yy, mm, dd, hh)
             print(tlat, tlon, vmax)
             fix_lat = tlat
             fix_lon = tlon
 
-            jdnow = processor.djuliana(mm, dd, yy, hh * 1.0)
+            jdnow = dtg_hours(yy, mm, dd, hh)
             print(atcfid, yy, mm, dd, hh)
             found = False
             processor.match_atcf_id(fix_lat, fix_lon, yy, mm, dd, hh, atcfid, found)
             print(atcfid, yy, mm, dd, hh)
 
             atfile = f"A{atcfid}.bcgz"
-            if not os.path.exists(atfile):
-                print(f"*Caution* {atfile} does not exist!")
-                processor.num_fcst = 0
-            else:
-                processor.clear_internal_atcf()
-                processor.get_atcf_records(atfile, 'ANY ')
-
-            jdmsg = processor.djuliana(mm, dd, yy, hh * 1.0)
+            jdmsg = dtg_hours(yy, mm, dd, hh)
 
-            # Check if forecast already exists
-            found = False
-            for fcst in processor.fcst:
-                if fcst.tech == 'BCGZ' and abs(fcst.jdnow - jdmsg) < 1.0 / 24:
-                    found = True
-                    break
-
-            if found:
+            # Check if forecast already exists, in the sidecar index without reading the A-deck
+            index = ForecastIndex(atfile)
+            if index.contains('BCGZ', f"{yy:04d}{mm:02d}{dd:02d}{hh:02d}"):
                 print("Forecast already in ATCF file")
                 continue
 
+            if not os.path.exists(atfile):
+                print(f"*Caution* {atfile} does not exist!")
+            processor.clear_internal_atcf()
+
             # Create new forecast record
-            new_fcst = Forecast()
-            processor.num_fcst += 1
-            new_fcst.basin = atcfid[:2]
-            new_fcst.cyNum = int(atcfid[2:4])
-            new_fcst.DTG = f"{yy:04d}{mm:02d}{dd:02d}{hh:02d}"
-            new_fcst.jdnow = jdmsg
-            new_fcst.technum = 1
-            new_fcst.tech = 'BCGZ'
-            new_fcst.stormname = ''
+            new_fcst = ForecastRecord(basin=atcfid[:2], cyNum=int(atcfid[2:4]),
+                                      DTG=f"{yy:04d}{mm:02d}{dd:02d}{hh:02d}", jdnow=jdmsg,
+                                      technum=1, tech='BCGZ', stormname='')
 
-            # Add initial position
+            # Add initial position, mslp and rmax are not in the bulletin
             numfpos = 0
-            new_fcst.track[numfpos].tau = 0
-            new_fcst.track[numfpos].lat = fix_lat
-            new_fcst.track[numfpos].lon = fix_lon
-            new_fcst.track[numfpos].vmax = vmax
-            new_fcst.track[numfpos].mslp = 0  # mslp not set in original
-            new_fcst.track[numfpos].mrd = 0   # rmax not set in original
+            new_fcst.track.append(TrackPoint(tau=0, lat=fix_lat, lon=fix_lon, vmax=vmax, mslp=0, mrd=0))
 
             # Process forecast positions
             while True:
@@ -242,28 +184,16 @@ def main():
                 ivmax = int(buffy[10:].split()[0])
 
                 numfpos += 1
-                new_fcst.track[numfpos].tau = vt
-                new_fcst.track[numfpos].lat = tlat
-                new_fcst.track[numfpos].lon = tlon
-                new_fcst.track[numfpos].vmax = ivmax
+                new_fcst.track.append(TrackPoint(tau=vt, lat=tlat, lon=tlon, vmax=ivmax, mslp=0, mrd=0))
                 print(vt, tlat, tlon, ivmax)
 
-            processor.fcst.append(new_fcst)
-
-            # Write output file
-            with open(atfile, 'w') as atf:
-                # In a full implementation, this would write all records
-                processor.sort_carq_records()
-                for i in range(processor.num_carq):
-                    processor.write_carq_record(i)
 
-                processor.sort_fcst_records()
-                for i in range(processor.num_fcst):
-                    processor.write_fcst_record(i)
+            # Append to the A-deck, or hand the forecast to the writer coordinator when one is running
+            write_forecast(atfile, new_fcst, index)
 
             print(f"Updated {atcfid} ATCF file.")
             
-            with open('bcgz_updated.dat', 'a') as sqlf:
+            with locked_append('bcgz_updated.dat') as sqlf:
                 sqlf.write(f"{atcfid}\n")
 
 if __name__ == "__main__":
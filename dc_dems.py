@@ -2,33 +2,17 @@ import os
 import re
 from datetime import datetime
 import sys
+from atcf_record import TrackPoint, ForecastRecord
+from atcf_time import dtg_hours, previous_month
+from atcf_index import ForecastIndex
+from atcf_coordinator import write_forecast
+from atcf_ndjson import claim_stdout
+from atomic_file import locked_append
 
 # Global variables and parameters
 UINP = 200
 USQL = 201
 
-# Data structures to replace Fortran records
-class ForecastTrack:
-    def __init__(self):
-        self.tau = 0
-        self.lat = -999.0
-        self.lon = -999.0
-        self.vmax = -999
-        self.mslp = -999
-        self.mrd = -999
-        self.ty = "  "
-
-class ForecastRecord:
-    def __init__(self):
-        self.basin = ""
-        self.cyNum = 0
-        self.DTG = ""
-        self.jdnow = 0.0
-        self.technum = 0
-        self.tech = ""
-        self.stormname = ""
-        self.track = [ForecastTrack() for _ in range(36)]
-
 # Global storage for forecasts and carq records
 num_fcst = 0
 fcst = []
@@ -37,14 +21,6 @@ carq = []
 
 # -----------------------------------------------------------------
 # Utility functions
-def djuliana(mm, dd, yy, hh):
-    """Convert Gregorian date to Julian date"""
-    a = (14 - mm) // 12
-    y = yy + 4800 - a
-    m = mm + 12 * a - 3
-    jdn = dd + (153 * m + 2) // 5 + 365 * y + y // 4 - y // 100 + y // 400 - 32045
-    return jdn + (hh - 12) / 24.0
-
 def clear_internal_atcf():
     global num_fcst, fcst, num_carq, carq
     num_fcst = 0
@@ -52,88 +28,6 @@ def clear_internal_atcf():
     num_carq = 0
     carq = []
 
-def get_atcf_records(atfile, tech_filter):
-    """Read ATCF records from file"""
-    global num_fcst, fcst
-    
-    try:
-        with open(atfile, 'r') as f:
-            for line in f:
-                if line.startswith(('AL', 'EP', 'CP', 'WP', 'IO', 'SH')):
-                    parts = line.split(',')
-                    if len(parts) < 11:
-                        continue
-                    
-                    # Create new forecast record if needed
-                    if num_fcst == 0 or fcst[-1].DTG != parts[2].strip():
-                        num_fcst += 1
-                        new_fcst = ForecastRecord()
-                        new_fcst.basin = parts[0].strip()
-                        new_fcst.cyNum = int(parts[1].strip())
-                        new_fcst.DTG = parts[2].strip()
-                        new_fcst.technum = int(parts[4].strip())
-                        new_fcst.tech = parts[5].strip()
-                        new_fcst.stormname = parts[27].strip() if len(parts) > 27 else ""
-                        
-                        # Parse date to calculate Julian date
-                        dtg = new_fcst.DTG
-                        yy = int(dtg[:4])
-                        mm = int(dtg[4:6])
-                        dd = int(dtg[6:8])
-                        hh = int(dtg[8:10])
-                        new_fcst.jdnow = djuliana(mm, dd, yy, hh)
-                        
-                        fcst.append(new_fcst)
-                    
-                    # Add track data
-                    tau = int(parts[3].strip())
-                    lat = float(parts[6].strip())
-                    lon = float(parts[7].strip())
-                    vmax = int(parts[8].strip())
-                    mslp = int(parts[9].strip()) if parts[9].strip() else -999
-                    
-                    # Find position in track (tau/6 for 6-hourly intervals)
-                    pos = tau // 6
-                    if pos < 0 or pos >= 36:
-                        continue
-                    
-                    fcst[-1].track[pos].tau = tau
-                    fcst[-1].track[pos].lat = lat
-                    fcst[-1].track[pos].lon = lon
-                    fcst[-1].track[pos].vmax = vmax
-                    fcst[-1].track[pos].mslp = mslp
-    except FileNotFoundError:
-        print(f"*Caution* {atfile} does not exist!")
-        num_fcst = 0
-
-def sort_carq_records():
-    """Sort CARQ records (placeholder)"""
-    pass
-
-def sort_fcst_records():
-    """Sort forecast records by date"""
-    global fcst
-    fcst.sort(key=lambda x: x.DTG)
-
-def write_carq_record(index):
-    """Write CARQ record to file (placeholder)"""
-    pass
-
-def write_fcst_record(index):
-    """Write forecast record to ATCF file"""
-    rec = fcst[index]
-    with open(atfile, 'a') as f:
-        for track in rec.track:
-            if track.lat == -999:
-                continue
-            line = (
-                f"{rec.basin}, {rec.cyNum:02d}, {track.tau:03d}, {rec.DTG}, "
-                f"{rec.technum:03d}, {rec.tech:4s}, {track.lat:5.1f}N, {track.lon:5.1f}E, "
-                f"{track.vmax:03d}, {track.mslp:04d}, , , , , , , , , , , , , , "
-                f"{rec.stormname}\n"
-            )
-            f.write(line)
-
 def match_atcf_id(fix_lat, fix_lon, jdnow, atcfid):
     """Match position with ATCF ID (placeholder implementation)"""
     # This would need actual implementation based on how the matching works
@@ -149,6 +43,7 @@ def clean_number_string(s):
 # Main program
 def main():
     global num_fcst, fcst, num_carq, carq, atfile
+    claim_stdout()
     
     print("\nRSMC New Delhi to ATCF Track File Version 2.0")
     print("Copyright(c) 2010-2020, Charles C Watson Jr.  All Rights Reserved.\n")
@@ -254,11 +149,10 @@ def main():
                     break
         
         # Adjust month if needed
-        current_day = datetime.now().day
-        if dd > current_day:
-            mm = datetime.now().month - 1
-        else:
-            mm = datetime.now().month
+        now = datetime.now()
+        yy, mm = now.year, now.month
+        if dd > now.day:
+            yy, mm = previous_month(yy, mm)
         
         print(f"{yy} {mm} {dd} {hh}")
         print(f"{tlat} {tlon} {vmax} {rmax}")
@@ -267,7 +161,7 @@ def main():
         fix_lon = tlon
         mslp = 0  # DEMs doesn't seem to provide MSLP
         
-        jdnow = djuliana(mm, dd, yy, hh)
+        jdnow = dtg_hours(yy, mm, dd, hh)
         
         # Match the storm ID
         found = match_atcf_id(fix_lat, fix_lon, jdnow, atcfid)
@@ -288,28 +182,19 @@ def main():
         
         # Prepare the ATCF file
         atfile = f"A{atcfid[0]}.dems"
-        valid = os.path.exists(atfile)
-        if not valid:
-            print(f"*Caution* {atfile} does not exist!")
-            num_fcst = 0
-        else:
-            clear_internal_atcf()
-            get_atcf_records(atfile, 'ANY ')
-        
-        # Check if this forecast already exists
-        jdmsg = djuliana(mm, dd, yy, hh)
-        found = False
-        for f in fcst:
-            if f.tech == 'DEMS' and abs(f.jdnow - jdmsg) < 1.0/24:
-                found = True
-                break
         
-        if found:
+        # Check if this forecast already exists, in the sidecar index without reading the A-deck
+        jdmsg = dtg_hours(yy, mm, dd, hh)
+        index = ForecastIndex(atfile)
+        if index.contains('DEMS', f"{yy:04d}{mm:02d}{dd:02d}{hh:02d}"):
             print("Forecast already in ATCF file")
             continue
         
+        if not os.path.exists(atfile):
+            print(f"*Caution* {atfile} does not exist!")
+        clear_internal_atcf()
+        
         # Add new forecast record
-        num_fcst += 1
         new_fcst = ForecastRecord()
         new_fcst.basin = atcfid[0][:2]
         try:
@@ -324,12 +209,7 @@ def main():
         
         # Add initial position
         numfpos = 1
-        new_fcst.track[0].tau = 0
-        new_fcst.track[0].lat = fix_lat
-        new_fcst.track[0].lon = fix_lon
-        new_fcst.track[0].vmax = vmax
-        new_fcst.track[0].mslp = mslp
-        new_fcst.track[0].mrd = rmax
+        new_fcst.track.append(TrackPoint(tau=0, lat=fix_lat, lon=fix_lon, vmax=vmax, mslp=mslp, mrd=rmax))
         
         # Parse forecast data
         with open(infile, 'r') as f:
@@ -391,33 +271,20 @@ def main():
                         continue
                     
                     # Add to forecast track
-                    if numfpos < 36:
-                        new_fcst.track[numfpos].tau = vt
-                        new_fcst.track[numfpos].lat = tlat
-                        new_fcst.track[numfpos].lon = tlon
-                        new_fcst.track[numfpos].vmax = ivmax
-                        print(f"{vt} {tlat} {tlon} {ivmax}")
-                        numfpos += 1
+                    new_fcst.track.append(TrackPoint(tau=vt, lat=tlat, lon=tlon, vmax=ivmax))
+                    print(f"{vt} {tlat} {tlon} {ivmax}")
+                    numfpos += 1
                 
                 except (ValueError, IndexError):
                     continue
         
-        fcst.append(new_fcst)
-        
-        # Write the updated ATCF file
-        with open(atfile, 'w') as f:
-            # Write CARQ records (placeholder)
-            pass
-        
-        # Sort and write forecast records
-        sort_fcst_records()
-        for i in range(num_fcst):
-            write_fcst_record(i)
+        # Append to the ATCF file, through the writer coordinator when one is running
+        write_forecast(atfile, new_fcst, index)
         
         print(f"Updated {atcfid[0]} ATCF file.")
         
         # Update the SQL file
-        with open('dems_updated.dat', 'a') as f:
+        with locked_append('dems_updated.dat') as f:
             f.write(f"{atcfid[0]}\n")
 
 if __name__ == "__main__":
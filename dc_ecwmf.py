@@ -2,39 +2,97 @@ import sys
 import os
 import numpy as np
 from eccodes import *
-from datetime import datetime
+from bufr_index import BufrIndex, BufrMessage, read_header, read_stream, message_matches
+from bufr_cache import BufrCache, DEFAULT_CACHE_MB
+from bufr_tc import decode_tc_message
+from atcf_record import TrackArray, ForecastRecord
+from atcf_time import dtg_hours
+from atcf_store import StormStore
+from atcf_columns import append_forecasts
+from atcf_ndjson import emit_forecasts, claim_stdout
+from atcf_writer import update_adeck, render_lines, track_columns, valid_rows, tenths, hemisphere, format_column
 import math
+import multiprocessing
 
 # Example of how to run file
 # python3 dc_ecmwf.py -in ECMWF_message.bufr
+# cat ECMWF_message.bufr | python3 dc_ecmwf.py -in -
 
 # Constants
 MAX_STRSIZE = 200
+MAX_TRACK_POINTS = 36  # Forecast periods written per track, as in the Fortran record
 NM2M = 1852.0  # Nautical miles to meters
 MS2KTS = 1.94384  # m/s to knots conversion
 CODES_MISSING_DOUBLE = 1.0e100
 CODES_MISSING_LONG = 2147483647
+DECODE_FAILED = False  # Returned instead of None (skip the message) when it could not be decoded, so it is not cached
+ECMF_LINE = ("{}{}, {:3d}, {:03d}{},  {:03d}{},  {}, {:4d},    ,  , , ,  , , , , , {}, , , , , , {}\n")  # After the head
 
 
 
 
-class ForecastTrack:
+class ForecastTrack(ForecastRecord):
+    """Forecast record that also keeps the initial storm center from the analysis (tau = 0)"""
+    __slots__ = ('lat0', 'lon0', 'vmax0', 'mslp0')
+
+    def __init__(self):
+        super().__init__(basin='XX')
+        self.lat0 = -999
+        self.lon0 = -999
+        self.vmax0 = -999
+        self.mslp0 = -999
+
+class EnsembleForecast:
+    """All ensemble members of one storm and cycle, stored as (members, periods) arrays"""
     def __init__(self):
         self.basin = 'XX'
         self.cyNum = 0
         self.DTG = ''
-        self.jdnow = 0.0
-        self.technum = 0
-        self.tech = ''
         self.stormname = ''
-        self.track = [{'tau': 0, 'lat': -999, 'lon': -999, 'mslp': -999, 'vmax': -999, 'mrd': -999, 'ty': '  '} for _ in range(36)]
-        for j in range(36):
-            self.track[j]['windrad'] = [{'code': 'AAA'} for _ in range(4)]
+        self.member = np.zeros(0, dtype=int)
+        self.tau = np.zeros(0, dtype=int)
+        self.lat = np.zeros((0, 0))
+        self.lon = np.zeros((0, 0))
+        self.mslp = np.zeros((0, 0))
+        self.vmax = np.zeros((0, 0))
+        self.mrd = np.zeros((0, 0))
+
+    def add_members(self, member, tau, lat, lon, mslp, vmax, mrd):
+        """Merge the subsets of one message, aligning periods on tau and replacing repeated members"""
+        taus = np.union1d(self.tau, tau)
+        keep = ~np.isin(self.member, member)
+        fields = []
+        for old, new in ((self.lat, lat), (self.lon, lon), (self.mslp, mslp), (self.vmax, vmax), (self.mrd, mrd)):
+            merged = np.full((keep.sum() + len(member), len(taus)), -999.0)
+            merged[:keep.sum(), np.searchsorted(taus, self.tau)] = old[keep]
+            merged[keep.sum():, np.searchsorted(taus, tau)] = new
+            fields.append(merged)
+        members = np.concatenate([self.member[keep], member])
+        order = np.argsort(members, kind='stable')
+        self.member = members[order]
+        self.tau = taus
+        self.lat, self.lon, self.mslp, self.vmax, self.mrd = (field[order] for field in fields)
+
+    def records(self):
+        """One ForecastRecord per member, of the periods written to the ATCF file"""
+        valid = valid_rows(self.lat, self.lon, self.vmax, self.mslp)
+        records = []
+        for i, member in enumerate(self.member.tolist()):
+            rows = valid[i]
+            records.append(ForecastRecord(basin=self.basin, cyNum=self.cyNum, DTG=self.DTG, technum=1,
+                                          tech=f"EC{int(member):02d}", stormname=self.stormname,
+                                          track=TrackArray.from_columns(tau=self.tau[rows], lat=self.lat[i, rows],
+                                                                        lon=self.lon[i, rows], vmax=self.vmax[i, rows],
+                                                                        mslp=self.mslp[i, rows], mrd=self.mrd[i, rows])))
+        return records
 
 class ATCFDecoder:
     def __init__(self):
         self.num_fcst = 0
         self.fcst = []
+        self.store = StormStore()  # ForecastTracks per ATCF ID in DTG order, kept for the whole input file
+        self.ens = {}  # EnsembleForecast per (ATCF ID, DTG), kept for the whole input file
+        self.numpy_decode = False  # Decode the tropical cyclone template without ecCodes where possible
         self.UnitAT = 10  # Arbitrary file unit number
         
     def clear_internal_atcf(self):
@@ -42,17 +100,6 @@ class ATCFDecoder:
         self.num_fcst = 0
         self.fcst = []
         
-    def djuliana(self, month, day, year, hour):
-        """Convert date to Julian day"""
-        if month <= 2:
-            year -= 1
-            month += 12
-        A = int(year / 100)
-        B = 2 - A + int(A / 4)
-        jd = int(365.25 * (year + 4716)) + int(30.6001 * (month + 1)) + day + B - 1524.5
-        jd += hour / 24.0
-        return jd
-        
     def gcdist(self, lat1, lon1, lat2, lon2):
         """Calculate great circle distance between two points"""
         if lat1 == lat2 and lon1 == lon2:
@@ -72,6 +119,100 @@ class ATCFDecoder:
         
         return dist, angle
         
+    def gcdist_array(self, lat1, lon1, lat2, lon2):
+        """Great circle distance in meters between arrays of points"""
+        rad = math.pi / 180.0
+        lat1 = np.asarray(lat1) * rad
+        lat2 = np.asarray(lat2) * rad
+        dlat = lat2 - lat1
+        dlon = (np.asarray(lon2) - np.asarray(lon1)) * rad
+        a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+        a = np.clip(a, 0.0, 1.0)
+        return 6371.0 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a)) * 1000.0
+
+    def get_rank_array(self, ibufr, key, nranks, nsub, compressed):
+        """Read every rank of a BUFR key with one codes_get_array call, shaped (nsub, nranks)"""
+        values = np.asarray(codes_get_array(ibufr, key))
+        if values.size == nranks * nsub:
+            if compressed:
+                # Compressed data is stored rank by rank, one value per subset
+                return values.reshape(nranks, nsub).T
+            return values.reshape(nsub, nranks)
+        if values.size == nranks:
+            # Compressed ranks that are identical in every subset come back as one value
+            return np.repeat(values[np.newaxis, :], nsub, axis=0)
+
+        # Some ranks collapsed and some did not, read them one by one
+        out = np.empty((nsub, nranks), dtype=values.dtype)
+        for rank in range(nranks):
+            out[:, rank] = codes_get_array(ibufr, f'#{rank + 1}#{key}')
+        return out
+
+    def extract_track_arrays(self, ibufr):
+        """Pull the track keys of an unpacked BUFR message into (subset, period) arrays"""
+        nsub = codes_get(ibufr, 'numberOfSubsets')
+        compressed = codes_get(ibufr, 'compressedData') == 1
+        try:
+            # The analysis sits outside the replicated forecast periods
+            numberOfPeriods = codes_get(ibufr, 'delayedDescriptorReplicationFactor') + 1
+        except CodesInternalError:
+            print("No forecast periods in message.")
+            return None
+
+        def get_ranks(key, nranks):
+            return self.get_rank_array(ibufr, key, nranks, nsub, compressed)
+        return self.build_track_arrays(get_ranks, numberOfPeriods)
+
+    def build_track_arrays(self, get_ranks, numberOfPeriods):
+        """Pick the storm centre and maximum wind rows out of the rank arrays returned by get_ranks(key, nranks)"""
+        numberOfPositions = 2 * numberOfPeriods + 1
+        print(f"Number of periods: {numberOfPeriods}")
+
+        period = np.zeros(numberOfPeriods, dtype=int)
+        if numberOfPeriods > 1:
+            ivalues = get_ranks('timePeriod', numberOfPeriods - 1)
+            period[1:] = np.where(ivalues != CODES_MISSING_LONG, ivalues, -1).max(axis=0)
+
+        significance = get_ranks('meteorologicalAttributeSignificance', numberOfPositions)[0]
+        lat = get_ranks('latitude', numberOfPositions)
+        lon = get_ranks('longitude', numberOfPositions)
+        pressure = get_ranks('pressureReducedToMeanSeaLevel', numberOfPeriods)
+        wind = get_ranks('windSpeedAt10M', numberOfPeriods)
+
+        # Storm centre rows are 1 (observed) or 4 (analysed), maximum wind rows are 3
+        windRows = np.flatnonzero(significance == 3)
+        centreRows = np.flatnonzero((significance == 1) | (significance == 4))
+        observedRow = centreRows[0] if centreRows.size else 0
+        if centreRows.size == windRows.size + 1:
+            # The observed centre has no pressure or wind of its own
+            centreRows = centreRows[1:]
+        if centreRows.size != numberOfPeriods or windRows.size != numberOfPeriods:
+            print(f"WARNING: unexpected meteorologicalAttributeSignificance layout {significance}. Skipping this message.")
+            return None
+
+        arrays = {'period': period}
+        arrays['member'] = get_ranks('ensembleMemberNumber', 1)[:, 0]
+        arrays['forecastType'] = get_ranks('ensembleForecastType', 1)[:, 0]
+        for name, values, rows in (('latitude', lat, centreRows), ('longitude', lon, centreRows),
+                                   ('latitudeWind', lat, windRows), ('longitudeWind', lon, windRows),
+                                   ('obsLatitude', lat, [observedRow]), ('obsLongitude', lon, [observedRow]),
+                                   ('pressure', pressure, slice(None)), ('wind', wind, slice(None))):
+            values = values[:, rows].astype(float)
+            arrays[name] = np.where(np.abs(values) >= CODES_MISSING_DOUBLE, CODES_MISSING_DOUBLE, values)
+        return arrays
+
+    def derive_track_fields(self, arrays):
+        """Convert the extracted arrays to ATCF units for every subset and period, -999 where missing"""
+        hasCentre = (arrays['latitude'] != CODES_MISSING_DOUBLE) & (arrays['longitude'] != CODES_MISSING_DOUBLE)
+        hasWind = (hasCentre & (arrays['wind'] != CODES_MISSING_DOUBLE) &
+                   (arrays['latitudeWind'] != CODES_MISSING_DOUBLE) & (arrays['longitudeWind'] != CODES_MISSING_DOUBLE))
+        mslp = np.where(arrays['pressure'] != CODES_MISSING_DOUBLE, arrays['pressure'] / 100.0, -999)
+        vmax = np.where(hasWind, arrays['wind'] * MS2KTS, -999)
+        dist = self.gcdist_array(arrays['latitude'], arrays['longitude'],
+                                 arrays['latitudeWind'], arrays['longitudeWind'])
+        mrd = np.where(hasWind, np.minimum(dist / NM2M, 70.0), -999)  # Limit to prevent superstorms
+        return hasCentre, mslp, vmax, mrd
+
     def match_atcf_id(self, fix_lat, fix_lon, yy, mm, dd, hh, inum, bchar):
         """Match storm with ATCF ID (simplified for Python)"""
         atcfid = 'XX999999'
@@ -94,97 +235,210 @@ class ATCFDecoder:
 
         return atcfid, found
         
-    def get_atcf_records(self, atfile, tech_filter):
-        """Read existing ATCF records (simplified for Python)"""
-        # In the original Fortran, this would read an ATCF file
-        # For Python, we'll just initialize an empty list
-        pass
-        
-    def sort_fcst_records(self):
-        """Sort forecast records (simplified for Python)"""
-        # In the original Fortran, this would sort the forecasts
-        pass
-        
-    def write_fcst_record(self, idx, atfile, infile):
-        """Write forecast record to ATCF file, skipping lines with missing data (-999) or placeholder values (1e100, -1e100)"""
-        fcst = self.fcst[idx]
-        """Read the initial storm center from a BUFR file."""
-        with open(infile, "rb") as f:
-            # Read the first BUFR message
-            bufr = codes_bufr_new_from_file(f)
-
-            # Tell ecCodes to expand descriptors to get all data
-            codes_set(bufr, "unpack", 1)
-
-            # Extract storm center info (subset 1 = initial analysis)
-            lat = codes_get_array(bufr, "latitude")[0]
-            lon = codes_get_array(bufr, "longitude")[0]
-            print(lat)
-            print(lon)
-            vmax = codes_get_array(bufr, "windSpeedAt10M")[0] * MS2KTS
-            mslp = codes_get_array(bufr, "pressureReducedToMeanSeaLevel")[0] / 100
-
-            storm_name = codes_get(bufr, "longStormName")  # Extract storm name
-            print(f"Storm Name: {storm_name}")
-            fcst.stormname = storm_name.strip()  # Assign storm name to ForecastTrack
-
-            # Get date/time fields
-            year = codes_get(bufr, "year")
-            month = codes_get(bufr, "month")
-            day = codes_get(bufr, "day")
-            hour = codes_get(bufr, "hour")
-
-            print("=== Initial Storm Center ===")
-            print(f"Valid Time: {year}-{month:02d}-{day:02d} {hour:02d}:00 UTC")
-            print(f"Latitude: {lat:.2f}")
-            print(f"Longitude: {lon:.2f}")
-            print(f"Max Sustained Wind (m/s): {vmax}")
-            print(f"Central Pressure (hPa): {mslp}")
-
-            f.close()
-
-        with open(atfile, 'a') as f:
-            # Format and write the record
-            lat = f"{int(abs(lat) * 10):03d}{'N' if lat >= 0 else 'S'}"
-            lon = f"{int(abs(lon) * 10):03d}{'E' if lon >= 0 else 'W'}"
-            vmax = str(int(vmax))
-            mslp = f"{int(mslp):4d}"  # Ensure mslp is 4 characters wide
-            #mrd = f"{int(mrd):2d}"  # Ensure mrd is 2 characters wide
-            tau = f"{int(0):3d}"  # Format tau as a 3-character wide field
-
-            line = (f"{fcst.basin},  {int(fcst.cyNum)}, {fcst.DTG},  1, ECMF, "
-                    f"{tau}, {lat},  {lon},  "
-                    f"{vmax}, {mslp},    ,  , , ,  , , , , ,   , , , , , , {fcst.stormname}")
-            f.write(line + '\n') 
-
-            for j in range(36):  # Iterate over all 36 forecast periods
-                track = fcst.track[j]
-                
-                # Skip records with missing or placeholder data
-                if (track['lat'] == -999 or 
-                    track['lon'] == -999 or 
-                    track['vmax'] == -999 or 
-                    track['mslp'] == -999 or 
-                    abs(track['lat']) == 1e100 or 
-                    abs(track['lon']) == 1e100):
-                    continue
-                
-                # Format and write the record
-                lat = f"{int(abs(track['lat']) * 10):03d}{'N' if track['lat'] >= 0 else 'S'}"
-                lon = f"{int(abs(track['lon']) * 10):03d}{'E' if track['lon'] >= 0 else 'W'}"
-                vmax = str(int(track['vmax']))
-                mslp = f"{int(track['mslp']):4d}"  # Ensure mslp is 4 characters wide
-                mrd = f"{int(track['mrd']):2d}"  # Ensure mrd is 2 characters wide
-                tau = f"{int(track['tau']):3d}"  # Format tau as a 3-character wide field
-
-                line =  (f"{fcst.basin},  {int(fcst.cyNum)}, {fcst.DTG},  1, ECMF, "
-                        f"{tau}, {lat},  {lon},  "
-                        f"{vmax}, {mslp}, "
-                        f"   ,  , , ,  , , , , , {mrd}, , , , , , {fcst.stormname}")
-                f.write(line + '\n')
+    def add_storm_forecast(self, atcfid, new_fcst):
+        """Group a forecast under its storm, a later message for the same DTG and tech replaces the earlier one"""
+        self.store.add(atcfid, new_fcst, replace=True)
+
+    def render_track_records(self, fcsts):
+        """ATCF lines of a batch of forecast records as one string, each analysis center (tau 0) before its track,
+        skipping positions with missing data (-999) or placeholder values (1e100, -1e100)"""
+        # The initial storm centers were captured from the analysis during decode
+        lat0 = np.array([f.lat0 for f in fcsts], dtype=float)
+        lon0 = np.array([f.lon0 for f in fcsts], dtype=float)
+        first = np.flatnonzero(valid_rows(lat0, lon0))
+        data, owner = track_columns(fcsts)
+        rows = np.flatnonzero(valid_rows(data['lat'], data['lon'], data['vmax'], data['mslp']))
+
+        owner = np.concatenate([first, owner[rows]])
+        order = np.argsort(owner, kind='stable')  # Analysis line first, then the forecast periods the message had
+        lat = np.concatenate([lat0[first], data['lat'][rows]])[order]
+        lon = np.concatenate([lon0[first], data['lon'][rows]])[order]
+        vmax = np.concatenate([[fcsts[i].vmax0 for i in first], data['vmax'][rows]]).astype(np.int64)[order]
+        mslp = np.concatenate([[fcsts[i].mslp0 for i in first], data['mslp'][rows]]).astype(np.int64)[order]
+        mrd = np.array(['  '] * len(first) + format_column("{:2d}", data['mrd'][rows].astype(np.int64)),
+                       dtype=object)[order]
+        tau = np.concatenate([np.zeros(len(first), dtype=np.int64), data['tau'][rows]])[order]
+        heads = np.array([f"{f.basin},  {int(f.cyNum)}, {f.DTG},  1, " for f in fcsts] or [''], dtype=object)
+        names = np.array([f.stormname for f in fcsts] or [''], dtype=object)
+        owner = owner[order]
+        return ''.join(render_lines(ECMF_LINE, [heads[owner], 'ECMF', tau, tenths(lat), hemisphere(lat, 'N', 'S'),
+                                                tenths(lon), hemisphere(lon, 'E', 'W'), vmax, mslp, mrd,
+                                                names[owner]]))
+
+    def write_storm_records(self, atcfid, atfile, cycles=()):
+        """Write the main run forecasts and the ensemble cycles of a storm to its ATCF file in one update.
+        The lines the file has of the same DTGs and techs are replaced, those of other runs and techs kept"""
+        self.fcst = self.store.forecasts(atcfid)
+        self.num_fcst = len(self.fcst)
+        text = self.render_track_records(self.fcst) + ''.join(self.render_ensemble_records(ens) for ens in cycles)
+        update_adeck(atfile, text.splitlines(keepends=True), replace=True)
+        records = self.fcst + [record for ens in cycles for record in ens.records()]
+        append_forecasts(records)
+        emit_forecasts(records)
     
-    def decode_ecmf_bufr(self, infile, doform=False, source='ECMF'):
-        """Main decoding function"""
+    def read_message(self, ibufr, ensemble=False):
+        """Unpack one BUFR message into its track arrays and storm information, None to skip it, DECODE_FAILED on error"""
+        # Unpack the BUFR message
+        codes_set(ibufr, 'unpack', 1)
+
+        # Check if the BUFR message contains valid data for the main operational run
+        if not codes_is_defined(ibufr, 'ensembleForecastType'):
+            print("checking for valid data")
+            return None
+
+        # Get the forecast type and ensure it is the main operational run
+        try:
+            forecastType = np.asarray(codes_get_array(ibufr, 'ensembleForecastType'))
+            print(forecastType)
+            if not ensemble and not (forecastType == 0).any():  # 0 indicates the main operational run
+                return None
+        except CodesInternalError:
+            return DECODE_FAILED
+
+        print('extracting arrays')
+        msg = self.extract_track_arrays(ibufr)
+        if msg is None:
+            return None
+
+        # Extract basic storm information
+        try:
+            for key in ('year', 'month', 'day', 'hour', 'minute', 'stormIdentifier'):
+                msg[key] = codes_get(ibufr, key)
+            msg['stormName'] = codes_get(ibufr, 'longStormName').strip()
+        except CodesInternalError as e:
+            print(f"Error extracting storm information: {e}")
+            return DECODE_FAILED
+        return msg
+
+    def read_tc_message(self, ranks, ensemble=False):
+        """Track arrays and storm information from the built-in template decoder, None to skip the message,
+        DECODE_FAILED on error"""
+        forecastType = ranks['ensembleForecastType'][:, 0]
+        print(forecastType)
+        if not ensemble and not (forecastType == 0).any():  # 0 indicates the main operational run
+            return None
+
+        def get_ranks(key, nranks):
+            values = ranks[key]
+            if values.shape[1] < nranks:
+                raise ValueError(f"{key} has {values.shape[1]} ranks, expected {nranks}")
+            return values[:, :nranks]
+
+        print('extracting arrays')
+        try:
+            msg = self.build_track_arrays(get_ranks, ranks['numberOfPeriods'])
+        except ValueError as e:
+            print(f"Error extracting track arrays: {e}")
+            return DECODE_FAILED
+        if msg is None:
+            return None
+
+        # codes_get reports the first subset of compressed data and the last of uncompressed data
+        subset = 0 if ranks['compressedData'] else -1
+        for key in ('year', 'month', 'day', 'hour', 'minute'):
+            msg[key] = int(ranks[key][subset, 0])
+        msg['stormIdentifier'] = ranks['stormIdentifier']
+        msg['stormName'] = ranks['longStormName'].strip()
+        return msg
+
+    def unpack_raw_message(self, data, ensemble=False, n=0):
+        """Decode the raw bytes of message n, with the built-in decoder when enabled or else ecCodes"""
+        if self.numpy_decode:
+            ranks = decode_tc_message(data)
+            if ranks is not None:
+                return self.read_tc_message(ranks, ensemble)
+            # Anything the built-in decoder does not recognise goes to ecCodes
+
+        ibufr = codes_new_from_message(data)
+        try:
+            return self.read_message(ibufr, ensemble)
+        except CodesInternalError as e:
+            print(f"Error decoding message {n}: {e}")
+            return DECODE_FAILED
+        finally:
+            # Ensure BUFR message is released
+            codes_release(ibufr)
+
+    def read_raw_message(self, data, ensemble=False, cache=None, n=0):
+        """Decode the raw bytes of message n, from the cache when one is given"""
+        if cache is None:
+            return self.unpack_raw_message(data, ensemble, n)
+
+        key = cache.key(data)
+        found, msg = cache.get(key)
+        if not found:
+            # Cache every member so the same entry serves the ensemble and main run modes
+            msg = self.unpack_raw_message(data, True, n)
+            cache.put(key, msg)
+        if msg and not ensemble and not (msg['forecastType'] == 0).any():
+            return None
+        return msg
+
+    def read_indexed_message(self, index, n, ensemble=False, cache=None):
+        """Decode message n of a BufrIndex, from the cache when one is given"""
+        return self.read_raw_message(index.message_view(n), ensemble, cache, n)
+
+    def read_messages(self, index, selected, ensemble=False, jobs=1, cache=None):
+        """Yield (message number, decoded message) in file order, decoding on jobs processes"""
+        if jobs > 1 and len(selected) > 1:
+            tasks = [(n, ensemble) for n in selected]
+            chunksize = max(1, len(tasks) // (jobs * 4))
+            cacheargs = (cache.cachedir, cache.max_bytes / (1024 * 1024)) if cache is not None else (None, 0)
+            initargs = (index.infile,) + cacheargs + (self.numpy_decode,)
+            with multiprocessing.Pool(jobs, initializer=init_read_worker, initargs=initargs) as pool:
+                # imap hands results back in task order, so merging matches the serial path
+                yield from zip(selected, pool.imap(read_message_worker, tasks, chunksize))
+            return
+
+        for n in selected:
+            yield n, self.read_indexed_message(index, n, ensemble, cache)
+
+    def read_stream_messages(self, stream, ensemble=False, storm=None, date=None, cache=None):
+        """Yield (message number, decoded message) for each message of a binary stream as soon as it arrives"""
+        for n, data in enumerate(read_stream(stream)):
+            message = BufrMessage(0, len(data), data[7])
+            try:
+                read_header(data, message)
+            except IndexError:
+                print(f"*Caution* bad BUFR header in message {n}")
+            if not message_matches(message, date=date, storm=storm):
+                continue
+            yield n, self.read_raw_message(data, ensemble, cache, n)
+
+    def open_messages(self, infile, ensemble=False, storm=None, date=None, jobs=1, cache=None):
+        """Yield (message number, decoded message) from a BUFR file, or from standard input when infile is '-'"""
+        if infile == '-':
+            # Messages are framed from their section 0 length and decoded one by one, jobs does not apply
+            yield from self.read_stream_messages(sys.stdin.buffer, ensemble, storm, date, cache)
+            return
+
+        with BufrIndex(infile) as index:
+            # Pick messages from their headers before anything is unpacked
+            selected = index.select(date=date, storm=storm)
+            print(f"Found {len(index)} BUFR messages, {len(selected)} selected")
+            yield from self.read_messages(index, selected, ensemble, jobs, cache)
+
+    def render_ensemble_records(self, ens):
+        """ATCF lines of every member of one ensemble cycle"""
+        members, periods = np.nonzero(valid_rows(ens.lat, ens.lon, ens.vmax, ens.mslp))
+        lat = ens.lat[members, periods]
+        lon = ens.lon[members, periods]
+        techs = np.array([f"EC{int(member):02d}" for member in ens.member] or [''], dtype=object)
+        mrd = format_column("{:2d}", ens.mrd[members, periods].astype(np.int64), blank='  ')
+        text = ''.join(render_lines(ECMF_LINE, [f"{ens.basin},  {int(ens.cyNum)}, {ens.DTG},  1, ", techs[members],
+                                                ens.tau[periods].astype(np.int64), tenths(lat), hemisphere(lat, 'N', 'S'),
+                                                tenths(lon), hemisphere(lon, 'E', 'W'),
+                                                ens.vmax[members, periods].astype(np.int64),
+                                                ens.mslp[members, periods].astype(np.int64), mrd, ens.stormname]))
+        return text
+
+    def decode_ecmf_bufr(self, infile, doform=False, source='ECMF', ensemble=False, storm=None, date=None, jobs=1,
+                         cachedir=None, cache_mb=DEFAULT_CACHE_MB, numpy_decode=False):
+        """Main decoding function, ensemble=True keeps every member instead of only the main run.
+        infile '-' decodes messages from standard input as they arrive,
+        storm (e.g. '05W') and date (YYYYMMDD or YYYYMMDDHH) skip other messages before unpacking,
+        jobs > 1 unpacks messages on a process pool and cachedir keeps decoded messages between runs,
+        numpy_decode unpacks the tropical cyclone template with NumPy and leaves other messages to ecCodes"""
         print("\nECMF BUFR4 format to ATCF")
         print("Copyright(c) 2020 Enki Holdings, LLC")
         print("All Rights Reserved\n")
@@ -193,352 +447,238 @@ class ATCFDecoder:
         atcfid = 'XX999999'
         atfile = 'badfile.dat'
         
-        # Check if input file exists
-        if not os.path.exists(infile):
+        # Check if input file exists, '-' reads from standard input
+        if infile != '-' and not os.path.exists(infile):
             print(f"*Error* {infile} does not exist!")
             return
             
-        print(f"Reading {infile}")
+        print(f"Reading {infile if infile != '-' else 'standard input'}")
+        self.clear_internal_atcf()
+        self.store.clear()
+        self.ens = {}
+        self.numpy_decode = numpy_decode
+        cache = BufrCache(cachedir, cache_mb) if cachedir else None
         
         # Open BUFR file
         try:
-            with open(infile, 'rb') as f:
-                count = 1
-                while True:
-                    ibufr = None  # Initialize ibufr to ensure it is defined
+            for count, msg in self.open_messages(infile, ensemble, storm, date, jobs, cache):
+                try:
+                    print('executing')
+                    if not msg:
+                        continue
+
+                    # Process the BUFR message
+                    fix_lat = -999
+                    fix_lon = -999
+
+                    arrays = msg
+                    mainRun = np.flatnonzero(arrays['forecastType'] == 0)  # Always there outside ensemble mode
+
+                    period = arrays['period']
+                    latitude = arrays['latitude']
+                    longitude = arrays['longitude']
+                    pressure = arrays['pressure']
+                    latitudeWind = arrays['latitudeWind']
+                    longitudeWind = arrays['longitudeWind']
+                    wind = arrays['wind']
+
+                    year = msg['year']
+                    month = msg['month']
+                    day = msg['day']
+                    hour = msg['hour']
+                    minute = msg['minute']
+                    stormIdentifier = msg['stormIdentifier']
+                    stormName = msg['stormName']
+
+                    # Extract storm number (inum) and basin character (bchar) from stormIdentifier
                     try:
-                        print('executing')
-                        # Get next BUFR message
-                        ibufr = codes_bufr_new_from_file(f)
-                        if (ibufr is None):
-                            break
-                        
-                        # Process the BUFR message
-                        self.clear_internal_atcf()
-                        fix_lat = -999
-                        fix_lon = -999
-                        
-                        # Unpack the BUFR message
-                        codes_set(ibufr, 'unpack', 1)
-
-                        # Initialize rank positions
-                        rankSignificance = 3
-                        rankPosition = 3
-                        rankPressure = 1
-                        rankWind = 1
-
-                        # Determine number of time periods
-                        numberOfPeriods = 0
-                        while True:
-                            numberOfPeriods += 1
-                            rankPeriodStr = str(numberOfPeriods)
-                            try:
-                                period_value = codes_get(ibufr, f'#{rankPeriodStr}#timePeriod')
-                            except CodesInternalError:
-                                print(f"Error accessing timePeriod for rank {rankPeriodStr}.")
-                                break
-
-                        print('initializing arrays')
-
-                        # Initialize arrays for forecast fields
-                        latitude = np.full((1, numberOfPeriods), CODES_MISSING_DOUBLE)
-                        longitude = np.full((1, numberOfPeriods), CODES_MISSING_DOUBLE)
-                        pressure = np.full((1, numberOfPeriods), CODES_MISSING_DOUBLE)
-                        latitudeWind = np.full((1, numberOfPeriods), CODES_MISSING_DOUBLE)
-                        longitudeWind = np.full((1, numberOfPeriods), CODES_MISSING_DOUBLE)
-                        wind = np.full((1, numberOfPeriods), CODES_MISSING_DOUBLE)
-                        period = [-1] * numberOfPeriods  # Default to -1 for uninitialized periods
-
-                        # Process forecast periods
-                        for i in range(0, numberOfPeriods):
-                            rankPeriod = i
-                            rankPeriodStr = str(rankPeriod)
-                            
-                            # Debug: Log rankPeriod
-                            print(f"Processing rankPeriod: {rankPeriod}")
-
-                            # Get time period
-                            try:
-                                ivalues = codes_get(ibufr, f'#{rankPeriodStr}#timePeriod')
-                                if not isinstance(ivalues, list):
-                                    ivalues = [ivalues]  # Ensure ivalues is a list
-                                for k in range(len(ivalues)):
-                                    if ivalues[k] != CODES_MISSING_LONG:
-                                        period[i] = ivalues[k]  # Assign value to the list
-                            except CodesInternalError as e:
-                                print(f"Error accessing timePeriod for rank {rankPeriodStr}: {e}")
-                                continue
-
-                            # Extract storm location significance
-                            rankSignificance += 1
-                            rankSignificanceStr = str(rankSignificance)
-                            try:
-                                ivalues = codes_get(ibufr, f'#{rankSignificanceStr}#meteorologicalAttributeSignificance')
-                                if not isinstance(ivalues, list):
-                                    ivalues = [ivalues]  # Ensure ivalues is a list
-                                for k in range(len(ivalues)):
-                                    if ivalues[k] != CODES_MISSING_LONG:
-                                        significance = ivalues[k]
-                                        # Debug: Log the extracted significance value
-                                        print(f"Extracted significance for rankSignificance={rankSignificance}: {significance}")
-                            except CodesInternalError as e:
-                                print(f"Error accessing meteorologicalAttributeSignificance for rank {rankSignificanceStr}: {e}")
-                                significance = None
-
-                            # Handle significance values
-                            if significance == 1:
-                                # Process storm center significance
-                                rankPosition += 1
-                                rankPositionStr = str(rankPosition)
-                                latitude[0, i] = codes_get(ibufr, f'#{rankPositionStr}#latitude')
-                                longitude[0, i] = codes_get(ibufr, f'#{rankPositionStr}#longitude')
-
-                                # Debug: Log extracted latitude and longitude
-                                print(f"Extracted storm center for period {i}: latitude={latitude[0, i]}, longitude={longitude[0, i]}")
-
-                                rankPressure += 1
-                                rankPressureStr = str(rankPressure)
-                                pressure[0, i] = codes_get(ibufr, f'#{rankPressureStr}#pressureReducedToMeanSeaLevel')
-
-                                if pressure[0, i] is None or pressure[0, i] == CODES_MISSING_DOUBLE:
-                                    print("Central pressure data is missing. Assigning default value.")
-                                    pressure[0, i] = -999  # Default value for missing data
-
-                                print(f"Extracted pressure for period {i}: pressure={pressure[0, i]}")
-                            elif significance == 3:
-                                # Process maximum wind significance
-                                rankPosition += 1
-                                rankPositionStr = str(rankPosition)
-                                latitudeWind[0, i] = codes_get(ibufr, f'#{rankPositionStr}#latitude')
-                                longitudeWind[0, i] = codes_get(ibufr, f'#{rankPositionStr}#longitude')
-
-                                # Debug: Log extracted latitudeWind and longitudeWind
-                                print(f"Extracted max wind for period {i}: latitudeWind={latitudeWind[0, i]}, longitudeWind={longitudeWind[0, i]}")
-
-                                rankWind += 1
-                                rankWindStr = str(rankWind)
-                                wind[0, i] = codes_get(ibufr, f'#{rankWindStr}#windSpeedAt10M')
-                                print(f"Extracted wind for period {i}: windSpeed={wind[0, i]}")
-                            else:
-                                print(f"WARNING: unexpected meteorologicalAttributeSignificance={significance} for period {i}. Skipping this forecast period.")
-                                continue
-
-                        # Check if the BUFR message contains valid data for the main operational run
-                        if not codes_is_defined(ibufr, 'ensembleForecastType'):
-                            print("checking for valid data")
-                            continue
+                        inum = int(stormIdentifier[:2])  # Extract the storm number
+                        bchar = stormIdentifier[2]       # Extract the basin character
+                    except (ValueError, IndexError) as e:
+                        print(f"Error parsing stormIdentifier '{stormIdentifier}': {e}")
+                        inum = -1  # Assign a default value or handle the error appropriately
+                        bchar = 'X'
+
+                    # Debug: Log extracted storm information
+                    print(f"Extracted storm information: year={year}, month={month}, day={day}, hour={hour}, "
+                          f"inum={inum}, bchar={bchar}, stormIdentifier={stormIdentifier}")
+
+                    # Ensure these variables are defined before use
+                    if year is None or month is None or day is None or hour is None or inum == -1:
+                        print("Error: Missing or invalid storm information in BUFR message.")
+                        return
+
+                    # Correct ATCFID generation based on stormIdentifier
+                    atcfid, found = self.match_atcf_id(fix_lat, fix_lon, year, month, day, hour, inum, bchar)
+
+                    # Debug: Log the result of match_atcf_id
+                    print(f"ATCFID: {atcfid}, Found: {found}")
+
+                    if not found:
+                        if not doform:
+                            print("ATCF ID not found and doform is False. Skipping this message.")
+                        basin = 'XX'
+                        if bchar == 'L': basin = 'AL'
+                        if bchar == 'E': basin = 'EP'
+                        if bchar == 'W': basin = 'WP'
+                        if bchar == 'S': basin = 'SH'
+                        atcfid = f"{basin}{inum:02d}{year:04d}"  # Correctly use storm number and year
+                        print(atcfid)
+                    
+                    basin = atcfid[:2]
+                    
+                    # Extract storm number (snum) from ATCF ID
+                    try:
+                        snum = int(atcfid[2:4])  # Extract storm number from ATCF ID
+                    except ValueError:
+                        print(f"Error extracting storm number from ATCFID: {atcfid}")
+                        snum = -1  # Assign a default value or handle the error appropriately
 
-                        # Get the forecast type and ensure it is the main operational run
-                        try:
-                            forecastType = codes_get(ibufr, 'ensembleForecastType')
-                            print(forecastType)
-                            if forecastType != 0:  # 0 indicates the main operational run
-                                continue
-                        except CodesInternalError:
-                            continue
+                    # Debug: Log the extracted storm number
+                    print(f"Storm number (snum): {snum}")
 
-                        # Extract basic storm information
-                        try:
-                            year = codes_get(ibufr, 'year')
-                            month = codes_get(ibufr, 'month')
-                            day = codes_get(ibufr, 'day')
-                            hour = codes_get(ibufr, 'hour')
-                            minute = codes_get(ibufr, 'minute')
-                            stormIdentifier = codes_get(ibufr, 'stormIdentifier')
-                        except CodesInternalError as e:
-                            print(f"Error extracting storm information: {e}")
-                            return
-
-                        # Extract storm number (inum) and basin character (bchar) from stormIdentifier
-                        try:
-                            inum = int(stormIdentifier[:2])  # Extract the storm number
-                            bchar = stormIdentifier[2]       # Extract the basin character
-                        except (ValueError, IndexError) as e:
-                            print(f"Error parsing stormIdentifier '{stormIdentifier}': {e}")
-                            inum = -1  # Assign a default value or handle the error appropriately
-                            bchar = 'X'
-
-                        # Debug: Log extracted storm information
-                        print(f"Extracted storm information: year={year}, month={month}, day={day}, hour={hour}, "
-                              f"inum={inum}, bchar={bchar}, stormIdentifier={stormIdentifier}")
-
-                        # Ensure these variables are defined before use
-                        if year is None or month is None or day is None or hour is None or inum == -1:
-                            print("Error: Missing or invalid storm information in BUFR message.")
-                            return
-
-                        # Correct ATCFID generation based on stormIdentifier
-                        atcfid, found = self.match_atcf_id(fix_lat, fix_lon, year, month, day, hour, inum, bchar)
-
-                        # Debug: Log the result of match_atcf_id
-                        print(f"ATCFID: {atcfid}, Found: {found}")
-
-                        if not found:
-                            if not doform:
-                                print("ATCF ID not found and doform is False. Skipping this message.")
-                            basin = 'XX'
-                            if bchar == 'L': basin = 'AL'
-                            if bchar == 'E': basin = 'EP'
-                            if bchar == 'W': basin = 'WP'
-                            if bchar == 'S': basin = 'SH'
-                            atcfid = f"{basin}{inum:02d}{year:04d}"  # Correctly use storm number and year
-                            print(atcfid)
-                        
-                        basin = atcfid[:2]
+                    if basin == 'XX' and not doform:
+                        continue
                         
-                        # Extract storm number (snum) from ATCF ID
+                    atfile = f"A{atcfid}.DAT"
+
+                    # Ensure snum is extracted again if atcfid is updated
+                    if atcfid != 'XX999999':
                         try:
-                            snum = int(atcfid[2:4])  # Extract storm number from ATCF ID
+                            snum = int(atcfid[2:4])  # Extract storm number from updated ATCF ID
                         except ValueError:
-                            print(f"Error extracting storm number from ATCFID: {atcfid}")
+                            print(f"Error extracting storm number from updated ATCFID: {atcfid}")
                             snum = -1  # Assign a default value or handle the error appropriately
 
-                        # Debug: Log the extracted storm number
-                        print(f"Storm number (snum): {snum}")
-
-                        if basin == 'XX' and not doform:
+                    # Debug: Log the extracted storm number after update
+                    print(f"Updated storm number (snum): {snum}")
+
+                    hasCentre, fcst_mslp, fcst_vmax, fcst_mrd = self.derive_track_fields(arrays)
+                    hasWind = fcst_vmax != -999
+
+                    if ensemble:
+                        # The high resolution run (forecastType 0) is also member 0, only the control is EC00
+                        subsets = np.flatnonzero(arrays['forecastType'] != 0)
+                        if hasCentre[subsets].any():
+                            dtg = f"{year:04d}{month:02d}{day:02d}{hour:02d}"
+                            ens = self.ens.get((atcfid, dtg))
+                            if ens is None:
+                                ens = EnsembleForecast()
+                                ens.basin = basin
+                                ens.cyNum = snum
+                                ens.DTG = dtg
+                                ens.stormname = stormName
+                                self.ens[(atcfid, dtg)] = ens
+                            lat = np.where(hasCentre, latitude, -999)[subsets]
+                            lon = np.where(hasCentre, longitude, -999)[subsets]
+                            ens.add_members(arrays['member'][subsets], period, lat, lon, fcst_mslp[subsets],
+                                            fcst_vmax[subsets], fcst_mrd[subsets])
+                            print(f"Added {len(subsets)} ensemble members to {atcfid} {dtg}")
+                        if not mainRun.size:
                             continue
-                            
-                        atfile = f"A{atcfid}.DAT"
-
-                        # Ensure snum is extracted again if atcfid is updated
-                        if atcfid != 'XX999999':
-                            try:
-                                snum = int(atcfid[2:4])  # Extract storm number from updated ATCF ID
-                            except ValueError:
-                                print(f"Error extracting storm number from updated ATCFID: {atcfid}")
-                                snum = -1  # Assign a default value or handle the error appropriately
-
-                        # Debug: Log the extracted storm number after update
-                        print(f"Updated storm number (snum): {snum}")
-
-                        skipMember = 1
-                        for j in range(len(period)):
-                            if (latitude[0, j] != CODES_MISSING_DOUBLE or 
-                                latitudeWind[0, j] != CODES_MISSING_DOUBLE):
-                                skipMember = 0
-                                break
-                        
-                        if skipMember != 1:
-                            mytech = 'ECM '  # Main operational run identifier
-
-                            # Create new forecast record
-                            new_fcst = ForecastTrack()
-                            new_fcst.basin = basin
-                            new_fcst.cyNum = snum
-                            new_fcst.DTG = f"{year:04d}{month:02d}{day:02d}{hour:02d}"
-                            new_fcst.jdnow = 0
-                            new_fcst.technum = 3
-                            new_fcst.tech = mytech
-                            new_fcst.stormname = ''
-
-                            jnow = 0
-                            for j in range(len(period)):  # Iterate over all periods, including tau = 0
-                                if j == 0:  # Handle the analysis period (tau = 0)
-                                    if latitude[0, j] != CODES_MISSING_DOUBLE and longitude[0, j] != CODES_MISSING_DOUBLE:
-                                        # Process initial storm center data
-                                        print(f"Processing initial storm center (tau = 0): latitude={latitude[0, j]}, longitude={longitude[0, j]}")
-                                        print(aaa)
-                                        fcst_lat = latitude[0, j]
-                                        fcst_lon = longitude[0, j]
-                                        fcst_mslp = pressure[0, j] / 100.0  # Convert pressure to hPa
-                                        fcst_vmax = -999  # No max wind data for tau = 0
-                                        fcst_mrd = -999  # No radius of max wind for tau = 0
-                                    else:
-                                        # Skip if initial storm center data is missing
-                                        print("Skipping initial storm center (tau = 0) due to missing data.")
-                                        continue
-                                else:
-                                    # Handle forecast periods (tau > 0)
-                                    if latitude[0, j] != CODES_MISSING_DOUBLE and longitude[0, j] != CODES_MISSING_DOUBLE:
-                                        # Process storm center data
-                                        print(f"Processing storm center for period {j}: latitude={latitude[0, j]}, longitude={longitude[0, j]}")
-                                        fcst_lat = latitude[0, j]
-                                        fcst_lon = longitude[0, j]
-                                        fcst_mslp = pressure[0, j] / 100.0  # Convert pressure to hPa
-                                    else:
-                                        # Skip if storm center data is missing
-                                        print(f"Skipping period {j} due to missing storm center data.")
-                                        continue
-
-                                    # Check if the next period (even period) has max wind data
-                                    if j + 1 < len(period) and latitudeWind[0, j + 1] != CODES_MISSING_DOUBLE and longitudeWind[0, j + 1] != CODES_MISSING_DOUBLE:
-                                        # Process max wind data
-                                        print(f"Processing max wind for period {j + 1}: latitudeWind={latitudeWind[0, j + 1]}, longitudeWind={longitudeWind[0, j + 1]}")
-                                        fcst_vmax = wind[0, j + 1] * MS2KTS  # Convert wind speed to knots
-                                        dist, angle = self.gcdist(
-                                            latitude[0, j], longitude[0, j],
-                                            latitudeWind[0, j + 1], longitudeWind[0, j + 1]
-                                        )
-                                        fcst_mrd = dist / NM2M  # Convert distance to nautical miles
-                                        if fcst_mrd > 70:
-                                            fcst_mrd = 70.0  # Limit to prevent superstorms
-                                    else:
-                                        # Default values if max wind data is missing
-                                        print(f"Skipping period {j + 1} due to missing max wind data.")
-                                        fcst_vmax = -999
-                                        fcst_mrd = -999
-
-                                # Increment track index
-                                jnow += 1
-
-                                # Store track data
-                                new_fcst.track[jnow]['tau'] = period[j]
-                                new_fcst.track[jnow]['lat'] = fcst_lat
-                                new_fcst.track[jnow]['lon'] = fcst_lon
-                                new_fcst.track[jnow]['mslp'] = fcst_mslp
-                                new_fcst.track[jnow]['vmax'] = fcst_vmax
-                                new_fcst.track[jnow]['mrd'] = fcst_mrd
-
-                                print(f"Saved track data for period {j}: tau={period[j]}, lat={fcst_lat}, lon={fcst_lon}, "
-                                      f"mslp={fcst_mslp}, vmax={fcst_vmax}, mrd={fcst_mrd}")
-
-                            # Append the forecast record
-                            self.fcst.append(new_fcst)
-                            self.num_fcst += 1
-                        else:
-                            continue
-                        
-                        # Debug: Log the number of forecast records before writing to ATCF file
-                        print(f"Total forecast records: {self.num_fcst}")
-                        print(new_fcst)
-
-                        # Write output to ATCF file
-                        if self.num_fcst > 0:
-                            print(f"Number of forecast records: {self.num_fcst}")  # Debug statement
-                            print(f"ATCF file name: {atfile}")  # Debug statement
-                            with open(atfile, 'w') as f:
-                                self.sort_fcst_records()
-                                for i in range(self.num_fcst):
-                                    self.write_fcst_record(i, atfile, infile)  # Pass atfile as an argument
-                            print(f"Wrote {self.num_fcst} forecasts to {atfile}.")
-                        else:
-                            print("No forecast records generated. Skipping ATCF file creation.")
-                            print("Check if forecast data is valid and being appended to self.fcst.")
-                    except CodesInternalError as e:
+
+                    # The main run is kept in ensemble mode too, so the file has it next to the members
+                    member = mainRun[0]
+                    skipMember = 1
+                    if hasCentre[member].any() or hasWind[member].any():
+                        skipMember = 0
+                    
+                    if skipMember != 1:
+                        mytech = 'ECM '  # Main operational run identifier
+
+                        # Create new forecast record
+                        new_fcst = ForecastTrack()
+                        new_fcst.basin = basin
+                        new_fcst.cyNum = snum
+                        new_fcst.DTG = f"{year:04d}{month:02d}{day:02d}{hour:02d}"
+                        new_fcst.jdnow = dtg_hours(year, month, day, hour)
+                        new_fcst.technum = 3
+                        new_fcst.tech = mytech
+                        new_fcst.stormname = stormName
+                        print(f"Storm Name: {stormName}")
+
+                        # Keep the analysis storm center so writing needs no BUFR access
+                        new_fcst.lat0 = arrays['obsLatitude'][member, 0]
+                        new_fcst.lon0 = arrays['obsLongitude'][member, 0]
+                        if wind[member, 0] != CODES_MISSING_DOUBLE:
+                            new_fcst.vmax0 = wind[member, 0] * MS2KTS
+                        if pressure[member, 0] != CODES_MISSING_DOUBLE:
+                            new_fcst.mslp0 = pressure[member, 0] / 100
+
+                        fcst_mslp = fcst_mslp[member]
+                        fcst_vmax = fcst_vmax[member].copy()
+                        fcst_mrd = fcst_mrd[member].copy()
+                        # No max wind or radius of max wind for the analysis (tau = 0), it is written from the analysis fields
+                        fcst_vmax[0] = -999
+                        fcst_mrd[0] = -999
+
+                        # Store track data, only the periods with a storm centre
+                        rows = np.flatnonzero(hasCentre[member])[:MAX_TRACK_POINTS]
+                        new_fcst.track = TrackArray.from_columns(tau=period[rows], lat=latitude[member, rows],
+                                                                 lon=longitude[member, rows], vmax=fcst_vmax[rows],
+                                                                 mslp=fcst_mslp[rows], mrd=fcst_mrd[rows])
+
+                        # Group the forecast record with the rest of its storm
+                        self.add_storm_forecast(atcfid, new_fcst)
+                        print(f"Forecast records for {atcfid}: {self.store.count(atcfid)}")
+                    else:
                         continue
-                    except ValueError as e:
-                        break
-                    finally:
-                        # Ensure BUFR message is released
-                        if ibufr is not None:
-                            codes_release(ibufr)
-                    count += 1
+                except ValueError as e:
+                    break
+
+            # Each storm is written once, after the whole file is read: the main run, then a block of members per cycle
+            for atcfid in sorted(set(self.store.atcfids()) | set(atcfid for atcfid, _ in self.ens)):
+                atfile = f"A{atcfid}.DAT"
+                cycles = [self.ens[key] for key in sorted(self.ens) if key[0] == atcfid]
+                self.write_storm_records(atcfid, atfile, cycles)
+                print(f"Wrote {self.num_fcst} forecasts and {len(cycles)} cycles of "
+                      f"{sum(len(ens.member) for ens in cycles)} ensemble members to {atfile}.")
+            if not len(self.store) and not self.ens:
+                print("No forecast records generated. Skipping ATCF file creation.")
         except OSError as e:
             print(f"File operation error: {e}")
         except Exception as e:
             print(f"Unexpected error: {e}")
+        if cache is not None and jobs <= 1:
+            print(f"Cache hits: {cache.hits}, misses: {cache.misses}")
         print("end of mashed up code")
 
+# Per process decoder, index and cache used by the -jobs worker pool
+worker_decoder = None
+worker_index = None
+worker_cache = None
+
+def init_read_worker(infile, cachedir=None, cache_mb=0, numpy_decode=False):
+    """Open the BUFR index and cache once in each worker process"""
+    global worker_decoder, worker_index, worker_cache
+    worker_decoder = ATCFDecoder()
+    worker_decoder.numpy_decode = numpy_decode
+    worker_index = BufrIndex(infile)
+    if cachedir is not None:
+        worker_cache = BufrCache(cachedir, cache_mb)
+
+def read_message_worker(task):
+    """Decode one message in a worker process, returning its compact track arrays"""
+    n, ensemble = task
+    return worker_decoder.read_indexed_message(worker_index, n, ensemble, worker_cache)
+
 def main():
+    claim_stdout()
     if len(sys.argv) < 2:
-        print("Usage: python dc_ecmf.py -in <input_file> [-source <source>] [-doform]")        
+        print("Usage: python dc_ecmf.py -in <input_file|-> [-source <source>] [-doform] [-ensemble] [-storm <id>] [-date <yyyymmddhh>] [-jobs <n>] [-cache <dir>] [-cachesize <MB>] [-numpy]")        
         return
         
     # Parse command line arguments
     infile = ''
     source = 'ECMF'
     doform = False
+    ensemble = False
+    storm = None
+    date = None
+    jobs = 1
+    cachedir = None
+    cache_mb = DEFAULT_CACHE_MB
+    numpy_decode = False
     
     i = 1
     while i < len(sys.argv):
@@ -550,10 +690,29 @@ def main():
             source = sys.argv[i]
         elif sys.argv[i] == "-doform":
             doform = True
+        elif sys.argv[i] == "-ensemble":
+            ensemble = True
+        elif sys.argv[i] == "-storm":
+            i += 1
+            storm = sys.argv[i]
+        elif sys.argv[i] == "-date":
+            i += 1
+            date = int(sys.argv[i])
+        elif sys.argv[i] == "-jobs":
+            i += 1
+            jobs = int(sys.argv[i])
+        elif sys.argv[i] == "-cache":
+            i += 1
+            cachedir = sys.argv[i]
+        elif sys.argv[i] == "-cachesize":
+            i += 1
+            cache_mb = float(sys.argv[i])
+        elif sys.argv[i] == "-numpy":
+            numpy_decode = True
         i += 1
 
     decoder = ATCFDecoder()
-    decoder.decode_ecmf_bufr(infile, doform, source)
+    decoder.decode_ecmf_bufr(infile, doform, source, ensemble, storm, date, jobs, cachedir, cache_mb, numpy_decode)
 
 if __name__ == "__main__":
     main()
@@ -1,7 +1,13 @@
 import os
 import sys
-from datetime import datetime
-from typing import NamedTuple, List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict
+from atcf_record import TrackPoint, ForecastRecord
+from atcf_time import dtg_hours
+from atcf_index import ForecastIndex
+from atcf_coordinator import write_forecast
+from atcf_ndjson import claim_stdout
+from atomic_file import locked_append
+from atcf_archive import output_open
 
 # Constants and module-level variables
 JMEE_HDR_FMT = "(I4,I2,I2,I2,x,I2,A1,x,A10,x,I3,2x,I2,x,I3,x,I2,x,A4,x,I4)"
@@ -16,65 +22,18 @@ SCAN_HDR = 0
 SCAN_FST = 1
 SCAN_POS = 2
 
-# Data structures
-class TrackPoint(NamedTuple):
-    tau: int
-    lat: float
-    lon: float
-    vmax: float
-    mslp: int
-    mrd: int
-    ty: str = "  "
-
-class ForecastRecord(NamedTuple):
-    basin: str
-    cyNum: int
-    DTG: str
-    jdnow: float
-    technum: int
-    tech: str
-    stormname: str
-    track: List[TrackPoint]
-
 # Global variables
 num_fcst = 0
 fcst_records: List[ForecastRecord] = []
 inbuffy = ""
 
 # Include equivalent functions from atcf_module (not provided in original)
-def djuliana(mm: int, dd: int, yy: int, hh: float) -> float:
-    """Approximate Julian date calculation - replace with more accurate version if needed"""
-    # This is a simplified version - should be replaced with proper Julian date calculation
-    return float(datetime(yy, mm, dd).toordinal() + hh / 24.0
-
 def clear_internal_atcf():
     """Clear internal ATCF records"""
     global num_fcst, fcst_records
     num_fcst = 0
     fcst_records = []
 
-def get_atcf_records(atfile: str, tech_filter: str):
-    """Load ATCF records from file - placeholder for actual implementation"""
-    global num_fcst, fcst_records
-    # This should be implemented to read actual ATCF files
-    pass
-
-def sort_carq_records():
-    """Sort CARQ records - placeholder for actual implementation"""
-    pass
-
-def write_carq_record(i: int):
-    """Write CARQ record - placeholder for actual implementation"""
-    pass
-
-def sort_fcst_records():
-    """Sort forecast records - placeholder for actual implementation"""
-    pass
-
-def write_fcst_record(i: int):
-    """Write forecast record - placeholder for actual implementation"""
-    pass
-
 def match_jma_id(jmaid: int, yy: int) -> Tuple[str, bool]:
     """Match JMA ID to ATCF ID using cross-reference file"""
     found = False
@@ -104,7 +63,7 @@ def match_jma_id(jmaid: int, yy: int) -> Tuple[str, bool]:
 def update_jma_id(jmaid: int, atcfid: str):
     """Update JMA ID to ATCF ID cross-reference file"""
     print(f"Updating RSMC Reunion cross reference file {jmaid} {atcfid}")
-    with open('fmee_atcf.xref', 'a') as f:
+    with locked_append('fmee_atcf.xref') as f:
         f.write(f"{jmaid} {atcfid}\n")
 
 def match_atcf_id(fix_lat: float, fix_lon: float, yy: int, mm: int, dd: int, hh: int) -> Tuple[str, bool]:
@@ -135,6 +94,7 @@ def getline() -> Tuple[str, bool]:
 
 def main():
     global num_fcst, fcst_records, inbuffy, UINP, USQL
+    claim_stdout()
     
     print("\nRSMC Reunion to ATCF Track File Version 1.5")
     print("Build data placeholder")  # Replace with actual build data
@@ -244,7 +204,7 @@ def main():
                 break
         
         # Calculate Julian date
-        jdnow = djuliana(mm, dd, yy, hh * 1.0)
+        jdnow = dtg_hours(yy, mm, dd, hh)
         
         # Match ATCF ID
         found = False
@@ -310,40 +270,26 @@ def main():
         
         # Prepare ATCF file
         atfile = f"A{atcfid}.fmee"
-        valid = os.path.exists(atfile)
-        if not valid:
-            print(f"*Caution* {atfile} does not exist!")
-            num_fcst = 0
-        else:
-            clear_internal_atcf()
-            get_atcf_records(atfile, 'ANY ')
-        
-        jdmsg = djuliana(mm, dd, yy, hh * 1.0)
-        found = False
-        
-        # Check if forecast already exists
-        for record in fcst_records:
-            if record.tech == 'FMEE' and abs(record.jdnow - jdmsg) < 1.0/24:
-                found = True
-                break
+        jdmsg = dtg_hours(yy, mm, dd, hh)
         
-        if found:
+        # Check if forecast already exists, in the sidecar index without reading the A-deck
+        index = ForecastIndex(atfile)
+        if index.contains('FMEE', f"{yy:04d}{mm:02d}{dd:02d}{hh:02d}"):
             print('Forecast already in ATCF file')
             sys.exit(0)
         
+        if not os.path.exists(atfile):
+            print(f"*Caution* {atfile} does not exist!")
+        clear_internal_atcf()
+        
         # Create new forecast record
         inum = int(atcfid[2:4]) if len(atcfid) >= 4 else 0
         dtg = f"{yy:04d}{mm:02d}{dd:02d}{hh:02d}"
         
-        # Initialize track points
-        track = []
-        for _ in range(36):
-            track.append(TrackPoint(tau=0, lat=-999, lon=0, vmax=0, mslp=0, mrd=0))
-        
         # Add initial position
         numfpos = 1
-        track[0] = TrackPoint(tau=0, lat=fix_lat, lon=fix_lon, 
-                            vmax=ivmax * 1.25, mslp=mslp, mrd=rmax)
+        track = [TrackPoint(tau=0, lat=fix_lat, lon=fix_lon,
+                            vmax=ivmax * 1.25, mslp=mslp, mrd=rmax)]
         
         vmax = ivmax * 1.25
         yy0, mm0, dd0, hh0 = yy, mm, dd, hh
@@ -374,11 +320,10 @@ def main():
             except (ValueError, IndexError):
                 continue
             
-            if numfpos < 36:
-                track[numfpos] = TrackPoint(tau=vt, lat=tlat, lon=tlon, 
-                                          vmax=ivmax * 1.25, mslp=0, mrd=0)
-                numfpos += 1
-                print(f"{vt} {tlat} {tlon} {ivmax * 1.25}")
+            track.append(TrackPoint(tau=vt, lat=tlat, lon=tlon,
+                                    vmax=ivmax * 1.25, mslp=0, mrd=0))
+            numfpos += 1
+            print(f"{vt} {tlat} {tlon} {ivmax * 1.25}")
         
         # Create forecast record
         new_record = ForecastRecord(
@@ -389,27 +334,16 @@ def main():
             technum=1,
             tech='FMEE',
             stormname='',
-            track=track[:numfpos]
+            track=track
         )
         
-        fcst_records.append(new_record)
-        num_fcst += 1
     
-    # Write output files
-    with open(atfile, 'w') as UnitAT:
-        sort_carq_records()
-        # Placeholder for writing CARQ records
-        # for i in range(num_carq):
-        #     write_carq_record(i)
-        
-        sort_fcst_records()
-        # Placeholder for writing forecast records
-        # for i in range(num_fcst):
-        #     write_fcst_record(i)
+    # Write output files, the A-deck directly or through the writer coordinator
+    write_forecast(atfile, new_record, index)
     
     print(f"Updated {atcfid} ATCF file.")
     
-    with open('fmee_updated.dat', 'a') as f:
+    with locked_append('fmee_updated.dat') as f:
         f.write(f"{atcfid}\n")
     
     # Write SQL file
@@ -419,7 +353,7 @@ def main():
         hh1 = 0
     
     fname = f"{atcfid}_message.sql"
-    with open(fname, 'w') as USQL:
+    with output_open(fname) as USQL:
         USQL.write("INSERT INTO rsfc_messages (atcfid,rsfcid,msg_hdr,msg_type,msg_advnr,msg_time,fcst_time,lat,lon,vmax,mslp,movement,message,geom) VALUES(\n")
         USQL.write(f"    '{atcfid}',\n")
         USQL.write(f"    '{jmaid:02d}/{season:08d}',\n")
@@ -2,25 +2,12 @@ import sys
 import os
 from datetime import datetime
 import re
-
-class TrackPoint:
-    def __init__(self):
-        self.tau = 0
-        self.lat = -999.0
-        self.lon = -999.0
-        self.vmax = 0
-        self.ty = '  '
-
-class Forecast:
-    def __init__(self):
-        self.basin = ''
-        self.cyNum = 0
-        self.DTG = ''
-        self.jdnow = 0.0
-        self.technum = 0
-        self.tech = ''
-        self.stormname = ''
-        self.track = [TrackPoint() for _ in range(36)]
+from atcf_record import TrackPoint, ForecastRecord
+from atcf_time import dtg_hours, previous_month
+from atcf_index import ForecastIndex
+from atcf_coordinator import write_forecast
+from atcf_ndjson import claim_stdout
+from atomic_file import locked_append
 
 class ATCFProcessor:
     def __init__(self):
@@ -36,10 +23,6 @@ class ATCFProcessor:
         self.num_carq = 0
         self.carq = []
 
-    def djuliana(self, mm: int, dd: int, yy: int, hh: float) -> float:
-        """Simplified Julian date calculation"""
-        return datetime(yy, mm, dd).toordinal() + 1721425 + hh/24.0
-
     def match_jma_id(self, jmaid: int) -> tuple:
         """Match JMA ID from xref file"""
         xref_file = 'jma_atcf.xref'
@@ -57,7 +40,7 @@ class ATCFProcessor:
 
     def update_jma_id(self, jmaid: int, atcfid: str):
         """Update JMA cross-reference file"""
-        with open('jma_atcf.xref', 'a') as f:
+        with locked_append('jma_atcf.xref') as f:
             f.write(f"{jmaid:04d} {atcfid}\n")
         print(f"Updating JMA cross reference file {jmaid} {atcfid}")
 
@@ -115,8 +98,8 @@ class ATCFProcessor:
                 yy = now.year
                 mm = now.month
                 if dd > now.day:
-                    mm -= 1
-                jdnow = self.djuliana(mm, dd, yy, hh)
+                    yy, mm = previous_month(yy, mm)  # Last month's advisory
+                jdnow = dtg_hours(yy, mm, dd, hh)
 
                 # Match ATCF ID
                 atcfid, found = ("", False)
@@ -129,28 +112,23 @@ class ATCFProcessor:
                     print(f"No ATCF match {yy}-{mm}-{dd} {hh}:00 {lat}/{lon}")
                     continue
 
-                # Check for existing forecast
+                # Check for existing forecast, in the sidecar index without reading the A-deck
                 atfile = f"A{atcfid}.jma"
+                index = ForecastIndex(atfile)
+                if index.contains('RJTD', f"{yy:04d}{mm:02d}{dd:02d}{hh:02d}"):
+                    print("Forecast already in ATCF file")
+                    continue
                 if not os.path.exists(atfile):
                     print(f"*Caution* {atfile} does not exist!")
-                    self.num_fcst = 0
-                else:
-                    self.clear_internal_atcf()
-                    # Implement ATCF file loading here
+                self.clear_internal_atcf()
 
                 # Create new forecast record
-                new_fcst = Forecast()
-                new_fcst.basin = atcfid[:2]
-                new_fcst.cyNum = int(atcfid[2:4])
-                new_fcst.DTG = f"{yy:04d}{mm:02d}{dd:02d}{hh:02d}"
-                new_fcst.jdnow = jdnow
-                new_fcst.technum = 1
-                new_fcst.tech = 'RJTD'
+                new_fcst = ForecastRecord(basin=atcfid[:2], cyNum=int(atcfid[2:4]),
+                                          DTG=f"{yy:04d}{mm:02d}{dd:02d}{hh:02d}", jdnow=jdnow,
+                                          technum=1, tech='RJTD')
 
                 # Process forecast positions
-                new_fcst.track[0].tau = 0
-                new_fcst.track[0].lat = lat
-                new_fcst.track[0].lon = lon
+                new_fcst.track.append(TrackPoint(tau=0, lat=lat, lon=lon, vmax=0))
                 ivmax = 0
 
                 # Read forecast data
@@ -193,27 +171,18 @@ class ATCFProcessor:
                                 ivmax = int(mxwd_line[6:9].strip())
                                 break
 
-                        if numfpos < 36:
-                            new_fcst.track[numfpos].tau = vt
-                            new_fcst.track[numfpos].lat = lat
-                            new_fcst.track[numfpos].lon = lon
-                            new_fcst.track[numfpos].vmax = ivmax
-                            numfpos += 1
-
-                # Save forecast
-                self.fcst.append(new_fcst)
-                self.num_fcst += 1
+                        new_fcst.track.append(TrackPoint(tau=vt, lat=lat, lon=lon, vmax=ivmax))
+                        numfpos += 1
 
-                # Write output file
-                with open(atfile, 'w') as atf:
-                    # Implement ATCF writing logic here
-                    pass
+                # Write output file, directly or through the writer coordinator
+                write_forecast(atfile, new_fcst, index)
 
                 print(f"Updated {atcfid} ATCF file.")
-                with open('jma_updated.dat', 'a') as sqlf:
+                with locked_append('jma_updated.dat') as sqlf:
                     sqlf.write(f"{atcfid}\n")
 
 def main():
+    claim_stdout()
     processor = ATCFProcessor()
     
     print("\nNP/JMA to ATCF Track File Version 1.2")
@@ -227,7 +196,7 @@ def main():
             infile = args[i+1]
             break
 
-    if not infile or not os.path.exists(infile)):
+    if not infile or not os.path.exists(infile):
         print(f"*Error* {infile} does not exist!")
         sys.exit(1)
 
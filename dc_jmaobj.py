@@ -1,7 +1,13 @@
 import sys
 import os
 from datetime import datetime
-from typing import NamedTuple, List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict
+from atcf_record import TrackPoint, ForecastRecord
+from atcf_time import dtg_hours, previous_month
+from atcf_index import ForecastIndex
+from atcf_coordinator import write_forecast
+from atcf_ndjson import claim_stdout
+from atomic_file import locked_append
 
 # Constants equivalent to the Fortran module
 JMV_HDR_FMT = "(I4,I2,I2,I2,x,I2,A1,x,A10,x,I3,2x,I2,x,I3,x,I2,x,A4,x,I4)"
@@ -13,37 +19,12 @@ SCAN_HDR = 0
 SCAN_FST = 1
 SCAN_POS = 2
 
-# Data structures to replace Fortran records
-class TrackPoint(NamedTuple):
-    tau: int
-    lat: float
-    lon: float
-    vmax: int
-    mslp: int
-    ty: str = '  '
-
-class ForecastRecord(NamedTuple):
-    basin: str
-    cyNum: int
-    DTG: str
-    jdnow: float
-    technum: int
-    tech: str
-    stormname: str
-    track: List[TrackPoint]
-
 # Global variables to replace Fortran common blocks
 fcst_records: List[ForecastRecord] = []
 carq_records: List[dict] = []  # Simplified for this example
 num_fcst = 0
 num_carq = 0
 
-def djuliana(mm: int, dd: int, yy: int, hh: float) -> float:
-    """Convert date to Julian day (simplified implementation)"""
-    # Note: This is a simplified version. For precise calculations, consider using datetime or specialized libraries
-    dt = datetime(yy, mm, dd) if yy > 100 else datetime(1900 + yy, mm, dd)
-    return dt.timestamp() / 86400 + 2440587.5 + hh/24  # Unix epoch to Julian day conversion
-
 def clear_internal_atcf():
     """Clear internal ATCF records"""
     global fcst_records, carq_records, num_fcst, num_carq
@@ -52,41 +33,6 @@ def clear_internal_atcf():
     num_fcst = 0
     num_carq = 0
 
-def get_atcf_records(atfile: str, tech_filter: str):
-    """Load ATCF records from file (simplified implementation)"""
-    global fcst_records, num_fcst
-    # In a real implementation, this would parse the ATCF file format
-    # For now, we'll just mock the functionality
-    if os.path.exists(atfile):
-        print(f"Loading {atfile}")
-        # This would actually parse the file and populate fcst_records
-    else:
-        print(f"*Caution* {atfile} does not exist!")
-
-def sort_fcst_records():
-    """Sort forecast records (simplified implementation)"""
-    global fcst_records
-    # In a real implementation, this would sort by some criteria
-    pass
-
-def sort_carq_records():
-    """Sort CARQ records (simplified implementation)"""
-    global carq_records
-    # In a real implementation, this would sort by some criteria
-    pass
-
-def write_fcst_record(idx: int):
-    """Write forecast record to file (simplified implementation)"""
-    # In a real implementation, this would write in ATCF format
-    record = fcst_records[idx]
-    print(f"Writing forecast record: {record}")
-
-def write_carq_record(idx: int):
-    """Write CARQ record to file (simplified implementation)"""
-    # In a real implementation, this would write in ATCF format
-    record = carq_records[idx]
-    print(f"Writing CARQ record: {record}")
-
 def match_jma_id(jmaid: int, yy: int) -> Tuple[str, bool]:
     """Match JMA ID to ATCF ID using cross-reference file"""
     found = False
@@ -117,7 +63,7 @@ def match_jma_id(jmaid: int, yy: int) -> Tuple[str, bool]:
 def update_jma_id(jmaid: int, atcfid: str):
     """Update JMA cross-reference file with new ID"""
     print(f"Updating JMA cross reference file {jmaid} {atcfid}")
-    with open('jma_atcf.xref', 'a') as f:
+    with locked_append('jma_atcf.xref') as f:
         f.write(f"{jmaid} {atcfid}\n")
 
 def match_atcf_id(lat: float, lon: float, yy: int, mm: int, dd: int, hh: int) -> Tuple[str, bool]:
@@ -130,6 +76,7 @@ def match_atcf_id(lat: float, lon: float, yy: int, mm: int, dd: int, hh: int) ->
 
 def main():
     global fcst_records, num_fcst
+    claim_stdout()
     
     print("\nNP/JMA TEPS to ATCF Track File Version 1.0")
     print("Copyright(c) 2009-11, Charles C Watson Jr.  All Rights Reserved.\n")
@@ -201,9 +148,9 @@ def main():
         yy = now.year
         mm = now.month
         if dd > now.day:
-            mm -= 1
+            yy, mm = previous_month(yy, mm)
         
-        jdnow = djuliana(mm, dd, yy, hh * 1.0)
+        jdnow = dtg_hours(yy, mm, dd, hh)
         
         # Match JMA ID or position to ATCF ID
         atcfid = ""
@@ -232,24 +179,18 @@ def main():
         
         # Process ATCF file
         atfile = f"A{atcfid}.jmaobj"
-        if not os.path.exists(atfile):
-            print(f"*Caution* {atfile} does not exist!")
-            num_fcst = 0
-        else:
-            clear_internal_atcf()
-            get_atcf_records(atfile, 'ANY ')
+        jdmsg = dtg_hours(yy, mm, dd, hh)
         
-        jdmsg = djuliana(mm, dd, yy, hh * 1.0)
-        found = False
-        for rec in fcst_records:
-            if rec.tech == 'JMAE' and abs(rec.jdnow - jdmsg) < 1.0/24:
-                found = True
-                break
-        
-        if found:
+        # Check if forecast already exists, in the sidecar index without reading the A-deck
+        index = ForecastIndex(atfile)
+        if index.contains('JMAE', f"{yy:04d}{mm:02d}{dd:02d}{hh:02d}"):
             print("Forecast already in ATCF file")
             return
         
+        if not os.path.exists(atfile):
+            print(f"*Caution* {atfile} does not exist!")
+        clear_internal_atcf()
+        
         # Read forecast data
         ivmax = 0
         pmin = 0
@@ -269,7 +210,6 @@ def main():
                     pass
         
         # Create new forecast record
-        num_fcst += 1
         basin = atcfid[:2]
         try:
             inum = int(atcfid[2:4])
@@ -317,7 +257,7 @@ def main():
             sys.exit(1)
         
         # Add the new forecast record
-        fcst_records.append(ForecastRecord(
+        new_record = ForecastRecord(
             basin=basin,
             cyNum=inum,
             DTG=dtg,
@@ -326,20 +266,13 @@ def main():
             tech='JMAE',
             stormname='',
             track=track
-        ))
+        )
     
-    # Write output
-    with open(atfile, 'w') as f:
-        sort_carq_records()
-        for i in range(num_carq):
-            write_carq_record(i)
-        
-        sort_fcst_records()
-        for i in range(num_fcst):
-            write_fcst_record(i)
+    # Write output, the A-deck directly or through the writer coordinator
+    write_forecast(atfile, new_record, index)
     
     print(f"Updated {atcfid} ATCF file.")
-    with open('jmao_updated.dat', 'a') as f:
+    with locked_append('jmao_updated.dat') as f:
         f.write(f"{atcfid}\n")
 
 if __name__ == "__main__":
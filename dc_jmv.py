@@ -1,6 +1,9 @@
 import re
 import sys
 from datetime import datetime, timedelta
+from atcf_archive import output_open
+from atcf_record import ForecastRecord
+from atcf_ndjson import emit_forecasts, claim_stdout
 
 # "Usage: python3 dc_jtwc.py <input_file> [output_file]"
 # "If output_file is not provided, it will be auto-generated based on storm information"
@@ -102,6 +105,12 @@ def parse_and_convert_to_atcf(input_file, output_file=None):
     atcf_lines = []
     atcf_lines.extend(generate_atcf_lines(BASIN, cyclone_id, cyclone_name, warning_year, lat_tenths, lon_tenths, warning_wind, dummy, f_time, wind_radii))
 
+    # The same points as the ATCF lines, for the NDJSON sink
+    record = ForecastRecord(basin=BASIN, cyNum=int(cyclone_id), DTG=warning_dtg(warning_time), technum=1, tech='JTWC',
+                            stormname=cyclone_name)
+    record.track.append(tau=f_time, lat=signed_degrees(lat_deg, lat_dir), lon=signed_degrees(lon_deg, lon_dir),
+                        vmax=int(warning_wind), radii=radii_rows(wind_radii))
+
 
 # Now do forecasts
     # Extract forecast and process each forecast time
@@ -130,10 +139,13 @@ def parse_and_convert_to_atcf(input_file, output_file=None):
         lon_tenths = f"{int(float(lon_deg) * 10):5d}{lon_dir}"
         forecast_radii = extract_wind_radii(data, forecast_time)
         atcf_lines.extend(generate_atcf_lines(BASIN, cyclone_id, cyclone_name, warning_year, lat_tenths, lon_tenths, wind, forecast_times, lead, forecast_radii))
+        record.track.append(tau=int(lead), lat=signed_degrees(lat_deg, lat_dir), lon=signed_degrees(lon_deg, lon_dir),
+                            vmax=int(wind), radii=radii_rows(forecast_radii))
 
     # Write the ATCF lines to the output file
-    with open(output_file, "w") as file:
+    with output_open(output_file) as file:
         file.writelines(atcf_lines)
+    emit_forecasts([record])
 
 
 def extract_wind_radii(data, valid_time):
@@ -161,6 +173,27 @@ def extract_wind_radii(data, valid_time):
     return wind_radii
 
 
+def warning_dtg(warning_time, now=None):
+    """YYYYMMDDHH of a DDHHMM warning time, in last month when the day is still to come this month"""
+    now = now or datetime.utcnow()
+    day, hour = int(warning_time[:2]), int(warning_time[2:4])
+    year, month = now.year, now.month
+    if day > now.day:
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return f"{year:04d}{month:02d}{day:02d}{hour:02d}"
+
+
+def signed_degrees(value, direction):
+    """Degrees of a latitude or longitude, north and east positive"""
+    return -float(value) if direction in ('S', 'W') else float(value)
+
+
+def radii_rows(wind_radii):
+    """Wind radii of extract_wind_radii as 34, 50 and 64 kt rows of NE, SE, SW, NW, 0 where missing"""
+    return [[int(r) if r is not None else 0 for r in (wind_radii.get(wind) or [None] * 4)]
+            for wind in ("034", "050", "064")]
+
+
 def format_radii_value(value):
     """
     Formats a radius value, omitting it if it's missing or invalid.
@@ -224,6 +257,7 @@ def extend_tuples_with_integer(list_of_tuples, integers):
     return extended_list
 
 if __name__ == "__main__":
+    claim_stdout()
     # Ensure proper usage
     if len(sys.argv) < 2 or len(sys.argv) > 3:
         print("Usage: python3 dc_jtwc.py <input_file> [output_file]")
@@ -2,6 +2,12 @@ import sys
 import os
 from datetime import datetime
 import re
+from atcf_record import TrackPoint, ForecastRecord
+from atcf_time import dtg_hours
+from atcf_index import ForecastIndex
+from atcf_coordinator import write_forecast
+from atcf_ndjson import claim_stdout
+from atomic_file import locked_append
 
 # Constants and module-level variables
 JMEE_HDR_FMT = "(I4,I2,I2,I2,x,I2,A1,x,A10,x,I3,2x,I2,x,I3,x,I2,x,A4,x,I4)"
@@ -17,42 +23,12 @@ SCAN_FST = 1
 SCAN_POS = 2
 scan_mode = SCAN_HDR
 
-# ATCF-related structures (simplified for Python)
-class TrackPoint:
-    def __init__(self):
-        self.tau = 0
-        self.lat = -999.0
-        self.lon = -999.0
-        self.vmax = -999
-        self.mslp = -999
-        self.ty = '  '
-
-class Forecast:
-    def __init__(self):
-        self.basin = ''
-        self.cyNum = 0
-        self.DTG = ''
-        self.jdnow = 0.0
-        self.technum = 0
-        self.tech = ''
-        self.stormname = ''
-        self.track = [TrackPoint() for _ in range(36)]
-
 # Global variables
 num_fcst = 0
 fcst = []
 num_carq = 0
 carq = []
 
-def djuliana(mm, dd, yy, hh):
-    """Approximate Julian date calculation (simplified)"""
-    # Note: This is a simplified version. For precise calculations, consider using astronomy libraries
-    a = (14 - mm) // 12
-    y = yy + 4800 - a
-    m = mm + 12 * a - 3
-    jdn = dd + (153 * m + 2) // 5 + 365 * y + y // 4 - y // 100 + y // 400 - 32045
-    return jdn + (hh - 12) / 24.0
-
 def clear_internal_atcf():
     """Clear internal ATCF data structures"""
     global num_fcst, fcst, num_carq, carq
@@ -71,31 +47,6 @@ def match_atcf_id(fix_lat, fix_lon, jdnow, atcfid, found):
     atcfid[2:] = '01'  # Default storm number
     found[0] = True  # Assume we found a match for this example
 
-def get_atcf_records(atfile, tech_filter):
-    """Load ATCF records from file"""
-    # This would parse the ATCF file and populate the global fcst and carq variables
-    pass
-
-def sort_carq_records():
-    """Sort CARQ records"""
-    # Implementation would sort the carq list
-    pass
-
-def write_carq_record(i):
-    """Write CARQ record to file"""
-    # Implementation would write the record
-    pass
-
-def sort_fcst_records():
-    """Sort forecast records"""
-    # Implementation would sort the fcst list
-    pass
-
-def write_fcst_record(i):
-    """Write forecast record to file"""
-    # Implementation would write the record
-    pass
-
 def parse_numeric_field(buffy, start, length):
     """Parse numeric field from buffer, handling special characters"""
     nbuf = []
@@ -124,6 +75,7 @@ def parse_numeric_field(buffy, start, length):
 
 def main():
     global num_fcst, fcst
+    claim_stdout()
     
     print("\nRSMC Nadi (NFFN) to ATCF Track File Version 1.0")
     print("Copyright(c) 2010-2020, Charles C Watson Jr.  All Rights Reserved.\n")
@@ -213,7 +165,7 @@ def main():
             
             print(fix_lat, fix_lon, yy, mm, dd, hh)
             
-            jdnow = djuliana(mm, dd, yy, hh * 1.0)
+            jdnow = dtg_hours(yy, mm, dd, hh)
             atcfid = ''
             found = [False]
             
@@ -232,26 +184,19 @@ def main():
             clear_internal_atcf()
             
             atfile = f"A{atcfid}.nffn"
-            if not os.path.exists(atfile):
-                print(f"*Caution* {atfile} does not exist!")
-                num_fcst = 0
-            else:
-                clear_internal_atcf()
-                get_atcf_records(atfile, 'ANY ')
-            
-            jdmsg = djuliana(mm, dd, yy, hh * 1.0)
-            found_record = False
-            for i in range(num_fcst):
-                if (fcst[i].tech == 'NFFN' and abs(fcst[i].jdnow - jdmsg) < 1.0/24):
-                    found_record = True
-                    break
+            jdmsg = dtg_hours(yy, mm, dd, hh)
             
-            if found_record:
+            # Check the sidecar index, the A-deck is not read
+            index = ForecastIndex(atfile)
+            if index.contains('NFFN', f"{yy:04d}{mm:02d}{dd:02d}{hh:02d}"):
                 print("Forecast already in ATCF file")
                 continue
             
+            if not os.path.exists(atfile):
+                print(f"*Caution* {atfile} does not exist!")
+            
             # Add new forecast record
-            new_fcst = Forecast()
+            new_fcst = ForecastRecord()
             new_fcst.basin = atcfid[:2]
             try:
                 inum = int(atcfid[2:4])
@@ -267,11 +212,7 @@ def main():
             
             # Add initial position
             numfpos = 1
-            new_fcst.track[0].tau = 0
-            new_fcst.track[0].lat = fix_lat
-            new_fcst.track[0].lon = fix_lon
-            new_fcst.track[0].vmax = ivmax
-            new_fcst.track[0].mslp = mslp
+            new_fcst.track.append(TrackPoint(tau=0, lat=fix_lat, lon=fix_lon, vmax=ivmax, mslp=mslp))
             
             # Parse forecast positions
             for line in f:
@@ -303,31 +244,16 @@ def main():
                     ivmax = int(ivmax_str)
                     
                     # Add forecast point
-                    if numfpos < 36:
-                        new_fcst.track[numfpos].tau = vt
-                        new_fcst.track[numfpos].lat = tlat
-                        new_fcst.track[numfpos].lon = tlon
-                        new_fcst.track[numfpos].vmax = ivmax
-                        print(vt, tlat, tlon, ivmax)
-                        numfpos += 1
-            
-            # Add the new forecast to the list
-            fcst.append(new_fcst)
-            num_fcst += 1
+                    new_fcst.track.append(TrackPoint(tau=vt, lat=tlat, lon=tlon, vmax=ivmax))
+                    print(vt, tlat, tlon, ivmax)
+                    numfpos += 1
             
-            # Write to ATCF file
-            with open(atfile, 'w') as atcf_file:
-                sort_carq_records()
-                for i in range(num_carq):
-                    write_carq_record(i)
-                
-                sort_fcst_records()
-                for i in range(num_fcst):
-                    write_fcst_record(i)
+            # Append to ATCF file, or send to the writer coordinator when one is running
+            write_forecast(atfile, new_fcst, index)
             
             print(f"Updated {atcfid} ATCF file.")
             
-            with open('nffn_updated.dat', 'a') as sql_file:
+            with locked_append('nffn_updated.dat') as sql_file:
                 sql_file.write(f"{atcfid}\n")
 
 if __name__ == "__main__":
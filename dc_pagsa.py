@@ -3,6 +3,13 @@ import os
 from datetime import datetime
 import re
 from typing import List, Dict, Tuple, Optional
+from atcf_record import TrackPoint, ForecastRecord
+from atcf_time import dtg_hours, previous_month
+from atcf_index import ForecastIndex
+from atcf_coordinator import write_forecast
+from atcf_ndjson import claim_stdout
+from atomic_file import locked_append
+from atcf_archive import output_open
 
 # Module-level constants (equivalent to the Fortran module)
 JMV_HDR_FMT = "(I4,I2,I2,I2,x,I2,A1,x,A10,x,I3,2x,I2,x,I3,x,I2,x,A4,x,I4)"
@@ -24,36 +31,6 @@ fcst = []  # Will be a list of dictionaries to hold forecast data
 num_carq = 0
 carq = []  # Will be a list of dictionaries to hold carq data
 
-class ForecastTrack:
-    def __init__(self):
-        self.tau = 0
-        self.lat = -999.0
-        self.lon = -999.0
-        self.vmax = 0
-        self.mslp = 0
-        self.ty = "  "
-
-class ForecastRecord:
-    def __init__(self):
-        self.basin = ""
-        self.cyNum = 0
-        self.DTG = ""
-        self.jdnow = 0.0
-        self.technum = 0
-        self.tech = ""
-        self.stormname = ""
-        self.track = [ForecastTrack() for _ in range(36)]  # 36 track positions
-
-def djuliana(mm: int, dd: int, yy: int, hh: float) -> float:
-    """Convert date to Julian day"""
-    # This is a placeholder - need proper Julian date calculation
-    dt = datetime(yy, mm, dd) + timedelta(hours=hh)
-    a = (14 - mm) // 12
-    y = yy + 4800 - a
-    m = mm + 12 * a - 3
-    jdn = dd + (153 * m + 2) // 5 + 365 * y + y // 4 - y // 100 + y // 400 - 32045
-    return jdn + (hh / 24.0) - 0.5
-
 def getline(file_handle) -> Tuple[str, int]:
     """Read a line from input file and clean it"""
     global inbuffy
@@ -102,7 +79,7 @@ def match_pag_id(jmaid: int, yy: int) -> Tuple[str, bool]:
 def update_pag_id(jmaid: int, atcfid: str):
     """Update the PAGASA cross reference file"""
     print(f"Updating PAGASA cross reference file {jmaid} {atcfid}")
-    with open('pag_atcf.xref', 'a') as f:
+    with locked_append('pag_atcf.xref') as f:
         f.write(f"{jmaid} {atcfid}\n")
 
 def match_atcf_id(rlat: float, rlon: float, yy: int, mm: int, dd: int, hh: int) -> Tuple[str, bool]:
@@ -120,39 +97,9 @@ def clear_internal_atcf():
     num_carq = 0
     carq = []
 
-def get_atcf_records(atfile: str, tech: str):
-    """Read ATCF records from file"""
-    # This is a placeholder - would need to implement actual ATCF file parsing
-    global num_fcst, fcst
-    if not os.path.exists(atfile):
-        return
-    
-    # In a real implementation, we would parse the ATCF file here
-    # and populate the fcst list with ForecastRecord objects
-    pass
-
-def sort_carq_records():
-    """Sort CARQ records"""
-    # Placeholder - would implement sorting logic
-    pass
-
-def write_carq_record(idx: int):
-    """Write a CARQ record"""
-    # Placeholder - would implement writing logic
-    pass
-
-def sort_fcst_records():
-    """Sort forecast records"""
-    # Placeholder - would implement sorting logic
-    pass
-
-def write_fcst_record(idx: int):
-    """Write a forecast record"""
-    # Placeholder - would implement writing logic
-    pass
-
 def main():
     global num_fcst, fcst, inbuffy
+    claim_stdout()
     
     # Initialize variables
     numpos = 0
@@ -250,13 +197,13 @@ def main():
                     rlon = -rlon
                 
                 if dd > datetime.now().day:
-                    mm -= 1
+                    yy, mm = previous_month(yy, mm)
             except (ValueError, IndexError):
                 print("Error reading position")
                 return
             
             print(yy, mm, dd, hh, rlat, rlon)
-            jdnow = djuliana(mm, dd, yy, hh * 1.0)
+            jdnow = dtg_hours(yy, mm, dd, hh)
             
             # Find matching ATCF ID
             atcfid, found = match_pag_id(jmaid, yy)
@@ -284,26 +231,18 @@ def main():
             print(f"atcfid: {atcfid}  jmaid: {jmaid}")
             
             atfile = f"A{atcfid}.pag"
-            valid = os.path.exists(atfile)
-            if not valid:
-                print(f"*Caution* {atfile} does not exist!")
-                num_fcst = 0
-            else:
-                clear_internal_atcf()
-                get_atcf_records(atfile, 'ANY ')
-            
-            jdmsg = djuliana(mm, dd, yy, hh * 1.0)
-            found = False
-            for i in range(num_fcst):
-                if (hasattr(fcst[i], 'tech') and fcst[i].tech == 'RPMM' and 
-                    abs(fcst[i].jdnow - jdmsg) < 1.0/24):
-                    found = True
-                    break
+            jdmsg = dtg_hours(yy, mm, dd, hh)
             
-            if found:
+            # Check the sidecar index, the A-deck is not read
+            index = ForecastIndex(atfile)
+            if index.contains('RPMM', f"{yy:04d}{mm:02d}{dd:02d}{hh:02d}"):
                 print("Forecast already in ATCF file")
                 continue
             
+            if not os.path.exists(atfile):
+                print(f"*Caution* {atfile} does not exist!")
+            clear_internal_atcf()
+            
             # Parse movement and other data
             mvmt = buffy[6:].strip()
             mslp = 0
@@ -331,8 +270,6 @@ def main():
             
             # Create new forecast record
             fr = ForecastRecord()
-            num_fcst += 1
-            fcst.append(fr)
             
             fr.basin = atcfid[:2]
             try:
@@ -349,17 +286,13 @@ def main():
             
             # Initial position
             numfpos = 1
-            fr.track[0].tau = 0
             tlat = rlat
             tlon = rlon
             if ns == 'S':
                 tlat = -tlat
             if ew == 'W':
                 tlon = -tlon
-            fr.track[0].lat = tlat
-            fr.track[0].lon = tlon
-            fr.track[0].vmax = ivmax
-            fr.track[0].mslp = mslp
+            fr.track.append(TrackPoint(tau=0, lat=tlat, lon=tlon, vmax=ivmax, mslp=mslp))
             fix_lat = tlat
             fix_lon = tlon
             vmax = ivmax
@@ -405,42 +338,27 @@ def main():
                             rlon = -rlon
                         
                         numfpos += 1
-                        if numfpos >= len(fr.track):
-                            # Extend track list if needed
-                            fr.track.append(ForecastTrack())
-                        
-                        fr.track[numfpos-1].tau = vt
                         tlat = rlat
                         tlon = rlon
                         if ns == 'S':
                             tlat = -tlat
                         if ew == 'W':
                             tlon = -tlon
-                        fr.track[numfpos-1].lat = tlat
-                        fr.track[numfpos-1].lon = tlon
-                        fr.track[numfpos-1].vmax = ivmax
-                        fr.track[numfpos-1].mslp = mslp
+                        fr.track.append(TrackPoint(tau=vt, lat=tlat, lon=tlon, vmax=ivmax, mslp=mslp))
                     except (ValueError, IndexError):
                         continue
             
-            # Write output files
-            with open(atfile, 'w') as fout:
-                sort_carq_records()
-                for i in range(num_carq):
-                    write_carq_record(i)
-                
-                sort_fcst_records()
-                for i in range(num_fcst):
-                    write_fcst_record(i)
+            # Write output files, the A-deck directly or through the writer coordinator
+            write_forecast(atfile, fr, index)
             
             print(f"Updated {atcfid} ATCF file.")
             
-            with open('pag_updated.dat', 'a') as f:
+            with locked_append('pag_updated.dat') as f:
                 f.write(f"{atcfid}\n")
             
             # Write SQL file
             fname = f"{atcfid}_message.sql"
-            with open(fname, 'w') as fsql:
+            with output_open(fname) as fsql:
                 fsql.write("INSERT INTO rsfc_messages (atcfid,rsfcid,msg_hdr,msg_type,msg_advnr,msg_time,fcst_time,lat,lon,vmax,mslp,movement,message,geom) VALUES(\n")
                 fsql.write(f"    '{atcfid}',\n")
                 fsql.write(f"    '{jmaid:04d}',\n")
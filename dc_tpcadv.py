@@ -3,10 +3,20 @@ import re
 from datetime import datetime, timedelta
 from typing import List, Dict
 import sys
+import numpy as np
+import atcf_record
+from atcf_archive import output_open
+from atcf_ndjson import emit_forecasts, claim_stdout
+from atcf_writer import render_lines, track_columns, record_column, tenths, hemisphere
 
 # Example to how run file
 # python3 dc_tpcadv.py -in NHC_message.dat
 
+# Constants
+ADVISORY_LINE = "{}, {:2d}, {},  1, {}, {:3d}, {:03d}{}, {:4d}{}, {:3d}, {:4d}{}"  # Ends with the radii part
+ADVISORY_RADII = ", XX,  {}, NEQ,  {:3d},  {:3d},  {:3d},  {:3d}, ,   , , , , , ,      {}       , \n"
+ADVISORY_NO_RADII = "  \n"
+
 # Initialize variables
 infile = None
 
@@ -46,27 +56,23 @@ ATCF_BASIN = atfile[1:3]  # Extract the ATCF basin from the filename
 ATCF_YEAR = atfile[4:8]  # Extract the ATCF year from the filename
 
 
-# ATCF-related structures
-class TrackPoint:
+# ATCF-related structures, advisory points also carry their own cyclone number and DTG
+class TrackPoint(atcf_record.TrackPoint):
+    __slots__ = ('cyNum', 'dtg')
+
     def __init__(self):
-        self.tau = 0
-        self.lat = 0.0
+        super().__init__(tau=0, lat=0.0, lon=0.0, vmax=0, mslp=0,
+                         radii={"34": {"NE": 0, "SE": 0, "SW": 0, "NW": 0},
+                                "50": {"NE": 0, "SE": 0, "SW": 0, "NW": 0},
+                                "64": {"NE": 0, "SE": 0, "SW": 0, "NW": 0}})
         self.cyNum = ATCF_CYNUM
-        self.lon = 0.0
-        self.vmax = 0
-        self.mslp = 0
-        self.radii = {"34": {"NE": 0, "SE": 0, "SW": 0, "NW": 0},
-                      "50": {"NE": 0, "SE": 0, "SW": 0, "NW": 0},
-                      "64": {"NE": 0, "SE": 0, "SW": 0, "NW": 0}}
-
-class Forecast:
+        self.dtg = ""
+
+class Forecast(atcf_record.ForecastRecord):
+    __slots__ = ()
+
     def __init__(self):
-        self.basin = "AL"
-        self.cyNum = ATCF_CYNUM
-        self.DTG = ""
-        self.tech = "OFCL"
-        self.stormname = ""
-        self.track: List[TrackPoint] = []
+        super().__init__(basin="AL", cyNum=ATCF_CYNUM, tech="OFCL")
 
 # Global storage for forecasts
 num_fcst = 0
@@ -108,11 +114,10 @@ def days_in_month(year: int, month: int) -> int:
     return days_per_month[month]
 
 
-def format_lat_lon(value: float, is_lat: bool) -> str:
-    """Format latitude or longitude into ATCF format."""
-    direction = "N" if is_lat else "W"
-    formatted = f"{abs(int(value * 10)):03d}{direction}"
-    return formatted
+def signed_degrees(value: str) -> float:
+    """Degrees of a latitude or longitude like 25.3N or 85.1W, north and east positive"""
+    return -float(value[:-1]) if value[-1] in 'SW' else float(value[:-1])
+
 
 def parse_radii(line: str) -> Dict[str, int]:
     """Parse radii information from a line using regex."""
@@ -152,12 +157,12 @@ def parse_current_storm(lines: List[str]):
             prev_day = int(match_previous.group(1).strip()[0:2])
             print("prev_day = ", prev_day)
             prev_hour = int(match_previous.group(1).strip()[3:5])
-            prev_lat = float(match_previous.group(2).strip()[:-1])
-            prev_lon = float(match_previous.group(3).strip()[:-1])
+            prev_lat = signed_degrees(match_previous.group(2).strip())
+            prev_lon = signed_degrees(match_previous.group(3).strip())
             print(prev_hour)
             
             # Print for debugging
-            print(f"Previous storm center location: {prev_lat}N, {prev_lon}W at day {prev_day}, hour {prev_hour}")
+            print(f"Previous storm center location: {match_previous.group(2)}, {match_previous.group(3)} at day {prev_day}, hour {prev_hour}")
             
             # Optionally, store the previous storm center location in a variable or object
             previous_storm = {
@@ -181,11 +186,11 @@ def parse_current_storm(lines: List[str]):
 
     for i, line in enumerate(lines):
         # Match storm center location
-        match = re.search(r"(?:POTENTIAL TROP CYCLONE )?CENTER LOCATED NEAR\s+(\d+\.\d+)N\s+(\d+\.\d+)W", line)
+        match = re.search(r"(?:POTENTIAL TROP CYCLONE )?CENTER LOCATED NEAR\s+(\d+\.\d+[NS])\s+(\d+\.\d+[EW])", line)
         print(match)
         if match:
-            lat = float(match.group(1))
-            lon = float(match.group(2))
+            lat = signed_degrees(match.group(1))
+            lon = signed_degrees(match.group(2))
             print("lat = ", lat)
             print("lon = ", lon)
             current_month = extract_month_from_file(infile)
@@ -335,9 +340,9 @@ def parse_nhc_marine():
                 
                 # Extract latitude and longitude
                 lat_lon_line = lines[i]
-                lat_lon_match = re.search(r"(\d+\.\d+)N\s+(\d+\.\d+)W", lat_lon_line)
-                lat = float(lat_lon_match.group(1)) if lat_lon_match else 0.0
-                lon = float(lat_lon_match.group(2)) if lat_lon_match else 0.0
+                lat_lon_match = re.search(r"(\d+\.\d+[NS])\s+(\d+\.\d+[EW])", lat_lon_line)
+                lat = signed_degrees(lat_lon_match.group(1)) if lat_lon_match else 0.0
+                lon = signed_degrees(lat_lon_match.group(2)) if lat_lon_match else 0.0
                 
                 # Extract maximum wind speed
                 vmax_line = lines[i + 1]
@@ -404,100 +409,66 @@ def parse_nhc_marine():
         
 
     # Write out updated ATCF file
-    with open(atfile, 'w') as atf:
-        # Write previous storm information
-        if previous_storm_point:
-            written_rows = set()
-            for wind_speed in ["34", "50", "64"]:
-                radii = previous_storm_point.radii[wind_speed]
-                # Debug: Print formatted lat and lon
-                formatted_lat = format_lat_lon(previous_storm_point.lat, True)
-                formatted_lon = format_lat_lon(previous_storm_point.lon, False)
-                # Skip writing the row if all radii values are zero
-                if all(value == 0 for value in radii.values()):
-                    if wind_speed in ["50", "64"]:
-                        continue
-                    line = (f"AL, {previous_storm_point.cyNum:2d}, {previous_storm_point.dtg},  1, OFCL,  {previous_storm_point.tau:2}, "
-                            f"{formatted_lat},  {formatted_lon:<2}, "
-                            f"{previous_storm_point.vmax:3d}, {previous_storm_point.mslp:4d}  \n")
-                else:
-                    # Create the row string with explicit spacing between lat and lon
-                    line = (f"AL, {previous_storm_point.cyNum:2d}, {previous_storm_point.dtg},  1, OFCL,  {previous_storm_point.tau:2}, "
-                            f"{formatted_lat},  {formatted_lon:<2}, "
-                            f"{previous_storm_point.vmax:3d}, {previous_storm_point.mslp:4d}, XX,  {wind_speed}, NEQ, "
-                            f" {radii['NE']:3d},  {radii['SE']:3d},  {radii['SW']:3d},  {radii['NW']:3d}, ,   , , , , , ,      {storm_name.strip()}       , \n")
-                # Debug: Print the generated line
-                # Skip duplicate rows
-                if line in written_rows:
-                    continue
-                written_rows.add(line)
-                atf.write(line)
-
-
-        # Write current storm information
-        if current_storm:
-            written_rows = set()  # To track already written rows
-            for wind_speed in ["34", "50", "64"]:
-                radii = current_storm.radii[wind_speed]
-                # Debug: Print formatted lat and lon
-                formatted_lat = format_lat_lon(current_storm.lat, True)
-                formatted_lon = format_lat_lon(current_storm.lon, False)
-                # Skip writing the row if all radii values are zero
-                if all(value == 0 for value in radii.values()):
-                    if wind_speed in ["50", "64"]:
-                        continue
-                    line = (f"AL, {current_storm.cyNum:2d}, {previous_storm_point.dtg},  1, OFCL,  {current_storm.tau:2}, "
-                            f"{formatted_lat},  {formatted_lon:<2}, "
-                            f"{current_storm.vmax:3d}, {current_storm.mslp:4d}  \n")
-                else:                    
-                    # Create the row string with explicit spacing between lat and lon
-                    line = (f"AL, {current_storm.cyNum:2d}, {previous_storm_point.dtg},  1, OFCL,  {current_storm.tau:2}, "
-                            f"{formatted_lat},  {formatted_lon:<2}, "
-                            f"{current_storm.vmax:3d}, {current_storm.mslp:4d}, XX,  {wind_speed}, NEQ, "
-                            f" {radii['NE']:3d},  {radii['SE']:3d},  {radii['SW']:3d},  {radii['NW']:3d}, ,   , , , , , ,      {storm_name.strip()}       , \n")
-                # Debug: Print the generated line
-                # Skip duplicate rows
-                if line in written_rows:
-                    continue
-                written_rows.add(line)
-                atf.write(line)
-
-
-
-        # Write forecast data
-        for forecast in fcst:
-            written_rows = set()  # To track already written rows
-            for tp in forecast.track:
-                for wind_speed in ["34", "50", "64"]:
-                    radii = tp.radii[wind_speed]
-                    # Debug: Print formatted lat and lon
-                    formatted_lat = format_lat_lon(tp.lat, True)
-                    formatted_lon = format_lat_lon(tp.lon, False)
-                    # Skip writing the row if all radii values are zero
-                    if all(value == 0 for value in radii.values()):
-                        if wind_speed in ["50", "64"]:
-                            continue
-                        line = (f"{forecast.basin}, {int(forecast.cyNum):2d}, {previous_storm_point.dtg},  1, {forecast.tech}, {tp.tau:3}, "
-                                f"{formatted_lat},  {formatted_lon:<2}, "
-                                f"{tp.vmax:3d}, {tp.mslp:4d}  \n")
-                    else:
-                        # Create the row string with explicit spacing between lat and lon
-                        line = (f"{forecast.basin}, {int(forecast.cyNum):2d}, {previous_storm_point.dtg},  1, {forecast.tech}, {tp.tau:3}, "
-                                f"{formatted_lat},  {formatted_lon:<2}, "
-                                f"{tp.vmax:3d}, {tp.mslp:4d}, XX,  {wind_speed}, NEQ, "
-                                f" {radii['NE']:3d},  {radii['SE']:3d},  {radii['SW']:3d},  {radii['NW']:3d}, ,   , , , , , ,      {storm_name.strip()}       , \n")
-
-                    # Debug: Print the generated line
-                    # Skip duplicate rows
-                    if line in written_rows:
-                        continue
-                    written_rows.add(line)
-                    atf.write(line)
+    text = advisory_lines(storm_name)
+    with output_open(atfile) as atf:
+        atf.write(text)
+    emit_forecasts([advisory_record(storm_name)])
+
+
+def advisory_lines(storm_name: str) -> str:
+    """A-deck lines of the previous and current storm positions and of the forecasts, rendered in one pass.
+
+    Every point has a 34 kt line, short when it has no radii, and a line for each further threshold with radii.
+    """
+    records = advisory_records()
+    data, owner = track_columns(records)
+    has = data['radii'].any(axis=2)
+    has[:, 0] = True
+    rows, winds = np.nonzero(has)
+    data, owner = data[rows], owner[rows]
+    radii = data['radii'][np.arange(len(rows)), winds]
+    with_radii = radii.any(axis=1)
+    tails = np.full(len(rows), ADVISORY_NO_RADII, dtype=object)
+    tails[with_radii] = render_lines(ADVISORY_RADII, [np.array(atcf_record.RADII_WINDS)[winds[with_radii]],
+                                                      radii[with_radii, 0], radii[with_radii, 1],
+                                                      radii[with_radii, 2], radii[with_radii, 3],
+                                                      storm_name.strip()])
+    lines = render_lines(ADVISORY_LINE, [record_column(records, owner, lambda f: f.basin),
+                                         record_column(records, owner, lambda f: int(f.cyNum)),
+                                         previous_storm_point.dtg, record_column(records, owner, lambda f: f.tech),
+                                         data['tau'], tenths(data['lat']), hemisphere(data['lat'], 'N', 'S'),
+                                         tenths(data['lon']), hemisphere(data['lon'], 'E', 'W'),
+                                         data['vmax'].astype(np.int64), data['mslp'].astype(np.int64), tails])
+    # A line repeated within one forecast is written once
+    return ''.join(line for _, line in dict.fromkeys(zip(owner.tolist(), lines)))
+
+
+def advisory_records() -> List[Forecast]:
+    """Records of the previous and current storm positions followed by the forecasts"""
+    records = []
+    for point in (previous_storm_point, current_storm):
+        if point:
+            record = Forecast()
+            record.track = atcf_record.TrackArray([point])
+            records.append(record)
+    records.extend(fcst)
+    return records
+
+
+def advisory_record(storm_name: str) -> Forecast:
+    """The advisory as one record of the previous DTG, every point in tau order as in the A-deck lines"""
+    record = Forecast()
+    record.DTG = previous_storm_point.dtg
+    record.stormname = storm_name.strip()
+    data = np.concatenate([r.track.data for r in advisory_records()])
+    record.track = atcf_record.TrackArray.from_array(data[np.argsort(data['tau'], kind='stable')])
+    return record
 
 
 # Example usage in the main program
 def main():
     """Main program"""
+    claim_stdout()
     if infile is None:
         print("Error: '-in' argument is required")
         sys.exit(1)
@@ -0,0 +1,198 @@
+import sys
+import math
+import random
+from eccodes import *
+
+# Example of how to run file
+# python3 make_tc_bufr.py -out cycle.bufr -storms 8 -members 52 -periods 41 -cycles 4
+# Writes synthetic ECMWF tropical cyclone track messages (template 3 16 082)
+# built from the ecCodes BUFR4 sample, for exercising and benchmarking dc_ecwmf.py
+
+# Constants
+TC_TRACK_SEQUENCE = 316082
+ECMWF_CENTRE = 98
+MASTER_TABLES_VERSION = 37
+PERIOD_HOURS = 6
+CYCLE_HOURS = 12
+BASIN_CHARS = 'WLES'  # Basin characters dc_ecwmf maps to WP, AL, EP and SH
+BASIN_ORIGIN = {'W': (12.0, 140.0), 'L': (14.0, -45.0), 'E': (13.0, -105.0), 'S': (-12.0, 80.0)}
+
+
+class SyntheticStorm:
+    """Track generator for one storm, the same seed gives the same storm"""
+    def __init__(self, number, seed=0):
+        rng = random.Random(seed * 1000 + number)
+        self.bchar = BASIN_CHARS[(number - 1) % len(BASIN_CHARS)]
+        self.identifier = f"{number:02d}{self.bchar}"
+        self.name = f"SYNTH{number:02d}"
+        lat0, lon0 = BASIN_ORIGIN[self.bchar]
+        self.lat0 = lat0 + rng.uniform(-3.0, 3.0)
+        self.lon0 = lon0 + rng.uniform(-8.0, 8.0)
+        self.heading = math.radians(rng.uniform(290.0, 330.0))  # Mostly poleward and westward
+        self.speed = rng.uniform(0.08, 0.15)  # Degrees per hour
+        self.peak = rng.uniform(35.0, 70.0)  # Maximum wind in m/s
+        self.rng = rng
+
+    def position(self, hour, member=0):
+        """Storm centre and maximum wind position hour hours after genesis, spread by ensemble member"""
+        spread = 0.004 * hour * (member % 7 - 3) if member else 0.0
+        dlat = self.speed * hour * math.cos(self.heading) + spread
+        dlon = self.speed * hour * math.sin(self.heading) - spread
+        if self.bchar == 'S':
+            dlat = -dlat
+        lat = max(-89.0, min(89.0, self.lat0 + dlat))
+        lon = (self.lon0 + dlon + 180.0) % 360.0 - 180.0
+        return round(lat, 2), round(lon, 2)
+
+    def intensity(self, hour, member=0):
+        """Maximum wind (m/s) and central pressure (Pa) hour hours after genesis"""
+        growth = min(1.0, hour / 96.0) * (1.0 - max(0.0, hour - 144.0) / 240.0)
+        wind = 15.0 + (self.peak - 15.0) * max(0.0, growth) + 0.5 * (member % 5 - 2)
+        pressure = 101000.0 - 2.2 * (wind - 15.0) * 100.0
+        return round(wind, 1), round(pressure, -1)
+
+
+def set_ranks(ibufr, key, values, nsub, compressed):
+    """Set every rank of a key, values is a list per rank of nsub values (or one value for all subsets)"""
+    for rank, value in enumerate(values):
+        if not isinstance(value, (list, tuple)):
+            value = [value] * nsub
+        if compressed:
+            codes_set_array(ibufr, f"#{rank + 1}#{key}", list(value))
+        else:
+            # Uncompressed subsets follow one another, so their ranks are numbered subset by subset
+            for k in range(nsub):
+                codes_set(ibufr, f"#{k * len(values) + rank + 1}#{key}", value[k])
+
+
+def encode_track_message(storm, cycle_hour, dtg, members, periods, compressed=True):
+    """Encode one storm and cycle as a BUFR message, members is the list of ensemble member numbers"""
+    nsub = len(members)
+    year, month, day, hour = dtg
+    ibufr = codes_bufr_new_from_samples('BUFR4')
+    try:
+        codes_set(ibufr, 'masterTablesVersionNumber', MASTER_TABLES_VERSION)
+        codes_set(ibufr, 'bufrHeaderCentre', ECMWF_CENTRE)
+        codes_set(ibufr, 'numberOfSubsets', nsub)
+        codes_set(ibufr, 'compressedData', 1 if compressed else 0)
+        codes_set(ibufr, 'typicalYear', year)
+        codes_set(ibufr, 'typicalMonth', month)
+        codes_set(ibufr, 'typicalDay', day)
+        codes_set(ibufr, 'typicalHour', hour)
+        codes_set_array(ibufr, 'inputDelayedDescriptorReplicationFactor',
+                        [periods - 1] * (1 if compressed else nsub))
+        codes_set_array(ibufr, 'unexpandedDescriptors', [TC_TRACK_SEQUENCE])
+
+        if compressed:
+            codes_set_array(ibufr, 'stormIdentifier', [storm.identifier] * nsub)
+            codes_set_array(ibufr, 'longStormName', [storm.name] * nsub)
+        else:
+            for k in range(nsub):
+                codes_set(ibufr, f"#{k + 1}#stormIdentifier", storm.identifier)
+                codes_set(ibufr, f"#{k + 1}#longStormName", storm.name)
+
+        # Member 0 of a single subset message is the main run, ensemble messages hold the control and perturbed members
+        forecastType = [0] if nsub == 1 and members[0] == 0 else [1 if m == 0 else 2 for m in members]
+        set_ranks(ibufr, 'ensembleMemberNumber', [list(members)], nsub, compressed)
+        set_ranks(ibufr, 'ensembleForecastType', [forecastType], nsub, compressed)
+        for key, value in (('year', year), ('month', month), ('day', day), ('hour', hour), ('minute', 0)):
+            set_ranks(ibufr, key, [value], nsub, compressed)
+
+        # Analysis: observed centre, analysed centre with pressure, maximum wind, then one pair per period
+        significance = [1, 4, 3] + [1, 3] * (periods - 1)
+        lats, lons, pressures, winds = [], [], [], []
+        for j in range(periods):
+            hours = cycle_hour + j * PERIOD_HOURS
+            centres = [storm.position(hours, m) for m in members]
+            intensity = [storm.intensity(hours, m) for m in members]
+            rows = 3 if j == 0 else 2
+            for row in range(rows):
+                # The maximum wind sits about 0.3 degrees from the centre
+                offset = 0.3 if row == rows - 1 else 0.0
+                lats.append([lat + offset for lat, _ in centres])
+                lons.append([lon for _, lon in centres])
+            winds.append([wind for wind, _ in intensity])
+            pressures.append([pressure for _, pressure in intensity])
+        set_ranks(ibufr, 'meteorologicalAttributeSignificance', significance, nsub, compressed)
+        set_ranks(ibufr, 'timePeriod', [PERIOD_HOURS * (j + 1) for j in range(periods - 1)], nsub, compressed)
+        set_ranks(ibufr, 'latitude', lats, nsub, compressed)
+        set_ranks(ibufr, 'longitude', lons, nsub, compressed)
+        set_ranks(ibufr, 'pressureReducedToMeanSeaLevel', pressures, nsub, compressed)
+        set_ranks(ibufr, 'windSpeedAt10M', winds, nsub, compressed)
+
+        codes_set(ibufr, 'pack', 1)
+        return codes_get_message(ibufr)
+    finally:
+        codes_release(ibufr)
+
+
+def make_tc_bufr(outfile, storms=4, members=0, periods=41, cycles=1, compressed=True, seed=0,
+                 start=(2024, 9, 1, 0)):
+    """Write cycles x storms deterministic messages, plus one ensemble message each when members > 0"""
+    tracks = [SyntheticStorm(n + 1, seed) for n in range(storms)]
+    year, month, day, hour = start
+    count = 0
+    with open(outfile, 'wb') as f:
+        for c in range(cycles):
+            cycle_hour = c * CYCLE_HOURS
+            total = hour + cycle_hour
+            dtg = (year, month, day + total // 24, total % 24)
+            for storm in tracks:
+                f.write(encode_track_message(storm, cycle_hour, dtg, [0], periods, compressed))
+                count += 1
+                if members > 0:
+                    f.write(encode_track_message(storm, cycle_hour, dtg, list(range(members)), periods, compressed))
+                    count += 1
+    print(f"Wrote {count} messages to {outfile}")
+    return count
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python make_tc_bufr.py -out <output_file> [-storms <n>] [-members <n>] [-periods <n>] "
+              "[-cycles <n>] [-uncompressed] [-seed <n>]")
+        return
+
+    # Parse command line arguments
+    outfile = ''
+    storms = 4
+    members = 0
+    periods = 41
+    cycles = 1
+    compressed = True
+    seed = 0
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "-out":
+            i += 1
+            outfile = sys.argv[i]
+        elif sys.argv[i] == "-storms":
+            i += 1
+            storms = int(sys.argv[i])
+        elif sys.argv[i] == "-members":
+            i += 1
+            members = int(sys.argv[i])
+        elif sys.argv[i] == "-periods":
+            i += 1
+            periods = int(sys.argv[i])
+        elif sys.argv[i] == "-cycles":
+            i += 1
+            cycles = int(sys.argv[i])
+        elif sys.argv[i] == "-uncompressed":
+            compressed = False
+        elif sys.argv[i] == "-seed":
+            i += 1
+            seed = int(sys.argv[i])
+        i += 1
+
+    if not outfile:
+        print("*Error* no output file given")
+        return
+    if storms > 99 or periods < 1 or cycles * CYCLE_HOURS // 24 > 27:
+        print("*Error* storms must be at most 99, periods at least 1 and cycles span at most 27 days")
+        return
+    make_tc_bufr(outfile, storms, members, periods, cycles, compressed, seed)
+
+if __name__ == "__main__":
+    main()
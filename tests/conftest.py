@@ -0,0 +1,18 @@
+import os
+import sys
+import pytest
+
+# The decoders and atcf modules are flat scripts in the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Constants
+ATCF_ENV = ('ATCF_COORDINATOR', 'ATCF_ARCHIVE', 'ATCF_COLUMNS', 'ATCF_NDJSON', 'ATCF_NDJSON_MAX_BYTES')
+
+
+@pytest.fixture(autouse=True)
+def plain_env(monkeypatch, tmp_path):
+    """Run every test in its own directory, with none of the ATCF_* backends switched on"""
+    for name in ATCF_ENV:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.chdir(tmp_path)
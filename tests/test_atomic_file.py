@@ -0,0 +1,65 @@
+import os
+import multiprocessing
+import pytest
+from atomic_file import (LOCK_DIR, lock_file, atomic_open, locked_append, file_stamp, stamp_line, read_stamp,
+                         sidecar_stamp, append_stamped)
+
+# Constants
+WRITERS = 4
+LINES = 200
+
+
+def test_lock_files_are_in_the_lock_directory(tmp_path):
+    path = str(tmp_path / 'AWP052024.dat')
+    assert lock_file(path) == str(tmp_path / LOCK_DIR / 'AWP052024.dat.lock')
+    assert os.path.isdir(tmp_path / LOCK_DIR)
+
+
+def test_atomic_open_keeps_the_old_file_on_an_error(tmp_path):
+    path = str(tmp_path / 'AWP052024.dat')
+    with atomic_open(path) as f:
+        f.write('old\n')
+    with pytest.raises(RuntimeError):
+        with atomic_open(path) as f:
+            f.write('new\n')
+            raise RuntimeError
+    assert open(path).read() == 'old\n'
+    assert sorted(os.listdir(tmp_path)) == sorted([LOCK_DIR, 'AWP052024.dat'])  # No temp file left behind
+
+
+def append_lines(path, writer):
+    for i in range(LINES):
+        with locked_append(path) as f:
+            f.write(f"{writer:02d} {i:04d} " + 'x' * 100 + '\n')
+
+
+def test_locked_appends_of_several_processes_never_interleave(tmp_path):
+    path = str(tmp_path / 'jma_updated.dat')
+    writers = [multiprocessing.Process(target=append_lines, args=(path, w)) for w in range(WRITERS)]
+    for p in writers:
+        p.start()
+    for p in writers:
+        p.join()
+        assert p.exitcode == 0
+    lines = open(path).read().splitlines()
+    assert len(lines) == WRITERS * LINES
+    assert all(len(line) == 108 and line.endswith('x' * 100) for line in lines)
+    for w in range(WRITERS):
+        assert [line[3:7] for line in lines if line.startswith(f"{w:02d} ")] == [f"{i:04d}" for i in range(LINES)]
+
+
+def test_sidecar_stamps(tmp_path):
+    path = str(tmp_path / 'AWP052024.dat')
+    sidecar = path + '.idx'
+    assert file_stamp(path) == (0, 0)
+    assert sidecar_stamp(sidecar) is None
+    open(path, 'w').write('line\n')
+    stamp = file_stamp(path)
+    assert stamp[0] == 5
+    assert read_stamp(stamp_line(stamp)) == stamp
+    assert read_stamp('WP, 05, 2024090100\n') is None
+
+    append_stamped(sidecar, 'a\n', stamp)
+    append_stamped(sidecar, 'b\n', (10, stamp[1] + 1))
+    assert sidecar_stamp(sidecar) == (10, stamp[1] + 1)
+    assert open(sidecar).read().splitlines()[1:] == ['a', 'b']
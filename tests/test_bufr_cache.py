@@ -0,0 +1,33 @@
+import numpy as np
+from bufr_cache import BufrCache
+
+
+def test_messages_and_skips_are_kept_but_failures_are_not(tmp_path):
+    cache = BufrCache(str(tmp_path))
+    decoded, skipped, failed = (cache.key(data) for data in (b'BUFR one', b'BUFR two', b'BUFR three'))
+    cache.put(decoded, {'period': np.arange(3), 'year': 2024, 'stormName': 'YAGI'})
+    cache.put(skipped, None)
+    cache.put(failed, False)
+
+    cache = BufrCache(str(tmp_path))
+    found, msg = cache.get(decoded)
+    assert found and msg['period'].tolist() == [0, 1, 2] and (msg['year'], msg['stormName']) == (2024, 'YAGI')
+    assert cache.get(skipped) == (True, None)
+    assert cache.get(failed) == (False, None)
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_a_new_cache_version_misses(tmp_path):
+    BufrCache(str(tmp_path)).put(BufrCache(str(tmp_path)).key(b'BUFR'), None)
+    newer = BufrCache(str(tmp_path), version=99)
+    assert newer.get(newer.key(b'BUFR')) == (False, None)
+
+
+def test_eviction_keeps_the_recently_used(tmp_path):
+    cache = BufrCache(str(tmp_path), max_mb=0.01)
+    keys = [cache.key(bytes([n])) for n in range(8)]
+    for key in keys:
+        cache.put(key, {'lat': np.zeros(200)})
+        cache.get(keys[0])  # Kept in use
+    assert cache.size <= cache.max_bytes
+    assert cache.get(keys[0])[0] and cache.get(keys[-1])[0] and not cache.get(keys[1])[0]
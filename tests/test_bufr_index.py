@@ -0,0 +1,53 @@
+import io
+import pytest
+from bufr_index import BufrIndex, BufrMessage, read_header, read_stream, TC_TRACK_SEQUENCE
+
+eccodes = pytest.importorskip('eccodes')
+from make_tc_bufr import make_tc_bufr, ECMWF_CENTRE  # noqa: E402
+
+
+@pytest.fixture(scope='module', params=[True, False], ids=['compressed', 'uncompressed'])
+def bufr(request, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('bufr') / 'tc.bufr')
+    make_tc_bufr(path, storms=2, members=3, periods=3, cycles=2, compressed=request.param)
+    return path
+
+
+def test_headers_match_eccodes(bufr):
+    with BufrIndex(bufr) as index:
+        assert len(index) == 8
+        for n, message in enumerate(index):
+            ibufr = index.new_handle(n)
+            try:
+                assert message.centre == eccodes.codes_get(ibufr, 'bufrHeaderCentre') == ECMWF_CENTRE
+                assert message.numberOfSubsets == eccodes.codes_get(ibufr, 'numberOfSubsets')
+                assert message.typicalDate == int(eccodes.codes_get(ibufr, 'typicalDate'))
+                assert message.unexpandedDescriptors == [TC_TRACK_SEQUENCE]
+                eccodes.codes_set(ibufr, 'unpack', 1)
+                identifier = eccodes.codes_get_array(ibufr, 'stormIdentifier')[0]
+                assert message.stormIdentifier == identifier.strip()
+            finally:
+                eccodes.codes_release(ibufr)
+
+
+def test_select_filters_on_the_header(bufr):
+    with BufrIndex(bufr) as index:
+        assert index.select(storm='01W') == [0, 1, 4, 5]
+        assert index.select(storm='02L', date=2024090112) == [6, 7]
+        assert index.select(date=20240901) == list(range(8))
+        assert index.select(centre=7) == []
+
+
+def test_stream_frames_the_messages_between_junk(bufr):
+    with BufrIndex(bufr) as index:
+        messages = [bytes(index.message_view(n)) for n in range(len(index))]
+    data = b'GTS header\r\r\n' + b'NNNN'.join(messages) + b'BUFR\x00'  # A truncated message at the end
+
+    class Trickle(io.BytesIO):
+        def read1(self, size=-1):
+            return super().read1(min(size, 100))  # A pipe hands over a little at a time
+    framed = list(read_stream(Trickle(data), chunk_size=100))
+    assert framed == messages
+    message = BufrMessage(0, len(framed[6]), framed[6][7])
+    read_header(framed[6], message)
+    assert message.stormIdentifier == '02L'
@@ -0,0 +1,36 @@
+import numpy as np
+from atcf_record import ForecastRecord
+from atcf_columns import SeasonColumns, append_forecasts
+
+
+def forecast(dtg, tech='RJTD', technum=1, taus=(0, 12, 24)):
+    fcst = ForecastRecord(basin='WP', cyNum=5, DTG=dtg, technum=technum, tech=tech, stormname='YAGI')
+    for tau in taus:
+        fcst.track.append(tau=tau, lat=15.0 + tau / 12, lon=130.0 - tau / 12, vmax=65 + tau,
+                          radii=[[90, 80, 70, 60], [0, 0, 0, 0], [0, 0, 0, 0]])
+    return fcst
+
+
+def test_season_columns_append_and_scan(tmp_path):
+    store = SeasonColumns(str(tmp_path / 'WP2024'))
+    assert store.append([forecast('2024091000'), forecast('2024091006', 'JTWC')]) == 6
+    assert store.append([forecast('2024091012', taus=(0, 12))]) == 2
+    store = SeasonColumns(str(tmp_path / 'WP2024'))  # Read back from the files
+    assert (store.records, len(store)) == (3, 8)
+    cols = store.columns()
+    assert cols['record'].tolist() == [0, 0, 0, 1, 1, 1, 2, 2]
+    assert cols['tau'].tolist() == [0, 12, 24, 0, 12, 24, 0, 12]
+    assert cols['radii'][:, 0, 0].tolist() == [90] * 8
+    jtwc = cols['tech'] == store.code('tech', 'JTWC')
+    assert cols['vmax'][jtwc].tolist() == [65, 77, 89]
+    assert store.decode('stormname', cols['stormname'][:1]).tolist() == ['YAGI']
+
+
+def test_season_columns_skip_forecasts_already_stored(tmp_path):
+    fcsts = [forecast('2024091000'), forecast('2024091006')]
+    assert append_forecasts(fcsts, str(tmp_path)) == 6
+    assert append_forecasts(fcsts + fcsts, str(tmp_path)) == 0  # A rerun adds nothing
+    assert append_forecasts([forecast('2024091006', technum=2)], str(tmp_path)) == 3
+    store = SeasonColumns(str(tmp_path / 'WP2024'))
+    assert (store.records, len(store)) == (3, 9)
+    assert np.unique(store.record_keys(), axis=0).shape == (3, 5)
@@ -0,0 +1,56 @@
+import queue
+from atcf_record import ForecastRecord
+from atcf_writer import forecast_lines, line_key
+from atcf_index import ForecastIndex
+from atcf_coordinator import WriterCoordinator
+
+
+def forecast(dtg, tech='RJTD'):
+    fcst = ForecastRecord(basin='WP', cyNum=5, DTG=dtg, technum=1, tech=tech, stormname='YAGI')
+    fcst.track.append(tau=0, lat=15.2, lon=130.4, vmax=65, mslp=975, radii=[[0] * 4] * 3)
+    return fcst
+
+
+def message(atfile, fcst):
+    return (atfile, fcst.tech, fcst.DTG, forecast_lines(fcst), fcst, 'dc_jmaadv')
+
+
+def read(path):
+    with open(path) as f:
+        return f.readlines()
+
+
+def test_a_burst_for_one_storm_is_one_write():
+    writer = WriterCoordinator(window=60)
+    for dtg in ('2024091006', '2024091000', '2024091012'):
+        writer.add(*message('AWP052024.dat', forecast(dtg)))
+    writer.add(*message('AWP062024.dat', forecast('2024091000')))
+    writer.flush_due()
+    assert writer.writes == 0 and writer.next_timeout() > 0  # Nothing is written before the window closes
+    writer.flush_due(force=True)
+    assert writer.writes == 2 and not writer.pending
+    assert [line_key(line) for line in read('AWP052024.dat')] == ['2024091000', '2024091006', '2024091012']
+
+
+def test_forecasts_the_adeck_has_are_not_written_again():
+    writer = WriterCoordinator(window=0)
+    writer.add(*message('AWP052024.dat', forecast('2024091000')))
+    writer.flush_due()
+    # A resent forecast replaces the copy held, one the A-deck has is dropped
+    writer.add(*message('AWP052024.dat', forecast('2024091000')))
+    writer.add(*message('AWP052024.dat', forecast('2024091000')))
+    writer.flush_due()
+    assert writer.received == 3 and writer.writes == 1
+    assert read('AWP052024.dat') == forecast_lines(forecast('2024091000'))
+    assert ForecastIndex('AWP052024.dat').contains('RJTD', '2024091000')
+
+
+def test_run_writes_what_is_held_when_the_inbox_ends():
+    inbox = queue.Queue()
+    for tech in ('RJTD', 'JTWC'):
+        inbox.put(message('AWP052024.dat', forecast('2024091000', tech)))
+    inbox.put(None)
+    writer = WriterCoordinator(inbox, window=60)
+    writer.run()
+    assert writer.writes == 1
+    assert sorted(line.split(',')[4].strip() for line in read('AWP052024.dat')) == ['JTWC', 'RJTD']
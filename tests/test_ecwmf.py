@@ -0,0 +1,170 @@
+import os
+import json
+import glob
+import subprocess
+import sys
+import numpy as np
+import pytest
+from conftest import ROOT, ATCF_ENV
+
+eccodes = pytest.importorskip('eccodes')
+from make_tc_bufr import make_tc_bufr, SyntheticStorm, PERIOD_HOURS  # noqa: E402
+
+# Constants
+STORMS = 3
+MEMBERS = 5
+PERIODS = 9
+CYCLES = 2
+
+
+@pytest.fixture(scope='module')
+def bufr(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('bufr') / 'tc.bufr')
+    make_tc_bufr(path, storms=STORMS, members=MEMBERS, periods=PERIODS, cycles=CYCLES)
+    return path
+
+
+def run_ecwmf(workdir, infile, args, stdin=None, log=None):
+    """A-decks dc_ecwmf writes in workdir, name -> text; log is a list to add its messages to"""
+    os.makedirs(workdir, exist_ok=True)
+    env = {k: v for k, v in os.environ.items() if k not in ATCF_ENV}
+    cmd = [sys.executable, os.path.join(ROOT, 'dc_ecwmf.py'), '-in', infile] + args
+    run = subprocess.run(cmd, cwd=workdir, env=env, stdin=stdin, stdout=subprocess.PIPE, text=True, check=True)
+    if log is not None:
+        log.append(run.stdout)
+    return {os.path.basename(p): open(p).read() for p in sorted(glob.glob(os.path.join(workdir, 'A*.DAT')))}
+
+
+def rows_of(text, tech=None):
+    """Fields of the A-deck lines of text, of one tech when given"""
+    rows = [[field.strip() for field in line.split(',')] for line in text.splitlines()]
+    return [row for row in rows if tech is None or row[4] == tech]
+
+
+def test_track_arrays_match_the_encoded_storms(tmp_path, bufr):
+    adecks = run_ecwmf(str(tmp_path), bufr, [])
+    assert len(adecks) == STORMS
+    for number in range(1, STORMS + 1):
+        storm = SyntheticStorm(number)
+        basin = {'W': 'WP', 'L': 'AL', 'E': 'EP', 'S': 'SH'}[storm.bchar]
+        rows = rows_of(adecks[f"A{basin}{number:02d}2024.DAT"], 'ECMF')
+        assert sorted(set(row[2] for row in rows)) == ['2024090100', '2024090112']
+        first = [row for row in rows if row[2] == '2024090100']
+        assert [int(row[5]) for row in first] == [PERIOD_HOURS * j for j in range(PERIODS)]
+        for row in first:
+            lat, lon = storm.position(int(row[5]))
+            assert abs(int(row[6][:-1]) - abs(lat) * 10) <= 1 and row[6][-1] == ('N' if lat >= 0 else 'S')
+            assert abs(int(row[7][:-1]) - abs(lon) * 10) <= 1 and row[7][-1] == ('E' if lon >= 0 else 'W')
+        assert all(row[-1] == storm.name for row in rows)
+
+
+def test_uncompressed_messages_decode_like_compressed(tmp_path, bufr):
+    uncompressed = str(tmp_path / 'uncompressed.bufr')
+    make_tc_bufr(uncompressed, storms=STORMS, members=MEMBERS, periods=PERIODS, cycles=CYCLES, compressed=False)
+    assert run_ecwmf(str(tmp_path / 'u'), uncompressed, []) == run_ecwmf(str(tmp_path / 'c'), bufr, [])
+
+
+def test_ensemble_keeps_each_cycle_and_the_main_run(tmp_path, bufr):
+    adecks = run_ecwmf(str(tmp_path), bufr, ['-ensemble'])
+    assert len(adecks) == STORMS
+    for text in adecks.values():
+        rows = rows_of(text)
+        assert len(set(row[2] for row in rows)) == CYCLES
+        # The control is EC00, the main run (also member 0) is only ECMF
+        assert set(row[4] for row in rows) == {'ECMF'} | {f"EC{m:02d}" for m in range(MEMBERS)}
+        assert len(rows_of(text, 'ECMF')) == CYCLES * PERIODS
+
+
+def test_either_mode_keeps_the_tracks_of_the_other(tmp_path, bufr):
+    both = run_ecwmf(str(tmp_path / 'ensemble'), bufr, ['-ensemble'])
+    workdir = str(tmp_path / 'runs')
+    main_run = run_ecwmf(workdir, bufr, [])
+    assert run_ecwmf(workdir, bufr, ['-ensemble']).keys() == both.keys()
+    for args in ([], ['-ensemble'], []):  # Reruns replace their own lines instead of adding them again
+        adecks = run_ecwmf(workdir, bufr, args)
+        assert {name: sorted(text.splitlines()) for name, text in adecks.items()} == \
+            {name: sorted(text.splitlines()) for name, text in both.items()}
+    for name, text in main_run.items():
+        assert rows_of(text) == rows_of(adecks[name], 'ECMF')
+
+
+@pytest.mark.parametrize('ensemble', [[], ['-ensemble']], ids=['main', 'ensemble'])
+def test_jobs_write_the_same_adecks(tmp_path, bufr, ensemble):
+    reference = run_ecwmf(str(tmp_path / 'serial'), bufr, ensemble)
+    assert run_ecwmf(str(tmp_path / 'jobs'), bufr, ['-jobs', '3'] + ensemble) == reference
+
+
+@pytest.mark.parametrize('ensemble', [[], ['-ensemble']], ids=['main', 'ensemble'])
+def test_cache_runs_write_the_same_adecks(tmp_path, bufr, ensemble):
+    # A message of another template, which the decoder skips
+    sample = eccodes.codes_bufr_new_from_samples('BUFR4')
+    infile = str(tmp_path / 'mixed.bufr')
+    with open(bufr, 'rb') as f, open(infile, 'wb') as out:
+        out.write(f.read() + eccodes.codes_get_message(sample))
+    eccodes.codes_release(sample)
+
+    reference = run_ecwmf(str(tmp_path / 'plain'), infile, ensemble)
+    cache = ['-cache', str(tmp_path / 'cache')]
+    log = []
+    assert run_ecwmf(str(tmp_path / 'cold'), infile, cache + ensemble, log=log) == reference
+    # The warm run serves every message, the skipped one too, without ecCodes, in either mode
+    other = ['-ensemble'] if not ensemble else []
+    assert run_ecwmf(str(tmp_path / 'warm'), infile, cache + ensemble, log=log) == reference
+    other_reference = run_ecwmf(str(tmp_path / 'plain-other'), infile, other)
+    assert run_ecwmf(str(tmp_path / 'other'), infile, cache + other, log=log) == other_reference
+    messages = STORMS * CYCLES * 2 + 1
+    assert [line for text in log for line in text.splitlines() if line.startswith('Cache hits')] == \
+        [f"Cache hits: 0, misses: {messages}", f"Cache hits: {messages}, misses: 0", f"Cache hits: {messages}, misses: 0"]
+
+
+@pytest.mark.parametrize('ensemble', [[], ['-ensemble']], ids=['main', 'ensemble'])
+def test_standard_input_writes_the_same_adecks(tmp_path, bufr, ensemble):
+    reference = run_ecwmf(str(tmp_path / 'file'), bufr, ensemble)
+    with open(bufr, 'rb') as f:
+        assert run_ecwmf(str(tmp_path / 'stdin'), '-', ensemble, stdin=f) == reference
+    # Through a pipe, with the header filters applied to the framed messages
+    cat = subprocess.Popen(['cat', bufr], stdout=subprocess.PIPE)
+    piped = run_ecwmf(str(tmp_path / 'pipe'), '-', ['-storm', '02L'] + ensemble, stdin=cat.stdout)
+    cat.wait()
+    assert piped == {name: text for name, text in reference.items() if name == 'AAL022024.DAT'}
+
+
+@pytest.mark.parametrize('compressed', [True, False], ids=['compressed', 'uncompressed'])
+def test_numpy_decoder_writes_the_same_adecks(tmp_path, compressed):
+    infile = str(tmp_path / 'tc.bufr')
+    make_tc_bufr(infile, storms=STORMS, members=MEMBERS, periods=PERIODS, cycles=CYCLES, compressed=compressed)
+    for ensemble in ([], ['-ensemble']):
+        reference = run_ecwmf(str(tmp_path / f"eccodes{ensemble}"), infile, ensemble)
+        assert run_ecwmf(str(tmp_path / f"numpy{ensemble}"), infile, ['-numpy'] + ensemble) == reference
+
+
+def test_numpy_decoder_ranks_match_eccodes(bufr):
+    from bufr_index import BufrIndex
+    from bufr_tc import decode_tc_message
+    with BufrIndex(bufr) as index:
+        data = bytes(index.message_view(1))  # The ensemble message of the first storm
+    ranks = decode_tc_message(data)
+    ibufr = eccodes.codes_new_from_message(data)
+    try:
+        eccodes.codes_set(ibufr, 'unpack', 1)
+        for key in ('latitude', 'longitude', 'windSpeedAt10M', 'pressureReducedToMeanSeaLevel', 'ensembleMemberNumber'):
+            # One codes_get per rank, so ranks that compressed to one value come back per subset
+            values = [eccodes.codes_get_array(ibufr, f"#{rank + 1}#{key}") for rank in range(ranks[key].shape[1])]
+            assert ranks[key].shape[0] == MEMBERS
+            for rank, value in enumerate(values):
+                assert ranks[key][:, rank].tolist() == pytest.approx(np.broadcast_to(value, MEMBERS).tolist()), key
+    finally:
+        eccodes.codes_release(ibufr)
+    sample = eccodes.codes_bufr_new_from_samples('BUFR4')
+    assert decode_tc_message(eccodes.codes_get_message(sample)) is None  # Other templates are left to ecCodes
+    eccodes.codes_release(sample)
+
+
+def test_ndjson_on_stdout_holds_only_records(tmp_path, bufr):
+    env = {k: v for k, v in os.environ.items() if k not in ATCF_ENV}
+    env['ATCF_NDJSON'] = '-'
+    cmd = [sys.executable, os.path.join(ROOT, 'dc_ecwmf.py'), '-in', bufr]
+    run = subprocess.run(cmd, cwd=str(tmp_path), env=env, capture_output=True, text=True, check=True)
+    records = [json.loads(line) for line in run.stdout.splitlines()]
+    assert len(records) == STORMS * CYCLES and all(record['source'] == 'dc_ecwmf' for record in records)
+    assert 'Cache' not in run.stdout and run.stderr
@@ -0,0 +1,52 @@
+import os
+from atcf_index import ForecastIndex
+from atcf_writer import update_adeck
+from atcf_archive import ARCHIVE_ENV, SeasonArchive
+
+
+def adeck_line(dtg, tau, tech='RJTD'):
+    return f"WP, 05, {dtg}, 01, {tech}, {tau:3d}, 152N, 1304E,  65\n"
+
+
+def test_index_follows_the_adeck():
+    index = ForecastIndex('AWP052024.dat')
+    assert len(index) == 0 and not index.contains('RJTD', '2024091000')
+    update_adeck('AWP052024.dat', [adeck_line('2024091000', 0)])
+    index.add('RJTD', '2024091000')
+    assert ForecastIndex('AWP052024.dat').contains('RJTD', '2024091000')
+    # A write that does not go through the index leaves it stale, and it is rebuilt
+    with open('AWP052024.dat', 'a') as f:
+        f.write(adeck_line('2024091006', 0, 'JTWC'))
+    index = ForecastIndex('AWP052024.dat')
+    assert ('JTWC', '2024091006') in index and len(index) == 2
+
+
+def test_index_sees_a_write_within_one_mtime_tick():
+    update_adeck('AWP052024.dat', [adeck_line('2024091000', 0)])
+    ForecastIndex('AWP052024.dat')
+    st = os.stat('AWP052024.dat')
+    with open('AWP052024.dat', 'a') as f:
+        f.write(adeck_line('2024091006', 0, 'JTWC'))
+    os.utime('AWP052024.dat', ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert ForecastIndex('AWP052024.dat').contains('JTWC', '2024091006')
+
+
+def test_archived_index_reads_only_the_new_chunks(tmp_path, monkeypatch):
+    monkeypatch.setenv(ARCHIVE_ENV, str(tmp_path / 'archive'))
+    update_adeck('AWP052024.dat', [adeck_line('2024091000', 0)])
+    assert ForecastIndex('AWP052024.dat').contains('RJTD', '2024091000')
+    idxfile = str(tmp_path / 'archive' / 'AWP052024.dat.idx')
+    assert os.path.exists(idxfile) and not os.path.exists('AWP052024.dat')
+
+    update_adeck('AWP052024.dat', [adeck_line('2024091006', 0)])
+    read = []
+    read_chunks = SeasonArchive.read_chunks
+    monkeypatch.setattr(SeasonArchive, 'read_chunks', lambda self, chunks: read.append(len(chunks)) or
+                        read_chunks(self, chunks))
+    index = ForecastIndex('AWP052024.dat')
+    assert read == [1]  # The appended chunk only
+    assert index.contains('RJTD', '2024091006') and index.contains('RJTD', '2024091000')
+
+    # A merge rewrites the stream, which starts the keys over
+    update_adeck('AWP052024.dat', [adeck_line('2024090918', 0, 'JTWC')])
+    assert set(ForecastIndex('AWP052024.dat').keys) == {'RJTD 2024091000', 'RJTD 2024091006', 'JTWC 2024090918'}
@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import time
+import subprocess
+from conftest import ROOT, ATCF_ENV
+from atcf_record import ForecastRecord
+from atcf_writer import forecast_lines
+from atcf_ndjson import NdjsonSink, record_json
+from atcf_coordinator import send_messages
+
+
+def forecast(dtg, tech='RJTD'):
+    fcst = ForecastRecord(basin='WP', cyNum=5, DTG=dtg, technum=1, tech=tech, stormname='YAGI')
+    fcst.track.append(tau=0, lat=15.2, lon=-130.4, vmax=65, radii=[[100, 90, 80, 100], [0] * 4, [0] * 4])
+    fcst.track.append(tau=12, lat=16.0, lon=-131.0, vmax=70)
+    return fcst
+
+
+def test_record_json():
+    record = record_json(forecast('2024091006'), 'dc_jmaadv', priority=1)
+    assert {key: record[key] for key in ('source', 'atcfid', 'cynum', 'dtg', 'tech', 'priority')} == \
+        {'source': 'dc_jmaadv', 'atcfid': 'WP052024', 'cynum': 5, 'dtg': '2024091006', 'tech': 'RJTD', 'priority': 1}
+    first, second = record['track']
+    assert (first['tau'], first['lat'], first['lon'], first['vmax']) == (0, 15.2, -130.4, 65)
+    assert first['mslp'] is None and first['radii'] == {'34': [100, 90, 80, 100]}
+    assert second['radii'] == {}
+
+
+def test_sink_file_rotates(tmp_path):
+    path = str(tmp_path / 'forecasts.ndjson')
+    sink = NdjsonSink(path, max_bytes=200, backups=2, flush_records=1)
+    for n in range(8):
+        sink.write({'n': n, 'pad': 'x' * 80})  # Two records to a file
+    sink.close()
+    assert sink.written == 8
+    kept = [json.loads(line)['n'] for name in (path + '.2', path + '.1', path) for line in open(name)]
+    assert kept == [2, 3, 4, 5, 6, 7] and not os.path.exists(path + '.3')  # The oldest file was dropped
+
+
+def test_coordinator_sends_only_records_to_stdout(tmp_path):
+    address = str(tmp_path / 'writer.sock')
+    env = {k: v for k, v in os.environ.items() if k not in ATCF_ENV}
+    env['ATCF_NDJSON'] = '-'
+    cmd = [sys.executable, os.path.join(ROOT, 'atcf_coordinator.py'), '-socket', address]
+    writer = subprocess.Popen(cmd + ['-window', '0.1'], cwd=str(tmp_path), env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        for _ in range(100):
+            if os.path.exists(address):
+                break
+            time.sleep(0.05)
+        atfile = str(tmp_path / 'AWP052024.dat')
+        fcsts = [forecast('2024091000'), forecast('2024091006')]
+        send_messages(address, [(atfile, f.tech, f.DTG, forecast_lines(f), f, 'dc_jmaadv') for f in fcsts])
+        subprocess.run(cmd + ['-stop'], cwd=str(tmp_path), env=env, stdout=subprocess.DEVNULL, check=True)
+        out, err = writer.communicate(timeout=30)
+    finally:
+        if writer.poll() is None:
+            writer.kill()
+    assert writer.returncode == 0, err
+    assert [(record['source'], record['dtg']) for record in map(json.loads, out.splitlines())] == \
+        [('dc_jmaadv', '2024091000'), ('dc_jmaadv', '2024091006')]
+    assert 'Writer coordinator: 2 forecasts received' in err
+    assert open(atfile).readlines() == forecast_lines(fcsts[0]) + forecast_lines(fcsts[1])
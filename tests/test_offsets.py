@@ -0,0 +1,62 @@
+import os
+from atcf_writer import update_adeck
+from atcf_index import ForecastIndex
+from atcf_offsets import OFFSET_SUFFIX, OffsetIndex, offsets_current, read_recent_lines, read_recent_records
+
+
+def adeck_line(dtg, tau, tech='RJTD'):
+    return f"WP, 05, {dtg}, 01, {tech}, {tau:3d}, 152N, 1304E,  65\n"
+
+
+def test_recent_cycles_and_since():
+    lines = [adeck_line(dtg, tau, tech) for dtg in ('2024091000', '2024091006', '2024091012')
+             for tech in ('JTWC', 'RJTD') for tau in (0, 12)]
+    update_adeck('AWP052024.dat', lines)
+    index = OffsetIndex('AWP052024.dat')
+    assert index.dtgs() == ['2024091000', '2024091006', '2024091012'] and len(index) == 3
+    assert list(read_recent_lines('AWP052024.dat', cycles=1)) == lines[8:]
+    assert list(read_recent_lines('AWP052024.dat', cycles=5)) == lines
+    assert list(read_recent_lines('AWP052024.dat', cycles=0)) == []
+    assert list(read_recent_lines('AWP052024.dat', since='2024091006', tech_filter='RJTD')) == \
+        lines[6:8] + lines[10:]
+    assert list(read_recent_lines('AWP052024.dat', since='2024091100')) == []
+    assert list(read_recent_lines('AWP052024.dat')) == lines
+    assert [fcst.DTG for fcst in read_recent_records('AWP052024.dat', cycles=2, tech_filter='JTWC')] == \
+        ['2024091006', '2024091012']
+
+
+def test_a_stale_sidecar_is_rebuilt():
+    update_adeck('AWP052024.dat', [adeck_line('2024091000', 0)])
+    OffsetIndex('AWP052024.dat')
+    with open('AWP052024.dat', 'a') as f:  # Written behind update_adeck's back
+        f.write(adeck_line('2024091006', 0))
+    assert not offsets_current('AWP052024.dat')
+    assert list(read_recent_lines('AWP052024.dat', cycles=1)) == [adeck_line('2024091006', 0)]
+    assert offsets_current('AWP052024.dat')
+    with open('AWP052024.dat' + OFFSET_SUFFIX) as f:
+        assert f.read().splitlines()[1:] == ['2024091000 0', f"2024091006 {len(adeck_line('2024091000', 0))}"]
+
+
+def test_writes_keep_the_sidecar_indexes_current():
+    update_adeck('AWP052024.dat', [adeck_line('2024091012', 0)])
+    OffsetIndex('AWP052024.dat')
+    update_adeck('AWP052024.dat', [adeck_line('2024091018', 0)])
+    assert offsets_current('AWP052024.dat')  # An append extends the offset index
+    update_adeck('AWP052024.dat', [adeck_line('2024091000', 0)])
+    assert list(read_recent_lines('AWP052024.dat', cycles=2)) == \
+        [adeck_line('2024091012', 0), adeck_line('2024091018', 0)]
+    index = ForecastIndex('AWP052024.dat')
+    assert index.contains('RJTD', '2024091000') and index.contains('RJTD', '2024091018')
+
+
+def test_archived_adecks_are_read_from_their_stream(monkeypatch, tmp_path):
+    monkeypatch.setenv('ATCF_ARCHIVE', str(tmp_path / 'archive'))
+    lines = [adeck_line(dtg, tau) for dtg in ('2024091000', '2024091006', '2024091012') for tau in (0, 12)]
+    update_adeck('AWP052024.dat', lines[2:])
+    update_adeck('AWP052024.dat', lines[:2])  # Out of order, so the stream is rewritten
+    assert not os.path.exists('AWP052024.dat') and not os.path.exists('AWP052024.dat' + OFFSET_SUFFIX)
+    assert OffsetIndex('AWP052024.dat').dtgs() == ['2024091000', '2024091006', '2024091012']
+    assert list(read_recent_lines('AWP052024.dat', cycles=1)) == lines[4:]
+    assert list(read_recent_lines('AWP052024.dat', since='2024091006')) == lines[2:]
+    assert list(read_recent_lines('AWP052024.dat')) == lines
+    assert list(read_recent_lines('AWP062024.dat')) == []
@@ -0,0 +1,86 @@
+import os
+from atcf_writer import update_adeck
+from atcf_publish import WHOLE, APPEND, PATCH, publish_directory, write_records, read_records, apply_records
+
+
+def adeck_line(dtg, tau, tech='RJTD'):
+    return f"WP, 05, {dtg}, 01, {tech}, {tau:3d}, 152N, 1304E,  65\n"
+
+
+def publish(source, statedir, delta):
+    """Publish the changes of source to the delta file, returning the ops"""
+    records, state = publish_directory(source, statedir)
+    write_records(records, delta)
+    state.save()
+    return [record['op'] for record in records]
+
+
+def same_files(source, mirror, name):
+    with open(os.path.join(source, name), 'rb') as a, open(os.path.join(mirror, name), 'rb') as b:
+        return a.read() == b.read()
+
+
+def test_publish_apply_round_trip(tmp_path):
+    source, mirror, statedir = str(tmp_path / 'atcf'), str(tmp_path / 'mirror'), str(tmp_path / 'state')
+    os.makedirs(source)
+    os.makedirs(statedir)
+    adeck = os.path.join(source, 'AWP052024.jma')
+    delta = str(tmp_path / 'delta.ndjson')
+
+    update_adeck(adeck, [adeck_line('2024091006', tau) for tau in (0, 12, 24)])
+    assert publish(source, statedir, delta) == [WHOLE]
+    assert apply_records(read_records(delta), mirror) == 1
+    assert same_files(source, mirror, 'AWP052024.jma')
+
+    update_adeck(adeck, [adeck_line('2024091012', tau) for tau in (0, 12)])
+    assert publish(source, statedir, delta) == [APPEND]
+    assert apply_records(read_records(delta), mirror) == 1
+    assert same_files(source, mirror, 'AWP052024.jma')
+
+    # An out of order forecast rewrites the A-deck, published as a patch of the lines around it
+    update_adeck(adeck, [adeck_line('2024091000', 0, 'JTWC')])
+    assert publish(source, statedir, delta) == [PATCH]
+    assert apply_records(read_records(delta), mirror) == 1
+    assert same_files(source, mirror, 'AWP052024.jma')
+
+    assert publish(source, statedir, delta) == []  # Nothing changed since
+
+
+def test_apply_refuses_a_record_for_another_copy(tmp_path):
+    source, mirror, statedir = str(tmp_path / 'atcf'), str(tmp_path / 'mirror'), str(tmp_path / 'state')
+    os.makedirs(source)
+    os.makedirs(statedir)
+    adeck = os.path.join(source, 'AWP052024.jma')
+    delta = str(tmp_path / 'delta.ndjson')
+    update_adeck(adeck, [adeck_line('2024091006', 0)])
+    publish(source, statedir, delta)
+    apply_records(read_records(delta), mirror)
+    with open(os.path.join(mirror, 'AWP052024.jma'), 'a') as f:
+        f.write(adeck_line('2024091006', 6, 'XXXX'))  # The mirror drifted
+    update_adeck(adeck, [adeck_line('2024091012', 0)])
+    os.remove(delta)  # Applied, so only the new publish is in it
+    publish(source, statedir, delta)
+    assert apply_records(read_records(delta), mirror) == 0
+
+
+def test_publishes_the_mirror_has_not_applied_are_kept(tmp_path):
+    source, mirror, statedir = str(tmp_path / 'atcf'), str(tmp_path / 'mirror'), str(tmp_path / 'state')
+    os.makedirs(source)
+    os.makedirs(statedir)
+    adeck = os.path.join(source, 'AWP052024.jma')
+    delta = str(tmp_path / 'delta.ndjson')
+    update_adeck(adeck, [adeck_line('2024091006', 0)])
+    assert publish(source, statedir, delta) == [WHOLE]
+    update_adeck(adeck, [adeck_line('2024091012', 0)])
+    assert publish(source, statedir, delta) == [APPEND]
+    update_adeck(adeck, [adeck_line('2024091000', 0)])
+    assert publish(source, statedir, delta) == [PATCH]
+    assert len(read_records(delta)) == 3
+    assert apply_records(read_records(delta), mirror) == 3
+    assert same_files(source, mirror, 'AWP052024.jma')
+    # Applying the file again, or after one more publish, skips what the mirror has
+    assert apply_records(read_records(delta), mirror) == 0
+    update_adeck(adeck, [adeck_line('2024091018', 0)])
+    assert publish(source, statedir, delta) == [APPEND]
+    assert apply_records(read_records(delta), mirror) == 1
+    assert same_files(source, mirror, 'AWP052024.jma')
@@ -0,0 +1,49 @@
+from atcf_reader import read_atcf_lines, read_atcf_records, line_matches, parse_latlon
+from atcf_time import dtg_to_hours
+
+ADECK = (
+    "WP, 05, 2024091000, 01, RJTD,   0, 152N, 1304E,  65,  975, TY,  34, NEQ,  100,   90,   80,  100,\n"
+    "WP, 05, 2024091000, 01, RJTD,   0, 152N, 1304E,  65,  975, TY,  50, NEQ,   40,   30,   30,   40,\n"
+    "WP, 05, 2024091000, 01, RJTD,  12, 161N, 1289E,  70,  970, TY,  34, NEQ,  110,  100,   90,  110,\n"
+    "WP, 05, 2024091000, 03, JTWC,   0, 153N, 1303E,  70,    ,   ,\n"
+    "WP, 05, 2024091006, 01, RJTD,   0, 155S, 0010W,  70,  970, TY,  34, NEQ,  100,   90,   80,  100,"
+    "     ,     ,  15, , , , , , , , YAGI\n"
+    "CP, 01, 2024091006, 01, RJTD,   0, 155N, 1790W,  30, 1000,\n"
+)
+
+
+def write_adeck():
+    with open('AWP052024.dat', 'w') as f:
+        f.write(ADECK)
+
+
+def test_tech_and_basin_pushdown():
+    assert line_matches("WP, 05, 2024091000, 01, RJTD,   0,", 'RJTD')
+    assert not line_matches("WP, 05, 2024091000, 01, XRJTD,   0,", 'RJTD')  # Substring, not the column
+    assert not line_matches("ZZ, 05, 2024091000, 01, RJTD,   0,", 'RJTD')
+    write_adeck()
+    assert len(list(read_atcf_lines('AWP052024.dat'))) == 6
+    assert len(list(read_atcf_lines('AWP052024.dat', 'JTWC'))) == 1
+    assert len(list(read_atcf_lines('AWP052024.dat', 'RJTD', basins=('WP',)))) == 4
+
+
+def test_records_group_the_lines_of_a_forecast():
+    write_adeck()
+    fcsts = list(read_atcf_records('AWP052024.dat', 'RJTD', basins=('WP',)))
+    assert [(f.DTG, f.tech, len(f.track)) for f in fcsts] == [('2024091000', 'RJTD', 2), ('2024091006', 'RJTD', 1)]
+    first = fcsts[0]
+    assert first.jdnow == dtg_to_hours('2024091000')
+    assert first.track.tau.tolist() == [0, 12]
+    assert first.track.radii[0, :2].tolist() == [[100, 90, 80, 100], [40, 30, 30, 40]]
+    assert (first.track.vmax.tolist(), first.track.mslp.tolist()) == ([65, 70], [975, 970])
+    last = fcsts[1]
+    assert (last.track.lat[0], last.track.lon[0], last.track.mrd[0], last.stormname) == (-15.5, -1.0, 15, 'YAGI')
+    jtwc = next(read_atcf_records('AWP052024.dat', 'JTWC'))
+    assert (jtwc.technum, jtwc.track.mslp[0], jtwc.track.ty[0]) == (3, -999, '  ')
+
+
+def test_offset_skips_the_start_of_the_file():
+    write_adeck()
+    offset = ADECK.index("WP, 05, 2024091006")
+    assert [f.DTG for f in read_atcf_records('AWP052024.dat', offset=offset)] == ['2024091006', '2024091006']
+    assert parse_latlon('1790W') == -179.0 and parse_latlon('15.5N') == 15.5 and parse_latlon('') == -999.0
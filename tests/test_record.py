@@ -0,0 +1,33 @@
+import numpy as np
+from atcf_record import ForecastRecord, TrackPoint, TrackArray, MISSING
+
+
+def test_track_array_append_and_columns():
+    track = TrackArray()
+    for tau in range(20):  # Past the initial capacity
+        track.append(TrackPoint(tau=tau, lat=10.0 + tau, lon=-60.0, vmax=50))
+    row = track.append(tau=20, lat=30.0, radii=[[90, 80, 70, 60], [0, 0, 0, 0], [0, 0, 0, 0]])
+    assert len(track) == 21
+    assert track['tau'].tolist() == list(range(21))
+    assert row.vmax == MISSING and track.lat[-1] == 30.0
+    assert track.radii[-1, 0].tolist() == [90, 80, 70, 60] and not track.radii[:-1].any()
+    assert len(track[track.lat > 25]) == 5
+    track.lat[0] = 9.5  # Column views write to the track
+    assert track[0].lat == 9.5
+
+
+def test_at_tau_keeps_the_points_in_tau_order():
+    track = TrackArray.from_columns(tau=[0, 24], lat=[15.0, 17.0], lon=[130.0, 128.0])
+    track.at_tau(12).vmax = 70
+    assert track.tau.tolist() == [0, 12, 24]
+    assert track.vmax.tolist() == [MISSING, 70, MISSING] and track.lat[1] == -999.0
+    assert track.at_tau(24).lat == 17.0 and len(track) == 3
+
+
+def test_forecast_record_shares_its_codes():
+    a = ForecastRecord(basin='WP', cyNum=5, DTG='2024091000', tech=''.join(['RJ', 'TD']))
+    b = ForecastRecord(basin='WP', cyNum=5, DTG='2024091006', tech='RJTD')
+    assert a.tech is b.tech and a.basin is b.basin
+    assert isinstance(a.track, TrackArray) and len(a.track) == 0
+    c = ForecastRecord(track=[TrackPoint(tau=0, lat=15.0, lon=130.0)])
+    assert c.track.data.dtype == a.track.data.dtype and np.array_equal(c.track.lon, [130.0])
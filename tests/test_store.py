@@ -0,0 +1,49 @@
+from atcf_record import ForecastRecord
+from atcf_store import StormStore, storm_id
+
+
+def forecast(dtg, tech='RJTD', technum=1, taus=(0,)):
+    fcst = ForecastRecord(basin='WP', cyNum=5, DTG=dtg, technum=technum, tech=tech, stormname='YAGI')
+    for tau in taus:
+        fcst.track.append(tau=tau, lat=15.2, lon=130.4, vmax=65, mslp=975, radii=[[0] * 4] * 3)
+    return fcst
+
+
+def test_records_are_kept_in_order():
+    store = StormStore()
+    for dtg, tech, technum in (('2024091006', 'RJTD', 1), ('2024091000', 'RJTD', 1),
+                               ('2024091006', 'JTWC', 1), ('2024091000', 'AVNO', 0)):
+        store.add('WP052024', forecast(dtg, tech, technum))
+    assert [(f.DTG, f.tech) for f in store.forecasts('WP052024')] == \
+        [('2024091000', 'AVNO'), ('2024091000', 'RJTD'), ('2024091006', 'JTWC'), ('2024091006', 'RJTD')]
+    assert store.add('WP052024', forecast('2024091000', taus=(24, 0, 12))) == 2  # After the one it matches
+    assert store.forecasts('WP052024')[2].track.tau.tolist() == [0, 12, 24]
+    assert store.count('WP052024') == 5
+
+
+def test_replace_takes_the_place_of_the_same_forecast():
+    store = StormStore()
+    store.add('WP052024', forecast('2024091000'))
+    store.add('WP052024', forecast('2024091006'))
+    rerun = forecast('2024091000', taus=(0, 12))
+    assert store.add('WP052024', rerun, replace=True) == 0
+    assert store.count('WP052024') == 2 and store.forecasts('WP052024')[0] is rerun
+
+
+def test_query_count_and_remove():
+    store = StormStore()
+    for dtg in ('2024091000', '2024091006', '2024091012', '2024091018'):
+        store.add('WP052024', forecast(dtg))
+        store.add('WP052024', forecast(dtg, 'JTWC'))
+    store.add_carq('WP062024', forecast('2024091000', 'CARQ', 0))
+    assert [f.DTG for f in store.query('WP052024', '2024091006', '2024091012', tech='RJTD')] == \
+        ['2024091006', '2024091012']
+    assert len(list(store.query('WP052024', start='2024091012'))) == 4
+    assert list(store.query('WP072024')) == []
+    assert store.atcfids() == ['WP052024', 'WP062024']
+    assert store.count('WP062024') == 0 and len(store.carqs('WP062024')) == 1
+    assert len(store) == 9
+    store.remove('WP052024')
+    assert 'WP052024' not in store and 'WP062024' in store
+    store.clear()
+    assert len(store) == 0 and storm_id('/data/AWP052024.dat') == 'WP052024'
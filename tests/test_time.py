@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from atcf_time import (dtg_hours, dtg_to_hours, hours_to_dtg, hours_to_parts, dtgs_to_hours, hours_to_dtgs,
+                       month_days, previous_month)
+
+
+def test_dtg_hours_round_trip():
+    for dtg in ('1900010100', '2024022918', '2024123118', '2025010100', '2199123123'):
+        hours = dtg_to_hours(dtg)
+        assert hours == dtg_hours(int(dtg[:4]), int(dtg[4:6]), int(dtg[6:8]), int(dtg[8:]))
+        assert hours_to_dtg(hours) == dtg
+        assert hours_to_parts(hours) == (int(dtg[:4]), int(dtg[4:6]), int(dtg[6:8]), int(dtg[8:]))
+    assert dtg_hours(2025, 1, 1, 0) - dtg_hours(2024, 12, 31, 18) == 6
+    dtgs = ['2024090100', '2024090112', '2024022918']
+    assert hours_to_dtgs(dtgs_to_hours(dtgs)).tolist() == dtgs
+    assert np.array_equal(dtgs_to_hours(dtgs), [dtg_to_hours(dtg) for dtg in dtgs])
+
+
+@pytest.mark.parametrize('date', [(2025, 0, 15), (2025, 13, 1), (2025, 2, 29), (2024, 2, 30), (2024, 4, 31),
+                                  (2024, 9, 0), (1899, 12, 31), (2200, 1, 1)])
+def test_dtg_hours_rejects_dates_that_do_not_exist(date):
+    with pytest.raises(ValueError):
+        dtg_hours(*date, 0)
+
+
+def test_month_days_and_previous_month():
+    assert [month_days(2024, mm) for mm in range(1, 13)] == [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+    assert month_days(2100, 2) == 28 and month_days(2000, 2) == 29
+    assert previous_month(2025, 1) == (2024, 12)
+    assert previous_month(2025, 3) == (2025, 2)
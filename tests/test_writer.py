@@ -0,0 +1,66 @@
+from atcf_record import ForecastRecord
+from atcf_writer import APPEND, MERGE, update_adeck, forecast_lines, line_key
+from atcf_index import ForecastIndex
+from atcf_coordinator import write_forecast
+
+
+def adeck_line(dtg, tau, tech='RJTD'):
+    return f"WP, 05, {dtg}, 01, {tech}, {tau:3d}, 152N, 1304E,  65\n"
+
+
+def read(path):
+    with open(path) as f:
+        return f.readlines()
+
+
+def test_replace_rewrites_only_the_same_forecasts():
+    rjtd = [adeck_line('2024091000', tau) for tau in (0, 12)]
+    jtwc = [adeck_line('2024091000', tau, 'JTWC') for tau in (0, 12)]
+    later = [adeck_line('2024091006', 0)]
+    update_adeck('AWP052024.dat', rjtd + jtwc + later)
+    rerun = [adeck_line('2024091000', tau) for tau in (0, 12, 24)]
+    assert update_adeck('AWP052024.dat', rerun, replace=True) == MERGE
+    assert read('AWP052024.dat') == jtwc + rerun + later
+    assert update_adeck('AWP052024.dat', [adeck_line('2024091012', 0)], replace=True) == APPEND
+    assert update_adeck('AWP052024.dat', [adeck_line('2024091012', 0)], replace=True) == MERGE
+    assert read('AWP052024.dat') == jtwc + rerun + later + [adeck_line('2024091012', 0)]
+
+
+def test_update_adeck_appends_in_order_lines():
+    first = [adeck_line('2024091000', tau) for tau in (0, 12)]
+    second = [adeck_line('2024091006', tau) for tau in (0, 12)]
+    assert update_adeck('AWP052024.dat', first) == APPEND
+    assert update_adeck('AWP052024.dat', second) == APPEND
+    assert update_adeck('AWP052024.dat', []) is None
+    assert read('AWP052024.dat') == first + second
+
+
+def test_update_adeck_merges_out_of_order_lines():
+    late = [adeck_line('2024091012', tau) for tau in (0, 12)]
+    early = [adeck_line('2024091000', tau, 'JTWC') for tau in (0, 12)]
+    middle = [adeck_line('2024091006', 0)]
+    update_adeck('AWP052024.dat', late)
+    assert update_adeck('AWP052024.dat', early) == MERGE
+    assert update_adeck('AWP052024.dat', middle) == MERGE
+    lines = read('AWP052024.dat')
+    assert lines == early + middle + late
+    assert [line_key(line) for line in lines] == sorted(line_key(line) for line in lines)
+
+
+def test_append_keeps_off_an_unterminated_last_line():
+    with open('AWP052024.dat', 'w') as f:
+        f.write(adeck_line('2024091000', 0).rstrip('\n'))
+    assert update_adeck('AWP052024.dat', [adeck_line('2024091006', 0)]) == APPEND
+    assert read('AWP052024.dat') == [adeck_line('2024091000', 0), adeck_line('2024091006', 0)]
+
+
+def test_write_forecast_appends_and_indexes_the_forecast():
+    fcst = ForecastRecord(basin='WP', cyNum=5, DTG='2024091006', technum=1, tech='RJTD', stormname='YAGI')
+    fcst.track.append(tau=0, lat=15.2, lon=130.4, vmax=65, mslp=975, radii=[[100, 90, 80, 100], [0] * 4, [0] * 4])
+    index = ForecastIndex('AWP052024.dat')
+    assert write_forecast('AWP052024.dat', fcst, index) == APPEND
+    assert read('AWP052024.dat') == forecast_lines(fcst)
+    assert ForecastIndex('AWP052024.dat').contains('RJTD', '2024091006')
+    fcst.DTG = '2024091000'
+    assert write_forecast('AWP052024.dat', fcst, index) == MERGE
+    assert [line_key(line) for line in read('AWP052024.dat')] == ['2024091000', '2024091006']